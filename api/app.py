@@ -1,10 +1,53 @@
-from typing import Union
-from fastapi import FastAPI, Query
+import asyncio
+from typing import Optional, Union
+
+import numpy as np
+from fastapi import FastAPI, Header, Query, Response
+from api.models.accumulated_debt_curve import (
+    AccumulatedDebtCurve,
+    AccumulatedDebtCurveRequest,
+)
+from api.models.accumulated_debt_history import (
+    AccumulatedDebtHistory,
+    HistoricalDebtPoint,
+)
 from api.models.accumulated_debt_point import AccumulatedDebtPoint
-from api.utils.curve_data_loader import load_curve_data
-from api.utils.curve_interpolator import interpoate_debt_curve
+from api.models.compacted_debt_curve import CompactedDebtCurve
+from api.utils.curve_export import (
+    ENCODINGS,
+    etag_matches,
+    get_curve_etag,
+    to_compacted_curve,
+)
+from api.utils.curve_interpolator import (
+    interpolate_debt_curve,
+    interpolate_debt_curve_batch,
+)
+from api.utils.curve_store import COMPACT_CURVES_PATH, CurveStore
+from api.utils.history_lookup import debt_at_snapshot, debt_history
+from src.curve_history import CurveHistory
+
+MAX_HISTORY_SNAPSHOTS = 10_000
 
 app = FastAPI()
+curve_store = CurveStore()
+compact_curve_store = CurveStore(COMPACT_CURVES_PATH)
+
+
+@app.on_event("startup")
+async def load_curves():
+    app.state.curve_watchers = []
+    for store in (curve_store, compact_curve_store):
+        store.refresh()
+        app.state.curve_watchers.append(asyncio.create_task(store.watch()))
+    app.state.curve_history = CurveHistory()
+
+
+@app.on_event("shutdown")
+async def stop_curve_watcher():
+    for watcher in app.state.curve_watchers:
+        watcher.cancel()
+    app.state.curve_history.close()
 
 
 @app.get("/")
@@ -16,11 +59,89 @@ async def root():
 async def getAccumulatedDebt(
     asset: str,
     priceDescent: int = Query(ge=0, le=1e18),
+    interpolate: bool = False,
 ) -> Union[AccumulatedDebtPoint, dict]:
     price_descent_interpreted = priceDescent / 1e18
 
-    curve_data = load_curve_data(asset)
+    curve_data = curve_store.get(asset)
     if curve_data is None:
         return {"error": f"Curve data for {asset} not found"}
+    if len(curve_data) == 0:
+        return {"error": f"Curve data for {asset} has no points"}
+
+    return interpolate_debt_curve(curve_data, price_descent_interpreted, interpolate)
+
+
+@app.post("/getAccumulatedDebtBatch")
+async def getAccumulatedDebtBatch(
+    request: AccumulatedDebtCurveRequest,
+) -> Union[AccumulatedDebtCurve, dict]:
+    curve_data = curve_store.get(request.asset)
+    if curve_data is None:
+        return {"error": f"Curve data for {request.asset} not found"}
+    if len(curve_data) == 0:
+        return {"error": f"Curve data for {request.asset} has no points"}
+
+    if request.grid is not None:
+        grid = request.grid
+        price_descents = [
+            int(p) for p in np.linspace(grid.start, grid.stop, grid.num).tolist()
+        ]
+    else:
+        price_descents = request.priceDescents
+
+    return interpolate_debt_curve_batch(curve_data, price_descents, request.interpolate)
+
+
+@app.get("/getCompactedCurve")
+async def getCompactedCurve(
+    asset: str,
+    response: Response,
+    encoding: str = Query("absolute", regex=f"^({'|'.join(ENCODINGS)})$"),
+    if_none_match: Optional[str] = Header(None),
+) -> Union[CompactedDebtCurve, Response, dict]:
+    curve_data = compact_curve_store.get(asset)
+    if curve_data is None:
+        return {"error": f"Compacted curve data for {asset} not found"}
+
+    etag = get_curve_etag(curve_data, encoding)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return to_compacted_curve(asset, curve_data, encoding)
+
+
+@app.get("/getAccumulatedDebtAt")
+async def getAccumulatedDebtAt(
+    asset: str,
+    priceDescent: int = Query(ge=0, le=1e18),
+    block: Optional[int] = None,
+    timestamp: Optional[int] = None,
+) -> Union[HistoricalDebtPoint, dict]:
+    snapshot = app.state.curve_history.at(asset, block, timestamp)
+    if snapshot is None:
+        return {"error": f"No curve history for {asset} at that point"}
+    if snapshot.data.shape[1] == 0:
+        return {"error": f"Curve history for {asset} at that point has no points"}
+
+    return debt_at_snapshot(snapshot, priceDescent / 1e18)
+
+
+@app.get("/getAccumulatedDebtHistory")
+async def getAccumulatedDebtHistory(
+    asset: str,
+    start: int,
+    end: int,
+    priceDescent: int = Query(ge=0, le=1e18),
+) -> Union[AccumulatedDebtHistory, dict]:
+    history = app.state.curve_history
+    snapshots = history.range(asset, start, end, MAX_HISTORY_SNAPSHOTS + 1)
+    if len(snapshots) == 0 and history.at(asset) is None:
+        return {"error": f"No curve history for {asset}"}
 
-    return interpoate_debt_curve(curve_data, price_descent_interpreted)
+    # Past the limit, the client resumes from the first snapshot left out
+    next_start = None
+    if len(snapshots) > MAX_HISTORY_SNAPSHOTS:
+        next_start = snapshots[MAX_HISTORY_SNAPSHOTS].timestamp
+        snapshots = snapshots[:MAX_HISTORY_SNAPSHOTS]
+    return debt_history(snapshots, priceDescent, next_start)
@@ -0,0 +1,68 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field, conint, root_validator
+
+WeiFraction = conint(ge=0, le=10**18)
+
+
+class PriceDescentGrid(BaseModel):
+    start: WeiFraction
+    stop: WeiFraction
+    num: conint(ge=1, le=100_000)
+
+
+class AccumulatedDebtCurveRequest(BaseModel):
+    asset: str
+    priceDescents: Optional[List[WeiFraction]] = Field(None, max_items=100_000)
+    grid: Optional[PriceDescentGrid] = None
+    interpolate: bool = False
+
+    @root_validator
+    def check_query(cls, values):
+        if (values.get("priceDescents") is None) == (values.get("grid") is None):
+            raise ValueError("Exactly one of priceDescents or grid must be given")
+        return values
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "asset": "eth",
+                "grid": {"start": 0, "stop": 500000000000000000, "num": 3},
+                "interpolate": True,
+            }
+        }
+
+
+class AccumulatedDebtCurve(BaseModel):
+    priceDescents: List[str]
+    accumulatedLiquidations: List[str]
+    unit: str
+    slippages: List[str]
+    equilibriumPrices: Optional[List[str]] = None
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "priceDescents": [
+                    "0",
+                    "250000000000000000",
+                    "500000000000000000",
+                ],
+                "accumulatedLiquidations": [
+                    "22876800000000000000",
+                    "1164081429615000011407360",
+                    "128701287160199996204122112",
+                ],
+                "unit": "USD",
+                "slippages": [
+                    "1000000000000000000",
+                    "999300000000000000",
+                    "930400000000000000",
+                ],
+                "equilibriumPrices": [
+                    "999980000000000000",
+                    "748240000000000000",
+                    "465190000000000000",
+                ],
+            }
+        }
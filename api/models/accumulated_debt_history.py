@@ -0,0 +1,42 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from api.models.accumulated_debt_point import AccumulatedDebtPoint
+
+
+class HistoricalDebtPoint(AccumulatedDebtPoint):
+    block: Optional[int]
+    timestamp: int
+
+
+class AccumulatedDebtHistory(BaseModel):
+    priceDescent: str
+    blocks: List[Optional[int]]
+    timestamps: List[int]
+    accumulatedLiquidations: List[str]
+    unit: str
+    slippages: List[str]
+    equilibriumPrices: Optional[List[str]] = None
+    # Whether snapshots were left out to keep the response bounded, and the
+    # `start` to request them with
+    truncated: bool = False
+    nextStart: Optional[int] = None
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "priceDescent": "250000000000000000",
+                "blocks": [15700000, 15700300],
+                "timestamps": [1665400000, 1665403600],
+                "accumulatedLiquidations": [
+                    "1164081429615000011407360",
+                    "1170219300528000006553600",
+                ],
+                "unit": "USD",
+                "slippages": ["999300000000000000", "999296000000000000"],
+                "equilibriumPrices": ["748240000000000000", "748170000000000000"],
+                "truncated": False,
+                "nextStart": None,
+            }
+        }
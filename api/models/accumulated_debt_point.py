@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseModel
 
 
@@ -5,6 +7,8 @@ class AccumulatedDebtPoint(BaseModel):
     accumulatedLiquidations: str
     unit: str
     slippage: str
+    # Price after the liquidations cascade, as a fraction of the pre-shock one
+    equilibriumPrice: Optional[str] = None
 
     class Config:
         schema_extra = {
@@ -12,5 +16,6 @@ class AccumulatedDebtPoint(BaseModel):
                 "accumulatedLiquidations": "15023432475928445910365",
                 "unit": "USD",
                 "slippage": "230194665941057366",
+                "equilibriumPrice": "512350000000000000",
             }
         }
@@ -0,0 +1,39 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class CompactedDebtCurve(BaseModel):
+    asset: str
+    # "delta": every value but the first is the difference from the previous
+    encoding: str
+    priceDescents: List[str]
+    accumulatedLiquidations: List[str]
+    unit: str
+    slippages: List[str]
+    equilibriumPrices: Optional[List[str]] = None
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "asset": "eth",
+                "encoding": "absolute",
+                "priceDescents": ["0", "250000000000000000", "1000000000000000000"],
+                "accumulatedLiquidations": [
+                    "22876800000000000000",
+                    "1164081429615000011407360",
+                    "12872935000000000000000000000",
+                ],
+                "unit": "USD",
+                "slippages": [
+                    "1000000000000000000",
+                    "999300000000000000",
+                    "992576000000000000",
+                ],
+                "equilibriumPrices": [
+                    "999980000000000000",
+                    "748240000000000000",
+                    "0",
+                ],
+            }
+        }
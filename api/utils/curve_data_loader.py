@@ -1,12 +1,69 @@
 import json
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional
 
+import numpy as np
 
-def load_curve_data(asset: str) -> Optional[dict]:
-    data_path = Path(f"data/cached_curves/{asset.lower()}.json")
+from src.curve_artifact import CurveArtifact
+from src.paths import DATA_DIR
+
+
+@dataclass(frozen=True)
+class CurveData:
+    price_change: np.ndarray
+    total_liquidation: np.ndarray
+    liquidation_slippage: np.ndarray
+    mtime_ns: int
+    # Post-cascade price at each price change, when the curve has it
+    equilibrium_price: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.price_change)
+
+
+def parse_curve_file(data_path: Path) -> CurveData:
+    mtime_ns = data_path.stat().st_mtime_ns
+    with data_path.open("r") as f:
+        records = json.load(f)
+    price_change = np.array([r["price_change"] for r in records], dtype=np.float64)
+    order = np.argsort(price_change, kind="stable")
+    return CurveData(
+        price_change=price_change[order],
+        total_liquidation=np.array(
+            [r["total_liquidation"] for r in records], dtype=np.float64
+        )[order],
+        liquidation_slippage=np.array(
+            [r["liquidation_slippage"] for r in records], dtype=np.float64
+        )[order],
+        mtime_ns=mtime_ns,
+    )
+
+
+def load_curve_data(asset: str) -> Optional[CurveData]:
+    data_path = DATA_DIR / "cached_curves" / f"{asset.lower()}.json"
     if not data_path.exists():
         return None
-    with data_path.open("r") as f:
-        data = json.load(f)
-    return data
+    return parse_curve_file(data_path)
+
+
+def load_curve_artifact(artifact_path: Path) -> Dict[str, CurveData]:
+    """Every curve of a binary artifact, as views on its memory map."""
+    mtime_ns = artifact_path.stat().st_mtime_ns
+    artifact = CurveArtifact(artifact_path)
+    columns = {column: i for i, column in enumerate(artifact.columns)}
+    curves = {}
+    for asset in artifact.assets:
+        block = artifact.get(asset)
+        curves[asset] = CurveData(
+            price_change=block[columns["price_change"]],
+            total_liquidation=block[columns["total_liquidation"]],
+            liquidation_slippage=block[columns["liquidation_slippage"]],
+            mtime_ns=mtime_ns,
+            equilibrium_price=(
+                block[columns["equilibrium_price"]]
+                if "equilibrium_price" in columns
+                else None
+            ),
+        )
+    return curves
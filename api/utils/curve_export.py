@@ -0,0 +1,59 @@
+import hashlib
+from typing import List, Optional
+
+import numpy as np
+
+from api.models.compacted_debt_curve import CompactedDebtCurve
+from api.utils.curve_data_loader import CurveData
+
+ENCODINGS = ("absolute", "delta")
+
+
+def _to_wei(values: np.ndarray) -> List[int]:
+    return [int(v) for v in (values * 1e18).tolist()]
+
+
+def _encode(values: np.ndarray, encoding: str) -> List[str]:
+    wei = _to_wei(values)
+    if encoding == "delta":
+        # Differences of the integers, so a running sum restores them exactly
+        wei = wei[:1] + [b - a for a, b in zip(wei, wei[1:])]
+    return [str(v) for v in wei]
+
+
+def get_curve_etag(curve_data: CurveData, encoding: str) -> str:
+    digest = hashlib.blake2b(encoding.encode(), digest_size=16)
+    for column in (
+        curve_data.price_change,
+        curve_data.total_liquidation,
+        curve_data.liquidation_slippage,
+        curve_data.equilibrium_price,
+    ):
+        if column is not None:
+            digest.update(np.ascontiguousarray(column).tobytes())
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+def to_compacted_curve(
+    asset: str, curve_data: CurveData, encoding: str
+) -> CompactedDebtCurve:
+    return CompactedDebtCurve(
+        asset=asset.lower(),
+        encoding=encoding,
+        priceDescents=_encode(curve_data.price_change, encoding),
+        accumulatedLiquidations=_encode(curve_data.total_liquidation, encoding),
+        unit="USD",
+        slippages=_encode(curve_data.liquidation_slippage, encoding),
+        equilibriumPrices=(
+            _encode(curve_data.equilibrium_price, encoding)
+            if curve_data.equilibrium_price is not None
+            else None
+        ),
+    )
@@ -1,15 +1,73 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from api.models.accumulated_debt_curve import AccumulatedDebtCurve
 from api.models.accumulated_debt_point import AccumulatedDebtPoint
+from api.utils.curve_data_loader import CurveData
+
+
+def _to_wei_strings(values: np.ndarray) -> List[str]:
+    return [str(int(v)) for v in (values * 1e18).tolist()]
+
 
+def interpolate_debt_values(
+    curve_data: CurveData, price_descents: np.ndarray, linear: bool = False
+) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    """Evaluates the curve at every price descent in one vectorized pass.
 
-def interpoate_debt_curve(
-    curve_data: dict, price_descent: float
+    By default each descent maps to the first curve point at or past it. With
+    `linear` the values are interpolated between the surrounding points.
+    Descents past the last point saturate at the last point. The equilibrium
+    prices are None for curves without them.
+    """
+    columns = [curve_data.total_liquidation, curve_data.liquidation_slippage]
+    if curve_data.equilibrium_price is not None:
+        columns.append(curve_data.equilibrium_price)
+    if linear:
+        values = [
+            np.interp(price_descents, curve_data.price_change, column)
+            for column in columns
+        ]
+    else:
+        idx = np.searchsorted(curve_data.price_change, price_descents, side="left")
+        idx = np.minimum(idx, len(curve_data) - 1)
+        values = [column[idx] for column in columns]
+    return values[0], values[1], values[2] if len(values) > 2 else None
+
+
+def interpolate_debt_curve(
+    curve_data: CurveData, price_descent: float, linear: bool = False
 ) -> AccumulatedDebtPoint:
-    for data_point in curve_data:
-        if data_point["price_change"] >= price_descent:
-            total_liquidation = data_point["total_liquidation"]
-            slippage = data_point["liquidation_slippage"]
-            return AccumulatedDebtPoint(
-                accumulatedLiquidations=str(int(total_liquidation * 1e18)),
-                unit="USD",
-                slippage=str(int(slippage * 1e18)),
-            )
+    total_liquidation, slippage, equilibrium_price = interpolate_debt_values(
+        curve_data, np.array([price_descent]), linear
+    )
+    return AccumulatedDebtPoint(
+        accumulatedLiquidations=_to_wei_strings(total_liquidation)[0],
+        unit="USD",
+        slippage=_to_wei_strings(slippage)[0],
+        equilibriumPrice=(
+            _to_wei_strings(equilibrium_price)[0]
+            if equilibrium_price is not None
+            else None
+        ),
+    )
+
+
+def interpolate_debt_curve_batch(
+    curve_data: CurveData, price_descents: List[int], linear: bool = False
+) -> AccumulatedDebtCurve:
+    total_liquidation, slippage, equilibrium_price = interpolate_debt_values(
+        curve_data, np.asarray(price_descents, dtype=np.float64) / 1e18, linear
+    )
+    return AccumulatedDebtCurve(
+        priceDescents=[str(p) for p in price_descents],
+        accumulatedLiquidations=_to_wei_strings(total_liquidation),
+        unit="USD",
+        slippages=_to_wei_strings(slippage),
+        equilibriumPrices=(
+            _to_wei_strings(equilibrium_price)
+            if equilibrium_price is not None
+            else None
+        ),
+    )
@@ -0,0 +1,92 @@
+import asyncio
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from api.utils.curve_data_loader import (
+    CurveData,
+    load_curve_artifact,
+    parse_curve_file,
+)
+from src.curve_artifact import COMPACT_CURVE_ARTIFACT_PATH, CURVE_ARTIFACT_PATH
+
+CURVES_PATH = CURVE_ARTIFACT_PATH.parent
+COMPACT_CURVES_PATH = COMPACT_CURVE_ARTIFACT_PATH.parent
+POLL_INTERVAL = 5.0
+
+
+class CurveStore:
+    """Keeps every cached curve in memory so requests never parse files.
+
+    Curves come from the memory-mapped binary artifact, shared by every
+    worker process, plus any legacy `<asset>.json` file for assets it does
+    not have. Curves are (re)loaded by `refresh`, which only reopens files
+    that changed and then swaps the whole mapping in a single assignment, so
+    readers always see either the old or the new set of curves.
+    """
+
+    def __init__(
+        self, curves_path: Path = CURVES_PATH, poll_interval: float = POLL_INTERVAL
+    ):
+        self.curves_path = curves_path
+        self.poll_interval = poll_interval
+        self._curves: Dict[str, CurveData] = {}
+        self._artifact_curves: Dict[str, CurveData] = {}
+        self._artifact_key: Optional[Tuple[int, int, int]] = None
+
+    def get(self, asset: str) -> Optional[CurveData]:
+        return self._curves.get(asset.lower())
+
+    @property
+    def assets(self) -> list:
+        return sorted(self._curves)
+
+    def _refresh_artifact(self) -> bool:
+        artifact_path = self.curves_path / CURVE_ARTIFACT_PATH.name
+        try:
+            stat = artifact_path.stat()
+        except FileNotFoundError:
+            changed = self._artifact_key is not None
+            self._artifact_curves, self._artifact_key = {}, None
+            return changed
+        # A publish renames a new file into place, so the inode changes too
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if key == self._artifact_key:
+            return False
+        try:
+            self._artifact_curves = load_curve_artifact(artifact_path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Failed to load curve artifact {artifact_path}: {e}")
+            return False
+        self._artifact_key = key
+        return True
+
+    def refresh(self) -> bool:
+        current = self._curves
+        changed = self._refresh_artifact()
+        curves: Dict[str, CurveData] = dict(self._artifact_curves)
+        for data_path in sorted(self.curves_path.glob("*.json")):
+            asset = data_path.stem.lower()
+            if asset in curves:
+                continue
+            try:
+                mtime_ns = data_path.stat().st_mtime_ns
+                previous = current.get(asset)
+                if previous is not None and previous.mtime_ns == mtime_ns:
+                    curves[asset] = previous
+                    continue
+                curves[asset] = parse_curve_file(data_path)
+                changed = True
+            except (OSError, ValueError, KeyError) as e:
+                # Keep serving the last good version of a curve being rewritten
+                print(f"Failed to load curve {data_path}: {e}")
+                if asset in current:
+                    curves[asset] = current[asset]
+        changed = changed or curves.keys() != current.keys()
+        if changed:
+            self._curves = curves
+        return changed
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            await asyncio.to_thread(self.refresh)
@@ -0,0 +1,101 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from api.models.accumulated_debt_history import (
+    AccumulatedDebtHistory,
+    HistoricalDebtPoint,
+)
+from api.utils.curve_data_loader import CurveData
+from api.utils.curve_interpolator import _to_wei_strings, interpolate_debt_curve
+from src.curve_history import CurveSnapshot
+
+
+def to_curve_data(snapshot: CurveSnapshot) -> CurveData:
+    return CurveData(
+        price_change=snapshot.get("price_change"),
+        total_liquidation=snapshot.get("total_liquidation"),
+        liquidation_slippage=snapshot.get("liquidation_slippage"),
+        mtime_ns=snapshot.timestamp,
+        equilibrium_price=snapshot.get("equilibrium_price"),
+    )
+
+
+# Stored curves are compacted, so they are always interpolated linearly: a
+# step lookup, the default of /getAccumulatedDebt, would jump to the next kept
+# point, which can be far past the descent
+def debt_at_snapshot(
+    snapshot: CurveSnapshot, price_descent: float
+) -> HistoricalDebtPoint:
+    point = interpolate_debt_curve(to_curve_data(snapshot), price_descent, True)
+    return HistoricalDebtPoint(
+        **point.dict(), block=snapshot.block, timestamp=snapshot.timestamp
+    )
+
+
+def interpolate_snapshots(
+    snapshots: List[CurveSnapshot], price_descent: float
+) -> Dict[str, np.ndarray]:
+    """Every column of every snapshot, linearly interpolated at
+    `price_descent` like `np.interp`, in one pass over all their points.
+    Snapshots without points get NaN."""
+    lengths = np.array([s.data.shape[1] for s in snapshots])
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    names = [
+        column
+        for column in snapshots[0].columns
+        if all(column in s.columns for s in snapshots)
+    ]
+    if all(s.columns == snapshots[0].columns for s in snapshots):
+        data = np.concatenate([s.data for s in snapshots], axis=1)
+        columns = {column: data[snapshots[0].columns.index(column)] for column in names}
+    else:
+        columns = {
+            column: np.concatenate([s.get(column) for s in snapshots])
+            for column in names
+        }
+    x = columns.pop("price_change")
+    values = {column: np.full(len(snapshots), np.nan) for column in columns}
+    # Empty snapshots add no points, so the other starts still delimit their
+    # own segments for reduceat
+    filled = lengths > 0
+    if not filled.any():
+        return values
+    starts, ends = starts[filled], starts[filled] + lengths[filled] - 1
+    # First point of each snapshot past the descent
+    right = starts + np.add.reduceat(x <= price_descent, starts)
+    low, high = np.maximum(right - 1, starts), np.minimum(right, ends)
+    span = x[high] - x[low]
+    weight = np.divide(
+        price_descent - x[low], span, out=np.zeros(len(span)), where=span > 0
+    )
+    for column, y in columns.items():
+        values[column][filled] = y[low] + weight * (y[high] - y[low])
+    return values
+
+
+def debt_history(
+    snapshots: List[CurveSnapshot],
+    price_descent: int,
+    next_start: Optional[int] = None,
+) -> AccumulatedDebtHistory:
+    # A snapshot without points had nothing to liquidate and has no value to
+    # interpolate, so it is left out like the live endpoints refuse it
+    snapshots = [s for s in snapshots if s.data.shape[1] > 0]
+    values = interpolate_snapshots(snapshots, price_descent / 1e18) if snapshots else {}
+    empty = np.array([])
+    return AccumulatedDebtHistory(
+        priceDescent=str(price_descent),
+        blocks=[s.block for s in snapshots],
+        timestamps=[s.timestamp for s in snapshots],
+        accumulatedLiquidations=_to_wei_strings(values.get("total_liquidation", empty)),
+        unit="USD",
+        slippages=_to_wei_strings(values.get("liquidation_slippage", empty)),
+        equilibriumPrices=(
+            _to_wei_strings(values["equilibrium_price"])
+            if "equilibrium_price" in values
+            else None
+        ),
+        truncated=next_start is not None,
+        nextStart=next_start,
+    )
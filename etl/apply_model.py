@@ -1,15 +1,34 @@
+import argparse
 import pandas as pd
 import json
+from array import array
 import numpy as np
 from pathlib import Path
-from collections import OrderedDict
-from typing import Optional
-
-TOTAL_MAKETS_PATH = Path("data/total_markets_coingecko.csv")
-ETHEREUM_COMPOUND_PATH = Path("data/users/ethereum_compound.json")
+from time import time
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from src.curve_artifact import (
+    COMPACT_CURVE_ARTIFACT_PATH,
+    CURVE_ARTIFACT_PATH,
+    CURVE_COLUMNS,
+    write_curve_artifact,
+)
+from src.curve_history import CURVE_HISTORY_PATH, CurveHistory
+from src.model.cascade import CascadeIndex, SlippageModel, simulate_cascades
+from src.model.compaction import compact_curve
+from src.model.liquidity import LiquidityBook, load_liquidity_book
+from src.model.stress import StressConfig, run_stress
+from src.paths import DATA_DIR, get_users_path
+
+TOTAL_MAKETS_PATH = DATA_DIR / "total_markets_coingecko.csv"
+ETHEREUM_COMPOUND_PATH = get_users_path("compound", "ETH")
+MARKETS_STATUS_PATH = DATA_DIR / "markets" / "compmound_markets_status.json"
+STRESS_DIR = DATA_DIR / "stress"
 
 RATIO_COMPOUND_INDUSTRY = 0.1
 LIQUIDATION_THESHOLD = 1
+# Largest error of a compacted curve, as a fraction of each column's range
+COMPACTION_MAX_ERROR = 0.001
 
 
 STABLECOIN_MARKETS = [
@@ -19,160 +38,387 @@ STABLECOIN_MARKETS = [
     "0x12392F67bdf24faE0AF363c24aC620a2f67DAd86",
 ]
 STABLECOIN_NAMES = ["DAI", "USDC", "USDT", "TUSD"]
+# Collateral assets that get a curve. Positions are pooled over every
+# non-stablecoin collateral and the depth CSV only has ETH venues, so other
+# assets would only get a rescaled copy of the ETH curve
+MODELLED_ASSETS = ["ETH"]
 
 
-def get_user_stablecoin_collateral(user_markets_data: dict) -> float:
-    return np.sum(
-        [
-            markets_data["collateral"]
-            for markets_data in user_markets_data["markets"]
-            if markets_data["market"] in STABLECOIN_MARKETS
-        ]
+def get_slippage_model(liquidity: LiquidityBook) -> SlippageModel:
+    """Price factor left after liquidations sell `sold` of the protocol's
+    collateral, extrapolated to the industry."""
+    return lambda sold, scenarios=None: liquidity.get_slippage(
+        np.asarray(sold) / RATIO_COMPOUND_INDUSTRY
     )
 
 
-def get_slippage_dollars(sale_amount: float, market_size: float):
-    return 1 / (1 + 2 * sale_amount / market_size)
+def get_liquidity_book() -> LiquidityBook:
+    """Depth of every USD venue in the depth CSV."""
+    return load_liquidity_book(TOTAL_MAKETS_PATH).usd_pairs()
 
 
 def get_total_market_size() -> float:
-    df = pd.read_csv(TOTAL_MAKETS_PATH)
-
-    df["2% Depth"] = pd.to_numeric(
-        df["2% Depth"]
-        .str.replace(",", "", regex=False)
-        .str.replace("$", "", regex=False)
-    )
-    df["-2% Depth"] = pd.to_numeric(
-        df["-2% Depth"]
-        .str.replace(",", "", regex=False)
-        .str.replace("$", "", regex=False)
-    )
-
-    df["up_depth"] = df["2% Depth"].apply(lambda x: x * 0.98 * 100)
-    df["down_depth"] = df["-2% Depth"].apply(lambda x: x * 1.02 * 100)
-    df["virtual_total_market"] = (df["up_depth"] + df["down_depth"]) / 2
+    return get_liquidity_book().total_market_size
 
-    return df[df["Pair"].str.contains("/US")]["virtual_total_market"].sum()
 
+def load_market_symbols() -> Dict[str, str]:
+    with MARKETS_STATUS_PATH.open("r") as f:
+        m_status = json.load(f)
+    return {market: status["symbol"] for market, status in m_status.items()}
 
-def get_market_eth_ratio(eth_compound) -> float:
 
-    # Clean empty users
-    users_with_markets = [u for u in eth_compound["users"] if len(u["markets"]) > 0]
+def get_collateral_ratios(
+    df_markets: pd.DataFrame, market_symbols: Optional[Dict[str, str]] = None
+) -> pd.Series:
+    """Share of the non-stablecoin collateral held in each asset, by symbol.
 
-    m_status = json.load(open("data/markets/compmound_markets_status.json"))
-    m_dict = dict(zip([i for i in m_status], [m_status[i]["symbol"] for i in m_status]))
-
-    # get the ratio of collateral that ETH represents
-    collaterals = []
-    values = []
-    for k in m_dict.keys():
-        users_with_markets = [i for i in eth_compound["users"] if len(i["markets"]) > 0]
-        collaterals.append(m_dict[k])
-        values.append(
-            np.sum(
-                [
-                    i["markets"][0]["collateral"]
-                    for i in users_with_markets
-                    if i["markets"][0]["market"] == k
-                ]
+    Sums the collateral of every market of every user in one group-by pass.
+    Markets missing from `market_symbols` are ignored.
+    """
+    if market_symbols is None:
+        market_symbols = load_market_symbols()
+    value = (
+        df_markets["collateral"].groupby(df_markets["market"].map(market_symbols)).sum()
+    )
+    value = value[~value.index.isin(STABLECOIN_NAMES)]
+    return value / value.sum()
+
+
+def get_market_eth_ratio(df_markets: pd.DataFrame) -> float:
+    return get_collateral_ratios(df_markets)["ETH"]
+
+
+def iter_users(path: Path) -> Iterator[dict]:
+    """Yields the users of an extraction output one at a time.
+
+    Newline-delimited JSON (`.ndjson`) is streamed line by line; legacy
+    `{"users": [...]}` documents are loaded whole.
+    """
+    with path.open("r") as f:
+        if path.suffix == ".ndjson":
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)["users"]
+
+
+def flatten_users(users: Iterable[dict]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Flattens users into one row per user and one row per user market.
+
+    Users are consumed one at a time into typed columns, so only the columns
+    are kept in memory. Users without markets are dropped. The market rows
+    reference users by their position in the user frame.
+    """
+    collateral, debt, net_value = array("d"), array("d"), array("d")
+    market_user, market_code, market_collateral = array("q"), array("q"), array("d")
+    market_codes: Dict[str, int] = {}
+    for user in users:
+        if len(user["markets"]) == 0:
+            continue
+        user_index = len(collateral)
+        collateral.append(user["collateral"])
+        debt.append(user["debt"])
+        net_value.append(user["netValue"])
+        for market in user["markets"]:
+            market_user.append(user_index)
+            market_code.append(
+                market_codes.setdefault(market["market"], len(market_codes))
             )
-        )
-    df_collaterals = pd.DataFrame({"collateral": collaterals, "value": values})
-    df_collaterals_ns = df_collaterals[
-        ~df_collaterals["collateral"].isin(STABLECOIN_NAMES)
-    ]
-    value = df_collaterals_ns.set_index("collateral")["value"]
-    norm_value = value / value.sum()
-    return norm_value["ETH"]
-
-
-def main():
-    total_market_size = get_total_market_size()
+            market_collateral.append(market["collateral"])
 
-    with ETHEREUM_COMPOUND_PATH.open("r") as f:
-        eth_compound = json.load(f)
-
-    ratio_eth = get_market_eth_ratio(eth_compound)
-    users_with_markets = [u for u in eth_compound["users"] if len(u["markets"]) > 0]
-
-    users_with_markets_and_stable_collat = [
+    df_users = pd.DataFrame(
         {
-            **user_data,
-            **{"stable_collateral": get_user_stablecoin_collateral(user_data)},
+            "collateral": np.frombuffer(collateral, np.float64),
+            "debt": np.frombuffer(debt, np.float64),
+            "netValue": np.frombuffer(net_value, np.float64),
         }
-        for user_data in users_with_markets
-    ]
-
-    users_with_markets_and_stable_collat_with_liquidation = [
+    )
+    df_markets = pd.DataFrame(
         {
-            **user_data,
-            **{
-                "liquidation_value": (
-                    user_data["debt"] - (user_data["stable_collateral"])
-                )
-                / LIQUIDATION_THESHOLD
-            },
+            "user": np.frombuffer(market_user, np.int64),
+            "market": pd.Categorical.from_codes(
+                np.frombuffer(market_code, np.int64), list(market_codes)
+            ),
+            "collateral": np.frombuffer(market_collateral, np.float64),
         }
-        for user_data in users_with_markets_and_stable_collat
+    )
+    return df_users, df_markets
+
+
+def round_half_even_exact(values: np.ndarray, decimals: int) -> np.ndarray:
+    """Vectorized equivalent of Python's `round(x, decimals)`.
+
+    `np.round` scales by a power of ten first, so it can disagree with
+    Python's correctly rounded result when a value sits on a rounding
+    boundary; those few values are rounded one by one.
+    """
+    rounded = np.round(values, decimals)
+    scaled = values * 10**decimals
+    near_boundary = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    # tolist gives Python floats: round() of a NumPy float is np.round again
+    rounded[near_boundary] = [
+        round(x, decimals) for x in values[near_boundary].tolist()
     ]
+    return rounded
+
+
+def get_liquidation_positions(
+    df_users: pd.DataFrame, df_markets: pd.DataFrame
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Share of its non-stablecoin collateral at which each position is
+    liquidated, and that collateral, for positions that can be liquidated."""
+    is_stable = df_markets["market"].isin(STABLECOIN_MARKETS).to_numpy()
+    stable_collateral = np.bincount(
+        df_markets["user"].to_numpy(),
+        weights=np.where(is_stable, df_markets["collateral"].to_numpy(), 0.0),
+        minlength=len(df_users),
+    )
+
+    collateral = df_users["collateral"].to_numpy()
+    liquidation_value = (
+        df_users["debt"].to_numpy() - stable_collateral
+    ) / LIQUIDATION_THESHOLD
+    eth_collateral = collateral - stable_collateral
+    keep = (
+        (liquidation_value > 0)
+        & (eth_collateral > 0)
+        & (df_users["netValue"].to_numpy() > 0)
+    )
+    return liquidation_value[keep] / eth_collateral[keep], eth_collateral[keep]
+
+
+def get_cascade_index(
+    liquidation_perc: np.ndarray, eth_collateral: np.ndarray, ratio_eth: float
+) -> CascadeIndex:
+    # Every position at its unrounded threshold
+    return CascadeIndex.from_positions(1 - liquidation_perc, eth_collateral * ratio_eth)
 
-    users_with_markets_and_stable_collat_with_liquidation = [
-        u
-        for u in users_with_markets_and_stable_collat_with_liquidation
-        if u["liquidation_value"] > 0
-    ]
 
-    def get_liquidation_percentage(x: float, y: float) -> Optional[float]:
-        return y / x if x > 0 else None
+def compute_liquidation_curve(
+    df_users: pd.DataFrame,
+    df_markets: pd.DataFrame,
+    ratio_eth: float,
+    liquidity: LiquidityBook,
+) -> pd.DataFrame:
+    liquidation_perc, eth_collateral = get_liquidation_positions(df_users, df_markets)
 
-    users_with_markets_and_stable_collat_with_liquidation = [
+    df_curve = pd.DataFrame(
         {
-            **user_data,
-            **{
-                "liquidation_perc": get_liquidation_percentage(
-                    user_data["collateral"] - user_data["stable_collateral"],
-                    user_data["liquidation_value"],
-                )
-            },
+            "eth_collateral": eth_collateral,
+            "liquidation_perc": liquidation_perc,
         }
-        for user_data in users_with_markets_and_stable_collat_with_liquidation
-        if (user_data["collateral"] - user_data["stable_collateral"] > 0)
-    ]
-
-    df_users = pd.DataFrame(users_with_markets_and_stable_collat_with_liquidation)
-    df_users["eth_collateral"] = df_users["collateral"] - df_users["stable_collateral"]
-    df_users = df_users[
-        (df_users["eth_collateral"] > 0) & (df_users["netValue"] > 0)
-    ].sort_values("liquidation_perc", ascending=False)
+    ).sort_values("liquidation_perc", ascending=False)
 
-    df_users["total_liquidation"] = (
-        df_users["eth_collateral"].cumsum() * ratio_eth
+    df_curve["total_liquidation"] = (
+        df_curve["eth_collateral"].cumsum() * ratio_eth
     )  # the amount of ETH that will be liquidated and sold is 80% of the collateral
-    df_users["price_change"] = 1 - df_users["liquidation_perc"]
-
-    df_users["liquidation_slippage"] = get_slippage_dollars(
-        df_users["total_liquidation"] / RATIO_COMPOUND_INDUSTRY, total_market_size
+    slippage = get_slippage_model(liquidity)
+    df_curve["liquidation_slippage"] = slippage(
+        df_curve["total_liquidation"]
     )  # tenemos que añadir la proporcion de esto del mercado
-    df_users["price_after_slippage"] = (
-        df_users["liquidation_perc"] * df_users["liquidation_slippage"]
-    )
     # round price change to 4 decimals
-    df_users["price_change"] = df_users["price_change"].apply(lambda x: round(x, 4))
-    df_users = df_users.groupby("price_change").agg(
+    df_curve["price_change"] = round_half_even_exact(
+        1 - df_curve["liquidation_perc"].to_numpy(), 4
+    )
+    df_curve = df_curve.groupby("price_change").agg(
         total_liquidation=pd.NamedAgg(column="total_liquidation", aggfunc="max"),
         liquidation_slippage=pd.NamedAgg(column="liquidation_slippage", aggfunc="min"),
     )
-    df_users.reset_index(inplace=True)
+    df_curve.reset_index(inplace=True)
+
+    # Equilibrium price once the liquidations each price drop triggers have
+    # cascaded
+    df_curve["equilibrium_price"] = simulate_cascades(
+        get_cascade_index(liquidation_perc, eth_collateral, ratio_eth),
+        df_curve["price_change"].to_numpy(),
+        slippage,
+    ).equilibrium_price
+    return df_curve[
+        [
+            "price_change",
+            "total_liquidation",
+            "liquidation_slippage",
+            "equilibrium_price",
+        ]
+    ]
+
 
-    df_users[["price_change", "total_liquidation", "liquidation_slippage"]].to_json(
-        "data/cached_curves/eth.json",
-        orient="records",
-        indent=4,
-        double_precision=4,
+def compute_asset_curves(
+    df_users: pd.DataFrame, df_markets: pd.DataFrame, liquidity: LiquidityBook
+) -> Dict[str, pd.DataFrame]:
+    """Liquidation curve of every modelled asset held as collateral, by
+    lowercase symbol, weighted by the asset's share of the collateral."""
+    ratios = get_collateral_ratios(df_markets)
+    return {
+        symbol.lower(): compute_liquidation_curve(
+            df_users, df_markets, ratios[symbol], liquidity
+        )
+        for symbol in MODELLED_ASSETS
+        if ratios.get(symbol, 0) > 0
+    }
+
+
+def compute_stress_bands(
+    df_users: pd.DataFrame,
+    df_markets: pd.DataFrame,
+    curves: Dict[str, pd.DataFrame],
+    liquidity: LiquidityBook,
+    config: StressConfig,
+    workers: int = 1,
+) -> Dict[str, pd.DataFrame]:
+    """Percentile bands of the cascade of every modelled asset in `curves`, at each
+    curve point with a price drop between 0 and 1, over sampled market
+    depths, industry shares and price paths."""
+    liquidation_perc, eth_collateral = get_liquidation_positions(df_users, df_markets)
+    ratios = get_collateral_ratios(df_markets)
+    bands = {}
+    for symbol in MODELLED_ASSETS:
+        asset = symbol.lower()
+        if asset not in curves:
+            continue
+        price_change = curves[asset]["price_change"].to_numpy()
+        shocks = price_change[(price_change >= 0) & (price_change <= 1)]
+        bands[asset] = pd.DataFrame(
+            {
+                "price_change": shocks,
+                **run_stress(
+                    get_cascade_index(liquidation_perc, eth_collateral, ratios[symbol]),
+                    shocks,
+                    liquidity.sale_sizes,
+                    config,
+                    workers,
+                ),
+            }
+        )
+    return bands
+
+
+def get_snapshot(users_path: Path) -> Tuple[Optional[int], int]:
+    """Block and timestamp of the extraction in `users_path`, from the
+    metadata written next to it, or the current time when it has none."""
+    metadata_path = users_path.with_suffix(".meta.json")
+    metadata = {}
+    if metadata_path.exists():
+        with metadata_path.open("r") as f:
+            metadata = json.load(f)
+    timestamp = metadata.get("timestamp")
+    return metadata.get("block"), int(timestamp if timestamp is not None else time())
+
+
+def main(
+    users_path: Path = ETHEREUM_COMPOUND_PATH,
+    output_path: Path = CURVE_ARTIFACT_PATH,
+    stress_config: Optional[StressConfig] = None,
+    workers: int = 1,
+    max_error: float = COMPACTION_MAX_ERROR,
+    compact_output_path: Path = COMPACT_CURVE_ARTIFACT_PATH,
+    history_path: Optional[Path] = CURVE_HISTORY_PATH,
+):
+    liquidity = get_liquidity_book()
+
+    df_users, df_markets = flatten_users(iter_users(users_path))
+    curves = compute_asset_curves(df_users, df_markets, liquidity)
+    write_curve_artifact(
+        curves,
+        output_path,
+        metadata={
+            "users": str(users_path),
+            "totalMarketSize": liquidity.total_market_size,
+            "venues": len(liquidity),
+        },
+    )
+    print(f"Wrote {len(curves)} curves to {output_path}")
+
+    compacted = {
+        asset: compact_curve(curve, CURVE_COLUMNS[1:], max_error)
+        for asset, curve in curves.items()
+    }
+    write_curve_artifact(
+        compacted,
+        compact_output_path,
+        metadata={"users": str(users_path), "maxError": max_error},
+    )
+    print(
+        f"Compacted {sum(len(c) for c in curves.values())} curve points to "
+        f"{sum(len(c['price_change']) for c in compacted.values())} "
+        f"in {compact_output_path}"
     )
 
+    if history_path is not None:
+        block, timestamp = get_snapshot(users_path)
+        history = CurveHistory(history_path)
+        try:
+            stored = [
+                asset
+                for asset, curve in compacted.items()
+                if history.append(asset, block, timestamp, curve)
+            ]
+        finally:
+            history.close()
+        print(
+            f"Added {len(stored)} curves at block {block}, timestamp {timestamp} "
+            f"to {history_path}"
+        )
+
+    if stress_config is not None:
+        bands = compute_stress_bands(
+            df_users, df_markets, curves, liquidity, stress_config, workers
+        )
+        STRESS_DIR.mkdir(parents=True, exist_ok=True)
+        for asset, df_bands in bands.items():
+            df_bands.to_json(
+                STRESS_DIR / f"{asset}.json",
+                orient="records",
+                indent=4,
+                double_precision=6,
+            )
+        print(
+            f"Wrote stress bands of {len(bands)} assets over "
+            f"{stress_config.scenarios} scenarios to {STRESS_DIR}"
+        )
+
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--users",
+        type=Path,
+        default=ETHEREUM_COMPOUND_PATH,
+        help="Extraction output, as .ndjson or a legacy {'users': [...]} .json",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=CURVE_ARTIFACT_PATH,
+        help="Binary curve artifact served by the API",
+    )
+    parser.add_argument(
+        "--stress",
+        type=int,
+        default=0,
+        metavar="SCENARIOS",
+        help="Also write p5/p50/p95 bands over this many Monte Carlo scenarios",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--max-error",
+        type=float,
+        default=COMPACTION_MAX_ERROR,
+        help="Largest error of compacted curves, as a fraction of each column's range",
+    )
+    parser.add_argument(
+        "--no-history",
+        action="store_true",
+        help=f"Do not add the compacted curves to {CURVE_HISTORY_PATH}",
+    )
+    args = parser.parse_args()
+    main(
+        args.users,
+        args.output,
+        StressConfig(args.stress, args.seed) if args.stress else None,
+        args.workers,
+        args.max_error,
+        history_path=None if args.no_history else CURVE_HISTORY_PATH,
+    )
@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+import traceback
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, replace
+from datetime import datetime, timezone
+from pathlib import Path
+from time import monotonic
+from typing import Dict, List, Optional
+
+from web3 import Web3
+
+from src.data_extraction.compound import CompoundDataExtractor
+from src.data_extraction.extraction_state import ExtractionState
+from src.protocols_data import PROTOCOL_REFERENCE_PATH, CompoundProtocolReference
+from src.rpc import Endpoint, LoadBalancedProvider
+from src.rpc_cache import CACHE_MODES, add_response_cache
+from src.utils import get_rpc_endpoints
+from src.paths import USERS_DIR, get_users_path
+
+RUN_SUMMARY_PATH = USERS_DIR / "run_summary.json"
+
+DEFAULT_WORKERS = 4
+DEFAULT_RATE_LIMIT = 25.0
+
+
+@dataclass
+class ExtractionJob:
+    protocol: str
+    network: str
+    endpoints: List[Endpoint]
+    save_to: str
+    multicall_concurrency: int = 4
+    price_source: str = "api"
+    cache_mode: str = "off"
+
+
+def get_jobs(
+    protocols: Optional[List[str]] = None,
+    networks: Optional[List[str]] = None,
+    workers: int = DEFAULT_WORKERS,
+    rate_limit: float = DEFAULT_RATE_LIMIT,
+    price_source: str = "api",
+    cache_mode: str = "off",
+) -> List[ExtractionJob]:
+    """One job per Compound-fork protocol and network in the protocol
+    reference, optionally filtered by protocol and network."""
+    with PROTOCOL_REFERENCE_PATH.open("r") as f:
+        reference: Dict[str, Dict[str, dict]] = json.load(f)
+
+    selected = [
+        (protocol, network)
+        for protocol, protocol_networks in reference.items()
+        for network, data in protocol_networks.items()
+        if "comptroller" in data
+        and (protocols is None or protocol in protocols)
+        and (networks is None or network in networks)
+    ]
+    endpoints = {network: get_rpc_endpoints(network) for _, network in selected}
+
+    # Jobs sharing an endpoint split its rate limit between the ones that can
+    # run at the same time
+    jobs_per_url = Counter(
+        endpoint.url for _, network in selected for endpoint in endpoints[network]
+    )
+    return [
+        ExtractionJob(
+            protocol=protocol,
+            network=network,
+            endpoints=[
+                replace(
+                    endpoint,
+                    rate_limit=rate_limit / min(jobs_per_url[endpoint.url], workers),
+                )
+                for endpoint in endpoints[network]
+            ],
+            save_to=str(get_users_path(protocol, network)),
+            price_source=price_source,
+            cache_mode=cache_mode,
+        )
+        for protocol, network in selected
+    ]
+
+
+def run_job(job: ExtractionJob) -> dict:
+    summary = {
+        "protocol": job.protocol,
+        "network": job.network,
+        "output": job.save_to,
+        "startedAt": datetime.now(timezone.utc).isoformat(),
+    }
+    start = monotonic()
+    # Sized for the multicall threads plus the log scanner's
+    provider = LoadBalancedProvider(
+        job.endpoints, pool_size=job.multicall_concurrency + 4
+    )
+    cache = None
+    try:
+        w3 = Web3(provider)
+        cache = add_response_cache(w3, job.network, job.cache_mode)
+        extractor = CompoundDataExtractor(
+            w3=w3,
+            protocol_info=CompoundProtocolReference.from_json_reference(
+                job.protocol, job.network
+            ),
+            network=job.network,
+            multicall_concurrency=job.multicall_concurrency,
+            price_source=job.price_source,
+        )
+        summary["users"] = extractor.extract_data(
+            save_to=job.save_to,
+            state=ExtractionState.for_protocol(job.protocol, job.network),
+        )
+        summary["status"] = "ok"
+    except Exception as e:
+        traceback.print_exc()
+        summary["status"] = "failed"
+        summary["error"] = f"{type(e).__name__}: {e}"
+    summary["seconds"] = round(monotonic() - start, 3)
+    summary["endpoints"] = provider.get_metrics()
+    if cache is not None:
+        summary["rpcCache"] = cache.stats()
+        cache.close()
+    return summary
+
+
+def main(
+    jobs: List[ExtractionJob],
+    workers: int = DEFAULT_WORKERS,
+    summary_path: Path = RUN_SUMMARY_PATH,
+) -> dict:
+    started_at = datetime.now(timezone.utc).isoformat()
+    start = monotonic()
+    print(f"Running {len(jobs)} extractions on {workers} workers")
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_job, job): i for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            result = results[futures[future]] = future.result()
+            print(
+                f"{result['protocol']} {result['network']}: "
+                f"{result['status']} in {result['seconds']}s"
+            )
+
+    summary = {
+        "startedAt": started_at,
+        "seconds": round(monotonic() - start, 3),
+        "workers": workers,
+        "jobs": [results[i] for i in range(len(jobs))],
+    }
+    summary_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = summary_path.with_suffix(".tmp")
+    with tmp_path.open("w") as f:
+        json.dump(summary, f, indent=2)
+    os.replace(tmp_path, summary_path)
+
+    failed = [
+        f"{j['protocol']} {j['network']}"
+        for j in summary["jobs"]
+        if j["status"] != "ok"
+    ]
+    if failed:
+        print(f"Failed extractions: {', '.join(failed)}")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Extract every Compound-fork protocol in the protocol reference"
+    )
+    parser.add_argument("--protocols", nargs="*", help="Only these protocols")
+    parser.add_argument("--networks", nargs="*", help="Only these networks")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=DEFAULT_RATE_LIMIT,
+        help="Requests per second allowed on each RPC endpoint",
+    )
+    parser.add_argument("--price-source", choices=["api", "oracle"], default="api")
+    parser.add_argument(
+        "--rpc-cache",
+        choices=CACHE_MODES,
+        default="off",
+        help="Cache deterministic RPC responses, record a run, or replay one offline",
+    )
+    args = parser.parse_args()
+
+    main(
+        get_jobs(
+            args.protocols,
+            args.networks,
+            args.workers,
+            args.rate_limit,
+            args.price_source,
+            args.rpc_cache,
+        ),
+        workers=args.workers,
+    )
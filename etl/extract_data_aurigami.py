@@ -1,15 +1,20 @@
 from src.data_extraction.compound import CompoundDataExtractor
-from src.utils import get_ethereum_web3_client
+from src.data_extraction.extraction_state import ExtractionState
+from src.utils import get_near_web3_client
 from src.protocols_data import CompoundProtocolReference
+from src.paths import get_users_path
 
 if __name__ == "__main__":
-    web3_client = get_ethereum_web3_client("mainnet")
-    network = "ETH"
-    protocol_info = CompoundProtocolReference.from_json_reference("compound", network)
+    web3_client = get_near_web3_client()
+    network = "NEAR"
+    protocol_info = CompoundProtocolReference.from_json_reference("aurigami", network)
 
     extractor = CompoundDataExtractor(
         w3=web3_client,
         protocol_info=protocol_info,
         network=network,
     )
-    extractor.extract_data(save_to="data/users/compound_data.json")
+    extractor.extract_data(
+        save_to=str(get_users_path("aurigami", network)),
+        state=ExtractionState.for_protocol("aurigami", network),
+    )
@@ -1,6 +1,8 @@
 from src.data_extraction.compound import CompoundDataExtractor
+from src.data_extraction.extraction_state import ExtractionState
 from src.utils import get_ethereum_web3_client
 from src.protocols_data import CompoundProtocolReference
+from src.paths import get_users_path
 
 if __name__ == "__main__":
     web3_client = get_ethereum_web3_client("mainnet")
@@ -11,5 +13,10 @@ if __name__ == "__main__":
         w3=web3_client,
         protocol_info=protocol_info,
         network=network,
+        multicall_concurrency=8,
+        price_source="oracle",
+    )
+    extractor.extract_data(
+        save_to=str(get_users_path("compound", network)),
+        state=ExtractionState.for_protocol("compound", network),
     )
-    extractor.extract_data(save_to="data/users/compound_data.json")
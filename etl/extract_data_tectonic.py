@@ -1,6 +1,8 @@
 from src.data_extraction.compound import CompoundDataExtractor
+from src.data_extraction.extraction_state import ExtractionState
 from src.utils import get_cronos_web3_client
 from src.protocols_data import CompoundProtocolReference
+from src.paths import get_users_path
 
 if __name__ == "__main__":
     web3_client = get_cronos_web3_client()
@@ -12,4 +14,7 @@ if __name__ == "__main__":
         protocol_info=protocol_info,
         network=network,
     )
-    extractor.extract_data(save_to="data/users/tectonic_data.json")
+    extractor.extract_data(
+        save_to=str(get_users_path("tectonic", network)),
+        state=ExtractionState.for_protocol("tectonic", network),
+    )
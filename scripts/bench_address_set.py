@@ -0,0 +1,85 @@
+"""Deduplication of scanned borrowers, AddressSet against the former list.
+
+Builds synthetic MarketEntered log data with `--events-per-user` events per
+borrower and times collecting the unique borrowers: reading each account's
+raw bytes into an AddressSet (then checksumming each borrower once) against
+the former scan that ABI-decoded and checksummed every event and checked
+membership in a list. The list is quadratic, so it only runs up to
+`--max-list-events`.
+
+    python scripts/bench_address_set.py [--events 100000 300000 1000000]
+"""
+
+import argparse
+import random
+from time import perf_counter
+from typing import List
+
+import eth_abi
+from web3 import Web3
+
+from src.abis import ABIS
+from src.data_extraction.address_set import AddressSet
+from src.data_extraction.codec import decode_log_addresses, get_log_locations
+
+MARKET_ENTERED = next(
+    abi for abi in ABIS.comptroller if abi.get("name") == "MarketEntered"
+)
+LOCATIONS = get_log_locations(MARKET_ENTERED, ("account",))
+
+
+def make_events(events: int, events_per_user: int, rng: random.Random) -> List[bytes]:
+    """Data of MarketEntered logs: the market, then the account."""
+    users = [rng.randbytes(20) for _ in range(max(1, events // events_per_user))]
+    market = bytes(12) + rng.randbytes(20)
+    return [market + bytes(12) + rng.choice(users) for _ in range(events)]
+
+
+def collect_with_list(events: List[bytes]) -> List[str]:
+    user_addresses = []
+    for data in events:
+        _, account = eth_abi.decode_abi(["address", "address"], data)
+        account = Web3.toChecksumAddress(account)
+        if account not in user_addresses:
+            user_addresses.append(account)
+    return user_addresses
+
+
+def main(events: List[int], events_per_user: int, max_list_events: int):
+    rng = random.Random(0)
+    print(f"{'events':>9} {'users':>8} {'dedup':>8} {'checksum':>9} {'list':>8}")
+    for n in events:
+        stream = make_events(n, events_per_user, rng)
+
+        start = perf_counter()
+        addresses = AddressSet()
+        for data in stream:
+            for account in decode_log_addresses((), data, LOCATIONS):
+                addresses.add(account)
+        dedup = perf_counter() - start
+        start = perf_counter()
+        user_addresses = addresses.to_checksum_list()
+        checksum = perf_counter() - start
+
+        listed = "-"
+        if n <= max_list_events:
+            start = perf_counter()
+            assert collect_with_list(stream) == user_addresses
+            listed = f"{perf_counter() - start:7.2f}s"
+        print(
+            f"{n:9} {len(user_addresses):8} {dedup:7.2f}s {checksum:8.2f}s {listed:>8}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--events",
+        type=int,
+        nargs="*",
+        default=[10_000, 20_000, 40_000, 100_000, 300_000, 1_000_000],
+    )
+    parser.add_argument("--events-per-user", type=int, default=5)
+    parser.add_argument("--max-list-events", type=int, default=40_000)
+    args = parser.parse_args()
+    main(args.events, args.events_per_user, args.max_list_events)
@@ -0,0 +1,134 @@
+"""Transform time of apply_model over synthetic borrowers.
+
+Generates `--users` synthetic borrowers shaped like the extraction output and
+times flattening them into the user and user-market frames, finding the
+liquidatable positions and building the ETH liquidation curve. The former
+pipeline, which copied every user dict at each step, is timed too up to
+`--max-dict-users` and must find the same positions.
+
+    python scripts/bench_apply_model.py [--users 100000 1000000]
+"""
+
+import argparse
+import random
+from time import perf_counter
+from typing import List
+
+import numpy as np
+
+from etl.apply_model import (
+    LIQUIDATION_THESHOLD,
+    STABLECOIN_MARKETS,
+    compute_liquidation_curve,
+    flatten_users,
+    get_liquidation_positions,
+    get_liquidity_book,
+    load_market_symbols,
+)
+
+
+def make_users(n: int, markets: List[str], rng: random.Random) -> List[dict]:
+    users = []
+    for i in range(n):
+        user_markets = [
+            {
+                "market": market,
+                "collateral": rng.choice([0.0, rng.lognormvariate(7, 2)]),
+                "debt": rng.lognormvariate(6, 2) * rng.random(),
+            }
+            for market in rng.sample(markets, rng.choice([0, 1, 1, 2, 3]))
+        ]
+        collateral = sum(m["collateral"] for m in user_markets)
+        debt = sum(m["debt"] for m in user_markets) * rng.uniform(0.2, 3)
+        users.append(
+            {
+                "user": f"0x{i:040x}",
+                "markets": user_markets,
+                "collateral": collateral,
+                "debt": debt,
+                "netValue": collateral - debt * rng.uniform(0, 1.2),
+            }
+        )
+    return users
+
+
+def positions_with_dicts(users: List[dict]) -> np.ndarray:
+    """Liquidation percentages the way the former pipeline found them."""
+    users = [u for u in users if len(u["markets"]) > 0]
+    users = [
+        {
+            **u,
+            "stable_collateral": float(
+                np.sum(
+                    [
+                        m["collateral"]
+                        for m in u["markets"]
+                        if m["market"] in STABLECOIN_MARKETS
+                    ]
+                )
+            ),
+        }
+        for u in users
+    ]
+    users = [
+        {
+            **u,
+            "liquidation_value": (u["debt"] - u["stable_collateral"])
+            / LIQUIDATION_THESHOLD,
+        }
+        for u in users
+    ]
+    users = [u for u in users if u["liquidation_value"] > 0]
+    users = [
+        {
+            **u,
+            "liquidation_perc": u["liquidation_value"]
+            / (u["collateral"] - u["stable_collateral"]),
+        }
+        for u in users
+        if u["collateral"] - u["stable_collateral"] > 0 and u["netValue"] > 0
+    ]
+    return np.array([u["liquidation_perc"] for u in users])
+
+
+def main(users: List[int], max_dict_users: int):
+    rng = random.Random(0)
+    markets = list(load_market_symbols())
+    liquidity = get_liquidity_book()
+    print(
+        f"{'users':>9} {'positions':>9} {'flatten':>8} {'positions':>9} "
+        f"{'curve':>8} {'dicts':>8}"
+    )
+    for n in users:
+        synthetic = make_users(n, markets, rng)
+
+        start = perf_counter()
+        df_users, df_markets = flatten_users(synthetic)
+        flatten = perf_counter() - start
+        start = perf_counter()
+        liquidation_perc, _ = get_liquidation_positions(df_users, df_markets)
+        positions = perf_counter() - start
+        start = perf_counter()
+        compute_liquidation_curve(df_users, df_markets, 0.5, liquidity)
+        curve = perf_counter() - start
+
+        dicts = "-"
+        if n <= max_dict_users:
+            start = perf_counter()
+            expected = positions_with_dicts(synthetic)
+            dicts = f"{perf_counter() - start:7.2f}s"
+            assert np.array_equal(np.sort(expected), np.sort(liquidation_perc))
+        print(
+            f"{n:9} {len(liquidation_perc):9} {flatten:7.2f}s {positions:8.2f}s "
+            f"{curve:7.2f}s {dicts:>8}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--users", type=int, nargs="*", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--max-dict-users", type=int, default=1_000_000)
+    args = parser.parse_args()
+    main(args.users, args.max_dict_users)
@@ -0,0 +1,83 @@
+"""Cold-start time of the API and of each ETL entry point.
+
+Every module is imported `--runs` times in a fresh interpreter, from the
+repository root, and the median wall time is reported next to the bare
+interpreter's. The heaviest top-level imports come from `-X importtime`.
+
+    python scripts/bench_cold_start.py [--runs 7] [modules ...]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from collections import Counter
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+from typing import List
+
+ROOT = Path(__file__).resolve().parent.parent
+
+ENTRY_POINTS = [
+    "api.app",
+    "etl.extract_data",
+    "etl.extract_data_compound",
+    "etl.extract_data_aurigami",
+    "etl.extract_data_tectonic",
+    "etl.apply_model",
+]
+
+
+def run_import(module: str, *flags: str) -> subprocess.CompletedProcess:
+    statement = f"import {module}" if module else "pass"
+    env = {**os.environ, "PYTHONPATH": str(ROOT)}
+    return subprocess.run(
+        [sys.executable, *flags, "-c", statement],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def time_import(module: str, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        start = perf_counter()
+        run_import(module)
+        times.append(perf_counter() - start)
+    return median(times)
+
+
+def heaviest_imports(module: str, top: int = 4) -> List[str]:
+    # A package's largest cumulative time is the import that loaded it
+    totals: Counter = Counter()
+    for line in run_import(module, "-X", "importtime").stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        package = fields[2].strip().split(".")[0]
+        totals[package] = max(totals[package], int(fields[1]))
+    for package in ("src", "api", "etl", "site", "encodings"):
+        totals.pop(package, None)
+    return [f"{name} {us / 1000:.0f}ms" for name, us in totals.most_common(top)]
+
+
+def main(modules: List[str], runs: int):
+    baseline = time_import("", runs)
+    print(f"{'interpreter':30} {baseline * 1000:8.1f} ms")
+    for module in modules:
+        elapsed = time_import(module, runs)
+        heaviest = ", ".join(heaviest_imports(module))
+        print(f"{module:30} {elapsed * 1000:8.1f} ms  ({heaviest})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=ENTRY_POINTS)
+    parser.add_argument("--runs", type=int, default=7)
+    args = parser.parse_args()
+
+    main(args.modules, args.runs)
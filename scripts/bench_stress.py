@@ -0,0 +1,57 @@
+"""Throughput of the Monte Carlo stress mode as workers are added.
+
+Runs the same seeded stress test over synthetic positions with every worker
+count and reports scenarios per second, checking that the bands match.
+
+    python scripts/bench_stress.py [--scenarios 2048] [--workers 1 2 4 8]
+"""
+
+import argparse
+import os
+from time import perf_counter
+from typing import List
+
+import numpy as np
+
+from src.model.cascade import CascadeIndex
+from src.model.stress import StressConfig, run_stress
+
+
+def main(scenarios: int, workers: List[int], positions: int, shocks: int):
+    rng = np.random.default_rng(0)
+    index = CascadeIndex.from_positions(
+        rng.uniform(0, 1, positions), rng.lognormal(8, 2, positions)
+    )
+    grid = np.linspace(0, 1, shocks)
+    depths = rng.lognormal(19, 1, 100)
+    config = StressConfig(scenarios=scenarios)
+    print(
+        f"{positions} positions, {shocks} shocks, {scenarios} scenarios, "
+        f"{os.cpu_count()} CPUs"
+    )
+
+    reference = None
+    for n in workers:
+        start = perf_counter()
+        bands = run_stress(index, grid, depths, config, workers=n)
+        elapsed = perf_counter() - start
+        if reference is None:
+            reference = bands
+        same = all(np.array_equal(bands[k], reference[k]) for k in reference)
+        print(
+            f"{n:3} workers  {elapsed:7.2f} s  {scenarios / elapsed:9.1f} scenarios/s"
+            f"  {'same bands' if same else 'DIFFERENT BANDS'}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", type=int, default=2048)
+    parser.add_argument("--workers", type=int, nargs="*")
+    parser.add_argument("--positions", type=int, default=20_000)
+    parser.add_argument("--shocks", type=int, default=2_000)
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    workers = args.workers or sorted({1, cpus} | {n for n in (2, 4, 8) if n < cpus})
+    main(args.scenarios, workers, args.positions, args.shocks)
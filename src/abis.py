@@ -1,37 +1,106 @@
-from dataclasses import dataclass
+import hashlib
 import json
+import os
+import pickle
 from pathlib import Path
-from typing import Dict
+from typing import Dict, List, Optional
 
-ABI_PATH = Path("data/abis.json")
+from src.paths import DATA_DIR
+
+ABI_PATH = DATA_DIR / "abis.json"
+ABI_CACHE_DIR = DATA_DIR / "cache" / "abis"
+
+ABI_NAMES = (
+    "erc20",
+    "comptroller",
+    "cToken",
+    "multicall",
+    "oneInchOracle",
+    "compoundOracle",
+    "chainlink",
+    "calderon",
+    "bentobox",
+    "vat",
+    "spotter",
+    "lendingPoolAddressesProvider",
+    "lendingPool",
+    "curve",
+    "stakedToken",
+    "xJoe",
+    "uniswapV2Pair",
+)
 
 
-@dataclass
 class AbiCollection:
-    erc20: list
-    comptroller: list
-    cToken: list
-    multicall: list
-    oneInchOracle: list
-    compoundOracle: list
-    chainlink: list
-    calderon: list
-    bentobox: list
-    vat: list
-    spotter: list
-    lendingPoolAddressesProvider: list
-    lendingPool: list
-    curve: list
-    stakedToken: list
-    xJoe: list
-    uniswapV2Pair: list
-
-
-def get_abis() -> AbiCollection:
-    with ABI_PATH.open("r") as f:
-        abis_data: dict = json.load(f)
-    abis_data = {k[:-3]: v for k, v in abis_data.items()}
-    return AbiCollection(**abis_data)
+    """The ABIs in `abis.json` by name, each loaded on first access.
+
+    The first load parses the JSON file and pickles every ABI on its own in
+    a directory of `cache_dir` named after the file's hash, so later
+    processes only unpickle the ABIs they use and an edited file is never
+    served stale. Without a `cache_dir`, or when it is not writable, the
+    JSON file is parsed instead.
+    """
+
+    def __init__(
+        self, path: Path = ABI_PATH, cache_dir: Optional[Path] = ABI_CACHE_DIR
+    ):
+        self.path = path
+        self.cache_dir = cache_dir
+        self._version_dir: Optional[Path] = None
+
+    def __getattr__(self, name: str) -> List[dict]:
+        if name not in ABI_NAMES:
+            raise AttributeError(f"No ABI named {name}")
+        abi = self._load_cached(name)
+        if abi is None:
+            abis = self._parse()
+            self._write_cache(abis)
+            abi = abis[name]
+        # Later accesses are plain attribute lookups
+        setattr(self, name, abi)
+        return abi
+
+    def _get_version_dir(self) -> Optional[Path]:
+        if self.cache_dir is None:
+            return None
+        if self._version_dir is None:
+            digest = hashlib.blake2b(self.path.read_bytes(), digest_size=16)
+            self._version_dir = self.cache_dir / digest.hexdigest()
+        return self._version_dir
+
+    def _load_cached(self, name: str) -> Optional[List[dict]]:
+        version_dir = self._get_version_dir()
+        if version_dir is None:
+            return None
+        try:
+            with (version_dir / f"{name}.pickle").open("rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def _parse(self) -> Dict[str, List[dict]]:
+        with self.path.open("r") as f:
+            abis_data: dict = json.load(f)
+        return {k[:-3]: v for k, v in abis_data.items()}
+
+    def _write_cache(self, abis: Dict[str, List[dict]]):
+        version_dir = self._get_version_dir()
+        if version_dir is None:
+            return
+        try:
+            version_dir.mkdir(parents=True, exist_ok=True)
+            for name, abi in abis.items():
+                path = version_dir / f"{name}.pickle"
+                tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+                with tmp_path.open("wb") as f:
+                    pickle.dump(abi, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not cache ABIs in {version_dir}: {e}")
+
+
+def get_abis(cache_dir: Optional[Path] = ABI_CACHE_DIR) -> AbiCollection:
+    return AbiCollection(ABI_PATH, cache_dir)
 
 
 ABIS = get_abis()
@@ -1,11 +1,16 @@
-from dataclasses import dataclass
 import json
-from pathlib import Path
-from typing import Dict
+from functools import lru_cache
 
-ADDRESSES_PATH = Path("data/addresses.json")
+from src.paths import DATA_DIR
 
-with ADDRESSES_PATH.open("r") as f:
-    addresses_data: dict = json.load(f)
+ADDRESSES_PATH = DATA_DIR / "addresses.json"
 
-MULTICALL_ADDRESSES = addresses_data["multicallAddress"]
+
+@lru_cache(maxsize=None)
+def get_addresses() -> dict:
+    with ADDRESSES_PATH.open("r") as f:
+        return json.load(f)
+
+
+def get_multicall_address(network: str) -> str:
+    return get_addresses()["multicallAddress"][network]
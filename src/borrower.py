@@ -1,4 +1,13 @@
-from typing import List, Dict, Optional
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+COLLATERAL = 0
+BORROW = 1
+
+INT64_MIN = -(2**63)
+INT64_MAX = 2**63 - 1
 
 
 class Borrower:
@@ -8,11 +17,35 @@ class Borrower:
         markets_in: List[str],
         borrow_balances: Dict[str, int],
         colletaral_balance: Dict[str, int],
+        block: Optional[int] = None,
     ):
         self.user_address = user_address
         self.markets_in = markets_in
         self.borrow_balances = borrow_balances
         self.colletaral_balance = colletaral_balance
+        # Block the balances were read at, when known
+        self.block = block
+
+    def to_dict(self) -> dict:
+        data = {
+            "user_address": self.user_address,
+            "markets_in": self.markets_in,
+            "borrow_balances": self.borrow_balances,
+            "colletaral_balance": self.colletaral_balance,
+        }
+        if self.block is not None:
+            data["block"] = self.block
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Borrower":
+        return cls(
+            user_address=data["user_address"],
+            markets_in=data["markets_in"],
+            borrow_balances=data["borrow_balances"],
+            colletaral_balance=data["colletaral_balance"],
+            block=data.get("block"),
+        )
 
     def _get_market_value(self, market: str, price: float) -> Dict[str, float]:
         borrow = self.borrow_balances[market] * price
@@ -26,7 +59,7 @@ class Borrower:
     def get_markets_values(self, prices: Dict[str, float]) -> List[Dict[str, float]]:
         return [
             self._get_market_value(market, prices[market])
-            for market in self.markets_in
+            for market in self.markets_in or []
             if (
                 market in prices
                 and market in self.borrow_balances
@@ -36,3 +69,231 @@ class Borrower:
                 and self.colletaral_balance.get(market) is not None
             )
         ]
+
+
+class BorrowerTable:
+    """Balances of many borrowers, stored column-wise by market.
+
+    Each balance is a float64 in base units, which is all valuation needs,
+    plus an int64 residual so the exact integer can be read back. Balances
+    whose residual does not fit in an int64 are kept in a side store of
+    Python ints. Unknown balances are NaN, and the markets each user entered
+    are a bitmask with one bit per market column.
+
+    Indexing by address returns a `Borrower` view of that row.
+    """
+
+    def __init__(self, markets: Iterable[str] = (), capacity: int = 256):
+        self.markets: List[str] = []
+        self.users: List[str] = []
+        self._market_index: Dict[str, int] = {}
+        self._user_index: Dict[str, int] = {}
+        self._values = np.full((2, capacity, 0), np.nan)
+        self._residuals = np.zeros((2, capacity, 0), dtype=np.int64)
+        self._entered = np.zeros((capacity, 0), dtype=np.uint64)
+        self._markets_known = np.zeros(capacity, dtype=bool)
+        self._blocks = np.full(capacity, -1, dtype=np.int64)
+        self._big: Dict[Tuple[int, int, int], int] = {}
+        for market in markets:
+            self._get_market_column(market)
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    def __contains__(self, user_address: str) -> bool:
+        return user_address in self._user_index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.users)
+
+    def __getitem__(self, user_address: str) -> Borrower:
+        row = self._user_index[user_address]
+        return self._get_borrower(row, self._entered_mask(row))
+
+    def _get_borrower(self, row: int, entered: np.ndarray) -> Borrower:
+        markets_in = None
+        balances: List[Dict[str, Optional[int]]] = [{}, {}]
+        if self._markets_known[row]:
+            columns = np.flatnonzero(entered)
+            markets_in = [self.markets[column] for column in columns]
+            for market, column in zip(markets_in, columns):
+                for kind in (COLLATERAL, BORROW):
+                    balances[kind][market] = self._get_balance(kind, row, column)
+        return Borrower(
+            self.users[row],
+            markets_in,
+            balances[BORROW],
+            balances[COLLATERAL],
+            self.get_block(self.users[row]),
+        )
+
+    def _get_market_column(self, market: str) -> int:
+        column = self._market_index.get(market)
+        if column is not None:
+            return column
+        column = self._market_index[market] = len(self.markets)
+        self.markets.append(market)
+        self._values = np.pad(
+            self._values, ((0, 0), (0, 0), (0, 1)), constant_values=np.nan
+        )
+        self._residuals = np.pad(self._residuals, ((0, 0), (0, 0), (0, 1)))
+        if column // 64 >= self._entered.shape[1]:
+            self._entered = np.pad(self._entered, ((0, 0), (0, 1)))
+        return column
+
+    def _get_user_row(self, user_address: str) -> int:
+        row = self._user_index.get(user_address)
+        if row is not None:
+            self._clear_row(row)
+            return row
+        row = self._user_index[user_address] = len(self.users)
+        self.users.append(user_address)
+        capacity = max(self._markets_known.shape[0], 1)
+        if row >= self._markets_known.shape[0]:
+            self._values = np.pad(
+                self._values, ((0, 0), (0, capacity), (0, 0)), constant_values=np.nan
+            )
+            self._residuals = np.pad(self._residuals, ((0, 0), (0, capacity), (0, 0)))
+            self._entered = np.pad(self._entered, ((0, capacity), (0, 0)))
+            self._markets_known = np.pad(self._markets_known, (0, capacity))
+            self._blocks = np.pad(self._blocks, (0, capacity), constant_values=-1)
+        return row
+
+    def _clear_row(self, row: int):
+        self._values[:, row] = np.nan
+        self._residuals[:, row] = 0
+        self._entered[row] = 0
+        self._markets_known[row] = False
+        self._blocks[row] = -1
+        if not self._big:
+            return
+        for column in range(len(self.markets)):
+            for kind in (COLLATERAL, BORROW):
+                self._big.pop((kind, row, column), None)
+
+    def _set_balance(self, kind: int, row: int, column: int, balance: Optional[int]):
+        if balance is None:
+            return
+        try:
+            value = float(balance)
+            residual = balance - int(value)
+        except OverflowError:
+            value, residual = np.inf, None
+        self._values[kind, row, column] = value
+        if residual is not None and INT64_MIN <= residual <= INT64_MAX:
+            self._residuals[kind, row, column] = residual
+        else:
+            self._big[(kind, row, column)] = balance
+
+    def _get_balance(self, kind: int, row: int, column: int) -> Optional[int]:
+        big = self._big.get((kind, row, column))
+        if big is not None:
+            return big
+        value = self._values[kind, row, column]
+        if np.isnan(value):
+            return None
+        return int(value) + int(self._residuals[kind, row, column])
+
+    def add(
+        self,
+        user_address: str,
+        markets_in: Optional[List[str]],
+        borrow_balances: Dict[str, Optional[int]],
+        colletaral_balance: Dict[str, Optional[int]],
+        block: Optional[int] = None,
+    ):
+        """Sets the row of a user, replacing any previous one."""
+        columns = [self._get_market_column(market) for market in markets_in or []]
+        row = self._get_user_row(user_address)
+        self._markets_known[row] = markets_in is not None
+        if block is not None:
+            self._blocks[row] = block
+        for market, column in zip(markets_in or [], columns):
+            self._entered[row, column // 64] |= np.uint64(1 << (column % 64))
+            self._set_balance(BORROW, row, column, borrow_balances.get(market))
+            self._set_balance(COLLATERAL, row, column, colletaral_balance.get(market))
+
+    def add_borrower(self, borrower: Borrower):
+        self.add(
+            borrower.user_address,
+            borrower.markets_in,
+            borrower.borrow_balances,
+            borrower.colletaral_balance,
+            borrower.block,
+        )
+
+    def get_block(self, user_address: str) -> Optional[int]:
+        """Block the balances of a user were read at, if known."""
+        block = int(self._blocks[self._user_index[user_address]])
+        return block if block >= 0 else None
+
+    def update(self, other: "BorrowerTable"):
+        for user_address in other:
+            self.add_borrower(other[user_address])
+
+    def _entered_mask(self, rows=slice(None)) -> np.ndarray:
+        """Entered markets as booleans, for a row or a slice of rows."""
+        columns = np.arange(len(self.markets))
+        words = self._entered[: len(self.users)][rows][..., columns // 64]
+        bits = (words >> (columns % 64).astype(np.uint64)) & np.uint64(1)
+        return bits.astype(bool)
+
+    def get_usd_values(
+        self, prices: Dict[str, float]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """USD collateral and debt of every user in every market, as
+        `(collateral, debt, valid)` arrays of shape (users, markets).
+
+        `valid` marks the entries `Borrower.get_markets_values` would export:
+        entered markets with a nonzero price and both balances known.
+        """
+        n_users = len(self.users)
+        price_vector = np.array([prices.get(m, np.nan) for m in self.markets])
+        collateral = self._values[COLLATERAL, :n_users] * price_vector / 1e18
+        debt = self._values[BORROW, :n_users] * price_vector / 1e18
+        valid = (
+            self._entered_mask()
+            & (np.nan_to_num(price_vector) != 0)
+            & ~np.isnan(self._values[COLLATERAL, :n_users])
+            & ~np.isnan(self._values[BORROW, :n_users])
+        )
+        return collateral, debt, valid
+
+    def iter_markets_values(
+        self, prices: Dict[str, float], users: Optional[Iterable[str]] = None
+    ) -> Iterator[Tuple[str, List[Dict[str, float]]]]:
+        """Yields `(user, markets values)` like `Borrower.get_markets_values`,
+        with markets in column order, for `users` or every user in the table."""
+        collateral, debt, valid = self.get_usd_values(prices)
+        users = self.users if users is None else list(users)
+        rows = np.array([self._user_index[u] for u in users], dtype=np.int64)
+        # Gather every exported entry at once, then split them by user
+        user_positions, columns = np.nonzero(valid[rows])
+        entries = zip(
+            [self.markets[column] for column in columns],
+            collateral[rows[user_positions], columns].tolist(),
+            debt[rows[user_positions], columns].tolist(),
+        )
+        counts = np.bincount(user_positions, minlength=len(users)).tolist()
+        for user_address, count in zip(users, counts):
+            yield user_address, [
+                {"market": market, "collateral": c, "debt": d}
+                for market, c, d in islice(entries, count)
+            ]
+
+    def to_dict(self, users: Optional[Iterable[str]] = None) -> Dict[str, dict]:
+        """Rows by address, of `users` or of every user in the table."""
+        if users is None:
+            entered = self._entered_mask()
+            return {
+                user_address: self._get_borrower(row, entered[row]).to_dict()
+                for row, user_address in enumerate(self.users)
+            }
+        return {user_address: self[user_address].to_dict() for user_address in users}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, dict]) -> "BorrowerTable":
+        table = cls(capacity=max(len(data), 1))
+        for borrower_data in data.values():
+            table.add_borrower(Borrower.from_dict(borrower_data))
+        return table
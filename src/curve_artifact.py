@@ -0,0 +1,126 @@
+import json
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from src.paths import DATA_DIR
+
+CURVE_ARTIFACT_PATH = DATA_DIR / "cached_curves" / "curves.bin"
+# Same curves, simplified to a bounded error, for clients pulling whole curves
+COMPACT_CURVE_ARTIFACT_PATH = CURVE_ARTIFACT_PATH.parent / "compact" / "curves.bin"
+
+MAGIC = b"NADIRCRV"
+VERSION = 1
+CURVE_COLUMNS = (
+    "price_change",
+    "total_liquidation",
+    "liquidation_slippage",
+    "equilibrium_price",
+)
+# Columns every artifact has, including those written before the others
+REQUIRED_COLUMNS = CURVE_COLUMNS[:3]
+# Magic, format version and size of the JSON index that follows
+HEADER = struct.Struct("<8sII")
+ALIGNMENT = 64
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_curve_artifact(
+    curves: Mapping[str, Mapping[str, np.ndarray]],
+    path: Path = CURVE_ARTIFACT_PATH,
+    metadata: Optional[dict] = None,
+):
+    """Publishes `curves`, by asset, as one binary artifact.
+
+    The file starts with a header and a JSON index of the curves, followed by
+    one little-endian float64 block of shape (columns, points) per curve,
+    sorted by price change. It is written next to `path` and renamed over
+    it, so readers see either the previous artifact or the complete new one.
+    """
+    blocks: List[np.ndarray] = []
+    entries = []
+    offset = 0
+    for asset, curve in sorted(curves.items()):
+        block = np.stack(
+            [np.asarray(curve[column], dtype="<f8") for column in CURVE_COLUMNS]
+        )
+        block = block[:, np.argsort(block[0], kind="stable")]
+        entries.append(
+            {"asset": asset.lower(), "offset": offset, "points": block.shape[1]}
+        )
+        blocks.append(block)
+        offset = _align(offset + block.nbytes)
+    index = json.dumps(
+        {"columns": CURVE_COLUMNS, "curves": entries, "metadata": metadata or {}}
+    ).encode()
+    data_start = _align(HEADER.size + len(index))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    with tmp_path.open("wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(index)))
+        f.write(index)
+        for entry, block in zip(entries, blocks):
+            f.seek(data_start + entry["offset"])
+            f.write(block.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class CurveArtifact:
+    """Read-only, memory-mapped curve artifact.
+
+    Curves are numpy views on the mapping, so processes reading the same
+    artifact share the page-cached file instead of holding their own copies.
+    A published replacement does not affect an artifact already open.
+    """
+
+    def __init__(self, path: Path = CURVE_ARTIFACT_PATH):
+        self.path = path
+        with path.open("rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size:
+            raise ValueError(f"{path} is not a curve artifact")
+        magic, version, index_size = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a curve artifact")
+        if version != VERSION:
+            raise ValueError(f"Unsupported curve artifact version {version}")
+        index = json.loads(self._map[HEADER.size : HEADER.size + index_size])
+        self.columns: Tuple[str, ...] = tuple(index["columns"])
+        if not set(REQUIRED_COLUMNS) <= set(self.columns):
+            raise ValueError(f"Curve columns {self.columns} are incomplete")
+        self.metadata: dict = index["metadata"]
+        self._data_start = _align(HEADER.size + index_size)
+        self._entries: Dict[str, dict] = {e["asset"]: e for e in index["curves"]}
+        for entry in self._entries.values():
+            end = self._data_start + entry["offset"] + self._block_size(entry)
+            if end > len(self._map):
+                raise ValueError(f"Curve {entry['asset']} of {path} is truncated")
+
+    def _block_size(self, entry: dict) -> int:
+        return len(self.columns) * entry["points"] * 8
+
+    @property
+    def assets(self) -> List[str]:
+        return sorted(self._entries)
+
+    def get(self, asset: str) -> Optional[np.ndarray]:
+        """The (columns, points) block of `asset`, in `columns` order."""
+        entry = self._entries.get(asset.lower())
+        if entry is None:
+            return None
+        return np.frombuffer(
+            self._map,
+            dtype="<f8",
+            count=len(self.columns) * entry["points"],
+            offset=self._data_start + entry["offset"],
+        ).reshape(len(self.columns), entry["points"])
@@ -0,0 +1,132 @@
+import sqlite3
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.curve_artifact import CURVE_COLUMNS
+from src.paths import DATA_DIR
+
+CURVE_HISTORY_PATH = DATA_DIR / "history" / "curves.sqlite"
+
+
+@dataclass(frozen=True)
+class CurveSnapshot:
+    asset: str
+    block: Optional[int]
+    timestamp: int
+    columns: Tuple[str, ...]
+    # Shape (columns, points), sorted by price change
+    data: np.ndarray
+
+    def get(self, column: str) -> Optional[np.ndarray]:
+        if column not in self.columns:
+            return None
+        return self.data[self.columns.index(column)]
+
+
+class CurveHistory:
+    """Append-only store of curve snapshots, keyed by asset, snapshot block
+    and timestamp.
+
+    Each snapshot is one SQLite row holding the curve as a float64 blob.
+    Snapshots are indexed by (asset, timestamp) and (asset, block), so a
+    point-in-time lookup is one index seek and a time range one index scan.
+    Safe to share between threads; separate processes can open the same file.
+    """
+
+    def __init__(self, path: Path = CURVE_HISTORY_PATH):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(
+            str(path), check_same_thread=False, isolation_level=None, timeout=30.0
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots ("
+            "asset TEXT NOT NULL, block INTEGER, timestamp INTEGER NOT NULL, "
+            "columns TEXT NOT NULL, points INTEGER NOT NULL, data BLOB NOT NULL, "
+            "UNIQUE (asset, timestamp))"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS snapshots_block ON snapshots (asset, block)"
+        )
+        self._lock = threading.Lock()
+
+    def append(
+        self,
+        asset: str,
+        block: Optional[int],
+        timestamp: int,
+        curve: Mapping[str, np.ndarray],
+        columns: Sequence[str] = CURVE_COLUMNS,
+    ) -> bool:
+        """Stores a snapshot, unless `asset` already has one at `timestamp`.
+        Returns whether it was stored."""
+        data = np.stack([np.asarray(curve[c], dtype="<f8") for c in columns])
+        data = data[:, np.argsort(data[0], kind="stable")]
+        with self._lock:
+            cursor = self._connection.execute(
+                "INSERT OR IGNORE INTO snapshots VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    asset.lower(),
+                    block,
+                    int(timestamp),
+                    ",".join(columns),
+                    data.shape[1],
+                    data.tobytes(),
+                ),
+            )
+        return cursor.rowcount == 1
+
+    @staticmethod
+    def _to_snapshot(row: tuple) -> CurveSnapshot:
+        asset, block, timestamp, columns, points, data = row
+        columns = tuple(columns.split(","))
+        return CurveSnapshot(
+            asset=asset,
+            block=block,
+            timestamp=timestamp,
+            columns=columns,
+            data=np.frombuffer(data, dtype="<f8").reshape(len(columns), points),
+        )
+
+    def at(
+        self,
+        asset: str,
+        block: Optional[int] = None,
+        timestamp: Optional[int] = None,
+    ) -> Optional[CurveSnapshot]:
+        """The latest snapshot at or before `block`, or else `timestamp`, or
+        the latest one when neither is given."""
+        if block is not None:
+            condition, value, order = "block <= ?", block, "block"
+        elif timestamp is not None:
+            condition, value, order = "timestamp <= ?", timestamp, "timestamp"
+        else:
+            condition, value, order = "1", None, "timestamp"
+        params = (asset.lower(),) + ((value,) if value is not None else ())
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT * FROM snapshots WHERE asset = ? AND {condition} "
+                f"ORDER BY {order} DESC LIMIT 1",
+                params,
+            ).fetchone()
+        return self._to_snapshot(row) if row is not None else None
+
+    def range(
+        self, asset: str, start: int, end: int, limit: Optional[int] = None
+    ) -> List[CurveSnapshot]:
+        """Snapshots with `start <= timestamp <= end`, oldest first."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT * FROM snapshots WHERE asset = ? AND timestamp BETWEEN ? AND ? "
+                "ORDER BY timestamp LIMIT ?",
+                (asset.lower(), start, end, -1 if limit is None else limit),
+            ).fetchall()
+        return [self._to_snapshot(row) for row in rows]
+
+    def close(self):
+        self._connection.close()
@@ -0,0 +1,49 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+from web3 import Web3
+
+
+class AddressSet:
+    """Insertion-ordered set of addresses stored as raw 20-byte keys.
+
+    Membership and insertion are O(1), and addresses are only checksummed
+    when they are read back out with `to_checksum_list`. Addresses can be
+    given as hex strings or as the raw 20 bytes, as decoded from logs.
+    """
+
+    def __init__(self, addresses: Iterable[str] = ()):
+        self._addresses: Dict[bytes, None] = {}
+        for address in addresses:
+            self.add(address)
+
+    @staticmethod
+    def _key(address: Union[str, bytes]) -> bytes:
+        if isinstance(address, bytes):
+            return address
+        return bytes.fromhex(address[2:] if address[:2] in ("0x", "0X") else address)
+
+    def add(self, address: Union[str, bytes]) -> bool:
+        key = self._key(address)
+        if key in self._addresses:
+            return False
+        self._addresses[key] = None
+        return True
+
+    def discard(self, address: Union[str, bytes]):
+        self._addresses.pop(self._key(address), None)
+
+    def __contains__(self, address: Union[str, bytes]) -> bool:
+        return self._key(address) in self._addresses
+
+    def __len__(self) -> int:
+        return len(self._addresses)
+
+    def __iter__(self) -> Iterator[bytes]:
+        return iter(self._addresses)
+
+    def to_hex_list(self) -> List[str]:
+        return ["0x" + key.hex() for key in self._addresses]
+
+    def to_checksum_list(self, limit: Optional[int] = None) -> List[str]:
+        keys = list(self._addresses)[:limit]
+        return [Web3.toChecksumAddress(key) for key in keys]
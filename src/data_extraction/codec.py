@@ -0,0 +1,178 @@
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from eth_utils import function_signature_to_4byte_selector, to_checksum_address
+
+# Fixed call shapes used by the extractors, as (function name, signature)
+SELECTORS: Dict[str, bytes] = {
+    name: function_signature_to_4byte_selector(signature)
+    for name, signature in (
+        ("getAllMarkets", "getAllMarkets()"),
+        ("getAssetsIn", "getAssetsIn(address)"),
+        ("balanceOf", "balanceOf(address)"),
+        ("balanceOfUnderlying", "balanceOfUnderlying(address)"),
+        ("borrowBalanceStored", "borrowBalanceStored(address)"),
+        ("underlying", "underlying()"),
+        ("oracle", "oracle()"),
+        ("getUnderlyingPrice", "getUnderlyingPrice(address)"),
+        ("decimals", "decimals()"),
+        ("tryAggregate", "tryAggregate(bool,(address,bytes)[])"),
+        ("tryBlockAndAggregate", "tryBlockAndAggregate(bool,(address,bytes)[])"),
+    )
+}
+
+ADDRESS_PADDING = bytes(12)
+
+
+def _word(value: int) -> bytes:
+    return value.to_bytes(32, "big")
+
+
+@lru_cache(maxsize=4096)
+def _checksum(raw_address: bytes) -> str:
+    return to_checksum_address(raw_address)
+
+
+def encode_address_call(fn_name: str, address: str) -> bytes:
+    """Calldata for a function taking a single address argument."""
+    return SELECTORS[fn_name] + ADDRESS_PADDING + bytes.fromhex(address[2:])
+
+
+def encode_address_calls(fn_name: str, addresses: Iterable[str]) -> List[bytes]:
+    prefix = SELECTORS[fn_name] + ADDRESS_PADDING
+    return [prefix + bytes.fromhex(address[2:]) for address in addresses]
+
+
+def decode_uint256(data: bytes) -> int:
+    if len(data) < 32:
+        raise ValueError(f"Cannot decode uint256 from {len(data)} bytes")
+    return int.from_bytes(data[:32], "big")
+
+
+def decode_uint256_results(
+    results: Iterable[Tuple[bool, bytes]],
+) -> List[Optional[int]]:
+    """Decodes `tryAggregate` results, mapping failed calls to None."""
+    return [
+        int.from_bytes(data[:32], "big") if success and len(data) >= 32 else None
+        for success, data in results
+    ]
+
+
+def decode_address(data: bytes) -> str:
+    if len(data) < 32:
+        raise ValueError(f"Cannot decode address from {len(data)} bytes")
+    return _checksum(data[12:32])
+
+
+def decode_address_array(data: bytes) -> List[str]:
+    """Decodes a lone `address[]` return value into checksummed addresses."""
+    offset = int.from_bytes(data[:32], "big")
+    length = int.from_bytes(data[offset : offset + 32], "big")
+    start = offset + 32
+    if len(data) < start + 32 * length:
+        raise ValueError("Truncated address[] return data")
+    return [
+        _checksum(data[start + 32 * i + 12 : start + 32 * (i + 1)])
+        for i in range(length)
+    ]
+
+
+def encode_try_aggregate(
+    calls: Sequence[Tuple[str, bytes]],
+    require_success: bool = False,
+    fn_name: str = "tryAggregate",
+) -> bytes:
+    """Calldata for `tryAggregate(bool,(address,bytes)[])`, or for
+    `tryBlockAndAggregate`, which takes the same arguments."""
+    heads = []
+    tails = []
+    tail_offset = 32 * len(calls)
+    for target, call_data in calls:
+        padding = bytes(-len(call_data) % 32)
+        tail = (
+            ADDRESS_PADDING
+            + bytes.fromhex(target[2:])
+            + _word(64)
+            + _word(len(call_data))
+            + call_data
+            + padding
+        )
+        heads.append(_word(tail_offset))
+        tails.append(tail)
+        tail_offset += len(tail)
+    return b"".join(
+        [
+            SELECTORS[fn_name],
+            _word(int(require_success)),
+            _word(64),
+            _word(len(calls)),
+            *heads,
+            *tails,
+        ]
+    )
+
+
+def decode_try_aggregate(data: bytes) -> List[Tuple[bool, bytes]]:
+    """Decodes the `(bool,bytes)[]` returned by `tryAggregate`."""
+    return _decode_call_results(data, int.from_bytes(data[:32], "big"))
+
+
+def decode_try_block_and_aggregate(
+    data: bytes,
+) -> Tuple[int, bytes, List[Tuple[bool, bytes]]]:
+    """Decodes the `(uint256,bytes32,(bool,bytes)[])` returned by
+    `tryBlockAndAggregate` into block number, block hash and results."""
+    if len(data) < 96:
+        raise ValueError(f"Cannot decode tryBlockAndAggregate from {len(data)} bytes")
+    block_number = int.from_bytes(data[:32], "big")
+    results = _decode_call_results(data, int.from_bytes(data[64:96], "big"))
+    return block_number, data[32:64], results
+
+
+def _decode_call_results(data: bytes, offset: int) -> List[Tuple[bool, bytes]]:
+    length = int.from_bytes(data[offset : offset + 32], "big")
+    start = offset + 32
+    results = []
+    for i in range(length):
+        element = start + int.from_bytes(
+            data[start + 32 * i : start + 32 * (i + 1)], "big"
+        )
+        success = data[element + 31] != 0
+        data_start = element + int.from_bytes(data[element + 32 : element + 64], "big")
+        data_length = int.from_bytes(data[data_start : data_start + 32], "big")
+        results.append((success, data[data_start + 32 : data_start + 32 + data_length]))
+    return results
+
+
+# Where an event argument sits in a log: (True, topic index) when it is
+# indexed, else (False, word of the data)
+LogLocation = Tuple[bool, int]
+
+
+def get_log_locations(event_abi: dict, names: Sequence[str]) -> List[LogLocation]:
+    """Locations of the `names` arguments of an event. Every non-indexed
+    argument before them must be one word wide, like addresses and uints."""
+    locations: Dict[str, LogLocation] = {}
+    topic, word = 1, 0
+    for arg in event_abi["inputs"]:
+        if arg["indexed"]:
+            locations[arg["name"]], topic = (True, topic), topic + 1
+        else:
+            locations[arg["name"]], word = (False, word), word + 1
+    return [locations[name] for name in names]
+
+
+def decode_log_addresses(
+    topics: Sequence[bytes], data: bytes, locations: Sequence[LogLocation]
+) -> List[bytes]:
+    """Raw 20-byte addresses at `locations` of a log, leaving out those past
+    the end of a malformed log."""
+    addresses = []
+    for indexed, position in locations:
+        if indexed:
+            if position < len(topics) and len(topics[position]) == 32:
+                addresses.append(bytes(topics[position][12:]))
+        elif len(data) >= 32 * (position + 1):
+            addresses.append(data[32 * position + 12 : 32 * (position + 1)])
+    return addresses
@@ -1,16 +1,60 @@
-import json
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
-from typing import Dict, List, Optional
+from time import monotonic
+from typing import Callable, Dict, List, Optional, Tuple
 
-import eth_abi
+from eth_utils import event_abi_to_log_topic
 from src.abis import ABIS
-from src.addresses import MULTICALL_ADDRESSES
-from src.borrower import Borrower
+from src.addresses import get_multicall_address
+from src.borrower import BorrowerTable
+from src.data_extraction.address_set import AddressSet
+from src.data_extraction.codec import (
+    SELECTORS,
+    LogLocation,
+    decode_address,
+    decode_address_array,
+    decode_log_addresses,
+    decode_uint256_results,
+    encode_address_call,
+    encode_address_calls,
+    get_log_locations,
+)
+from src.data_extraction.extraction_state import ExtractionState
+from src.data_extraction.log_scanner import LogScanner
+from src.data_extraction.multicall import (
+    BlockIdentifier,
+    InconsistentBlockError,
+    try_aggregate,
+    try_block_and_aggregate,
+)
+from src.data_extraction.user_data_writer import UserDataWriter
+from src.oracle_prices import OraclePriceProvider
 from src.protocols_data import CompoundProtocolReference
-from src.token_prices import get_eth_price, get_token_price
+from src.token_prices import fetch_prices, get_eth_price
 from web3 import Web3
 from web3.eth import Contract
-from time import sleep
+
+# Market events that change the balances of the accounts in the given arguments
+MARKET_EVENT_ACCOUNTS = {
+    "Mint": ("minter",),
+    "Redeem": ("redeemer",),
+    "Borrow": ("borrower",),
+    "RepayBorrow": ("borrower",),
+    "LiquidateBorrow": ("borrower", "liquidator"),
+    "Transfer": ("from", "to"),
+}
+# Multicall calls per (user, market) balance: collateral and borrow
+CALLS_PER_BALANCE = 2
+# Comptroller events that change the markets an account has entered
+MEMBERSHIP_EVENTS = ("MarketEntered", "MarketExited")
+# A scanned event: its name and the raw addresses of its accounts
+AccountEvent = Tuple[str, List[bytes]]
+CHECKPOINT_INTERVAL = 60.0
+CHECKPOINT_BATCHES = 20
+# Blocks behind the head a "latest" run is pinned at, so every node behind a
+# load balancer already has the block and reorgs are unlikely to touch it
+CONFIRMATIONS = 10
 
 
 class CompoundDataExtractor:
@@ -19,10 +63,24 @@ class CompoundDataExtractor:
         w3: Web3,
         protocol_info: CompoundProtocolReference,
         network: str,
+        multicall_concurrency: int = 1,
+        log_scan_concurrency: int = 4,
+        price_source: str = "api",
+        block_identifier: BlockIdentifier = "latest",
     ):
         self.w3 = w3
         self.network = network
         self.protocol_info = protocol_info
+        self.multicall_concurrency = multicall_concurrency
+        self.log_scan_concurrency = log_scan_concurrency
+        self.price_source = price_source
+        self.block_identifier = block_identifier
+        self.snapshot_block: Optional[int] = None
+        self.snapshot_block_hash: Optional[bytes] = None
+        self.snapshot_timestamp: Optional[int] = None
+        # Calls inside user data multicalls: getAssetsIn and balance calls
+        self.calls_made = 0
+        self.calls_saved = 0
 
         self.ceth_addresses = protocol_info.ceth_addresses
         self.non_borrowable_markets = protocol_info.non_borrowable_markets
@@ -35,210 +93,413 @@ class CompoundDataExtractor:
             abi=ABIS.comptroller, address=protocol_info.comptroller_address
         )
         self.multicall: Contract = w3.eth.contract(
-            abi=ABIS.multicall, address=MULTICALL_ADDRESSES[network]
+            abi=ABIS.multicall, address=get_multicall_address(network)
         )
+        # Accounts are read straight from the log bytes, so scanning neither
+        # ABI-decodes nor checksums every event
+        self.membership_events: Dict[bytes, Tuple[str, List[LogLocation]]] = {
+            event_abi_to_log_topic(abi): (
+                abi["name"],
+                get_log_locations(abi, ("account",)),
+            )
+            for abi in ABIS.comptroller
+            if abi.get("type") == "event" and abi["name"] in MEMBERSHIP_EVENTS
+        }
+        self.market_events: Dict[bytes, Tuple[str, List[LogLocation]]] = {
+            event_abi_to_log_topic(abi): (
+                abi["name"],
+                get_log_locations(abi, MARKET_EVENT_ACCOUNTS[abi["name"]]),
+            )
+            for abi in ABIS.cToken
+            if abi.get("type") == "event" and abi["name"] in MARKET_EVENT_ACCOUNTS
+        }
 
     def _get_market_addresses(self) -> List[str]:
-        markets: List[str] = self.comptroller.functions["getAllMarkets"]().call()
+        markets: List[str] = self.comptroller.functions["getAllMarkets"]().call(
+            block_identifier=self.snapshot_block
+        )
         return [self.w3.toChecksumAddress(address) for address in markets]
 
-    def _get_market_token_price(self, market_address: str) -> float:
-        ctoken: Contract = self.w3.eth.contract(abi=ABIS.cToken, address=market_address)
+    def _get_market_prices(self, markets: List[str]) -> Dict[str, float]:
+        if self.price_source == "oracle":
+            return OraclePriceProvider(
+                self.w3, self.network, self.snapshot_block
+            ).get_compound_prices(self.comptroller.address, markets)
 
-        if market_address in self.ceth_addresses:
-            symbol, price = get_eth_price(self.network)
-            balance = self.w3.eth.get_balance(market_address)
-        else:
-            underlying: str = ctoken.functions["underlying"]().call()
-            symbol, price = get_token_price(self.network, underlying, self.w3)
-            token: Contract = self.w3.eth.contract(abi=ABIS.cToken, address=underlying)
-            balance = token.functions["balanceOf"](market_address).call()
+        token_markets = [m for m in markets if m not in self.ceth_addresses]
+        underlying_results = self._try_aggregate(
+            [(market, SELECTORS["underlying"]) for market in token_markets]
+        )
+        underlyings = {
+            market: decode_address(data)
+            for market, (success, data) in zip(token_markets, underlying_results)
+            if success
+        }
+        token_prices = fetch_prices(self.network, list(underlyings.values()))
+
+        prices = {}
+        for market in markets:
+            if market in self.ceth_addresses:
+                _, prices[market] = get_eth_price(self.network)
+            elif market in underlyings:
+                prices[market] = token_prices[underlyings[market]]
+            else:
+                print(f"Failed to get underlying of market {market}")
+                prices[market] = 0.0
 
         # TODO: if price == 0, get fallback price
-        return price
+        return prices
+
+    def extract_data(
+        self,
+        save_to: str,
+        users_limit: Optional[int] = None,
+        state: Optional[ExtractionState] = None,
+    ) -> int:
+        """Extracts every borrower to `save_to` and returns how many were
+        written."""
+        state = state if state is not None else ExtractionState()
+
+        # Every read of the run happens at one block
+        self._pin_block()
 
-    def extract_data(self, save_to: str, users_limit: Optional[int] = None):
         # Get markets token prices
         markets = self._get_market_addresses()
-        prices = {m: self._get_market_token_price(m) for m in markets}
+        prices = self._get_market_prices(markets)
 
-        # Get all users
-        user_addresses = self._get_all_user_addresses(users_limit)
+        # Get new users, and known users whose balances changed since last run
+        self._scan_users(state, markets, users_limit)
 
-        # Get user data
-        user_data = self._get_users_data(markets, user_addresses, self.multicall_size)
+        # The run's block: events are scanned through it, and prices and
+        # refreshed balances are read at it. Users that did not need a refresh
+        # keep the block of their last one, on their line
+        metadata = {
+            "network": self.network,
+            "block": self.snapshot_block,
+            "blockHash": Web3.toHex(self.snapshot_block_hash),
+            "timestamp": self.snapshot_timestamp,
+        }
+        with UserDataWriter(Path(save_to), metadata) as writer:
+            # Get user data, exporting each chunk as soon as it is refreshed
+            def export(user_data: BorrowerTable):
+                for address, values in user_data.iter_markets_values(prices):
+                    writer.write(address, values, self.snapshot_block)
+                writer.flush()
 
-        # Export user data
-        user_data_json = {k: v.get_markets_values(prices) for k, v in user_data.items()}
-        with Path(save_to).open("w") as f:
-            json.dump(user_data_json, f)
+            refreshed = self._refresh_users_data(state, markets, users_limit, export)
 
-    def _get_events_with_retry(
-        self,
-        from_block: int,
-        to_block_int,
-        num_retries: int = 10,
-        wait_time: float = 5.0,
-    ) -> List[Dict]:
-        for _ in range(num_retries):
-            try:
-                events: List[dict] = (
-                    self.comptroller.events["MarketEntered"]
-                    .createFilter(fromBlock=from_block, toBlock=to_block_int)
-                    .get_all_entries()
-                )
-                return events
-            except Exception as e:
-                print(f"Exception: {e}")
-                print(f"Retrying in {wait_time} seconds")
-                sleep(wait_time)
-        print(f"FAILED to get events from block {from_block} to {to_block_int}")
-        return []
-
-    def _get_all_user_addresses(self, limit: Optional[int] = None) -> List[str]:
-        current_block = self.w3.eth.get_block_number() - 10
-        user_addresses = []
+            # Export the users whose snapshot did not need a refresh. Stored
+            # balances are already keyed by checksummed address
+            selected = (
+                AddressSet(islice(state.borrowers, users_limit))
+                if users_limit is not None
+                else state.borrowers
+            )
+            snapshot_users = [
+                address
+                for address in state.balances
+                if address in selected and address not in refreshed
+            ]
+            for address, values in state.balances.iter_markets_values(
+                prices, snapshot_users
+            ):
+                writer.write(address, values, state.balances.get_block(address))
+            writer.flush()
+
+            self._verify_block_hash()
+
+        state.snapshot_block = self.snapshot_block
+        state.save()
+
+        print(
+            f"User data calls made: {self.calls_made}, "
+            f"saved by skipping non-entered markets: {self.calls_saved}"
+        )
+        return writer.users_written
+
+    @staticmethod
+    def _decode_logs(
+        logs: List[Dict], events: Dict[bytes, Tuple[str, List[LogLocation]]]
+    ) -> List[AccountEvent]:
+        decoded = []
+        for log in logs:
+            topics = [bytes(topic) for topic in log["topics"]]
+            data = log["data"]
+            data = bytes.fromhex(data[2:]) if isinstance(data, str) else bytes(data)
+            name, locations = events[topics[0]]
+            decoded.append((name, decode_log_addresses(topics, data, locations)))
+        return decoded
+
+    def _get_membership_events(
+        self, from_block: int, to_block: int, entered_only: bool = False
+    ) -> List[AccountEvent]:
+        events = {
+            topic: event
+            for topic, event in self.membership_events.items()
+            if not entered_only or event[0] == "MarketEntered"
+        }
+        logs = self.w3.eth.get_logs(
+            {
+                "address": self.comptroller.address,
+                "topics": [[Web3.toHex(topic) for topic in events]],
+                "fromBlock": from_block,
+                "toBlock": to_block,
+            }
+        )
+        return self._decode_logs(logs, events)
+
+    def _get_market_events(
+        self, markets: List[str], from_block: int, to_block: int
+    ) -> List[AccountEvent]:
+        logs = self.w3.eth.get_logs(
+            {
+                "address": markets,
+                "topics": [[Web3.toHex(topic) for topic in self.market_events]],
+                "fromBlock": from_block,
+                "toBlock": to_block,
+            }
+        )
+        return self._decode_logs(logs, self.market_events)
+
+    def _scan_users(
+        self, state: ExtractionState, markets: List[str], limit: Optional[int] = None
+    ):
+        current_block = self.snapshot_block
+        from_block = (
+            self.deploy_block
+            if state.last_scanned_block is None
+            else state.last_scanned_block + 1
+        )
+        # On the first run every user gets refreshed anyway
+        track_touched = state.last_scanned_block is not None
         print(f"Current block is: {current_block}")
-        print(f"Deploy block is: {self.deploy_block}")
-        for block in range(self.deploy_block, current_block, self.block_step_in_init):
-            print(f"Collect users at block {block}")
-            end_block = (
-                current_block
-                if (block + self.block_step_in_init > current_block)
-                else block + self.block_step_in_init
+        print(f"Scanning from block: {from_block}")
+
+        def get_events(from_block: int, to_block: int) -> List[AccountEvent]:
+            events = self._get_membership_events(
+                from_block, to_block, entered_only=not track_touched
             )
-            events = self._get_events_with_retry(block, end_block)
-            for event in events:
-                account: Optional[str] = event.get("args", {}).get("account", None)
-                if account is not None:
-                    account = self.w3.toChecksumAddress(account)
-                    if account not in user_addresses:
-                        user_addresses.append(account)
+            if track_touched:
+                events += self._get_market_events(markets, from_block, to_block)
+            return events
+
+        scanner = LogScanner(
+            get_events,
+            initial_step=self.block_step_in_init,
+            max_workers=self.log_scan_concurrency,
+        )
+        last_checkpoint = monotonic()
+        for from_block, to_block, events in scanner.scan(from_block, current_block):
+            print(f"Collected users at blocks {from_block}-{to_block}")
+            for name, accounts in events:
+                if name in MEMBERSHIP_EVENTS:
+                    # Known borrowers entering or exiting a market change their
+                    # markets, and maybe their balances, so they are refreshed too
+                    for account in accounts:
+                        if name == "MarketEntered":
+                            state.borrowers.add(account)
+                        if account in state.borrowers:
+                            state.pending_refresh.add(account)
+                    continue
+                for account in accounts:
+                    if account in state.borrowers:
+                        state.pending_refresh.add(account)
+
+            state.last_scanned_block = to_block
+            if monotonic() - last_checkpoint > CHECKPOINT_INTERVAL:
+                state.save()
+                last_checkpoint = monotonic()
 
-                if limit is not None:
-                    if len(user_addresses) >= limit:
-                        return user_addresses[:limit]
+            if limit is not None and len(state.borrowers) >= limit:
+                break
 
-        return user_addresses
+        state.save()
+
+    def _refresh_users_data(
+        self,
+        state: ExtractionState,
+        markets: List[str],
+        limit: Optional[int] = None,
+        on_chunk: Optional[Callable[[BorrowerTable], None]] = None,
+    ) -> AddressSet:
+        pending = list(state.pending_refresh)
+        if limit is not None:
+            selected = AddressSet(islice(state.borrowers, limit))
+            pending = [key for key in pending if key in selected]
+        # Only the users being refreshed, and so written, are checksummed
+        user_addresses = [Web3.toChecksumAddress(key) for key in pending]
+        print(f"Refreshing {len(user_addresses)} of {len(state.borrowers)} users")
+
+        chunk_size = self.multicall_size * CHECKPOINT_BATCHES
+        for i in range(0, len(user_addresses), chunk_size):
+            chunk = user_addresses[i : i + chunk_size]
+            user_data = self._get_users_data(markets, chunk, self.multicall_size)
+            state.update_balances(user_data)
+            for address in chunk:
+                state.pending_refresh.discard(address)
+            state.save()
+            if on_chunk is not None:
+                on_chunk(user_data)
+
+        return AddressSet(user_addresses)
+
+    def _map_multicalls(self, fn: Callable, items: list) -> list:
+        if self.multicall_concurrency <= 1:
+            return [fn(item) for item in items]
+
+        # Up to `multicall_concurrency` multicalls are in flight at once; map
+        # yields results in submission order so the merged output does not
+        # depend on which request returns first
+        with ThreadPoolExecutor(max_workers=self.multicall_concurrency) as executor:
+            return list(executor.map(fn, items))
 
     def _get_users_data(
         self, markets: List[str], user_addresses: List[str], batch_size: int
-    ):
-        user_data: Dict[str, Borrower] = {}
-        for i in range(0, len(user_addresses), batch_size):
-            print(f"Updating users info: {i} / {len(user_addresses)}")
-            batch_addresses = user_addresses[i : i + batch_size]
-            batch_users_data = self._get_users_data_batch(markets, batch_addresses)
-            user_data.update(batch_users_data)
-
-        return user_data
-
-    def _get_users_data_batch(
-        self, markets: list[str], user_addresses: List[str]
-    ) -> Dict[str, Borrower]:
-        asset_in_calls = [
-            {
-                "target": self.comptroller.address,
-                "callData": self.comptroller.encodeABI(
-                    fn_name="getAssetsIn", args=[address]
-                ),
-            }
-            for address in user_addresses
+    ) -> BorrowerTable:
+        # Phase 1: markets entered by each user
+        user_batches = [
+            user_addresses[i : i + batch_size]
+            for i in range(0, len(user_addresses), batch_size)
         ]
+        print(f"Updating markets of {len(user_addresses)} users")
+        assets_in: Dict[str, Optional[List[str]]] = {}
+        for batch_assets_in in self._map_multicalls(
+            self._get_assets_in_batch, user_batches
+        ):
+            assets_in.update(batch_assets_in)
 
-        asset_in_result = self.multicall.functions["tryAggregate"](
-            False, asset_in_calls
-        ).call()
-        ctoken = self.w3.eth.contract(abi=ABIS.cToken)
+        # Phase 2: balances, only for markets each user has entered. Calls are
+        # packed by count, with the same per-multicall budget as the
+        # `batch_size * len(markets)` calls of a full batch
+        balance_calls = [
+            (user_address, market)
+            for user_address in user_addresses
+            for market in (assets_in[user_address] or [])
+            if market in markets
+        ]
+        balances_per_multicall = max(1, batch_size * len(markets) // CALLS_PER_BALANCE)
+        call_batches = [
+            balance_calls[i : i + balances_per_multicall]
+            for i in range(0, len(balance_calls), balances_per_multicall)
+        ]
+        print(f"Updating {len(balance_calls)} balances of {len(user_addresses)} users")
+        balances: Dict[Tuple[str, str], Tuple[Optional[int], Optional[int]]] = {}
+        for batch_balances in self._map_multicalls(
+            self._get_balances_batch, call_batches
+        ):
+            balances.update(batch_balances)
 
-        collateral_balance_calls = []
-        borrow_balance_calls = []
+        # Every user market used to get its balance calls
+        skipped = len(user_addresses) * len(markets) - len(balance_calls)
+        self.calls_made += len(user_addresses) + len(balance_calls) * CALLS_PER_BALANCE
+        self.calls_saved += skipped * CALLS_PER_BALANCE
 
+        users_data = BorrowerTable(markets, capacity=len(user_addresses))
         for user_address in user_addresses:
-            for market in markets:
-                collateral_balance_calls.append(
-                    {
-                        "target": market,
-                        "callData": (
-                            ctoken.encodeABI(
-                                fn_name="balanceOfUnderlying", args=[user_address]
-                            )
-                            if market not in self.non_supplyable_markets
-                            else ctoken.encodeABI(
-                                fn_name="balanceOf", args=[user_address]
-                            )
-                        ),
-                    }
-                )
-                borrow_balance_calls.append(
-                    {
-                        "target": market,
-                        "callData": (
-                            ctoken.encodeABI(
-                                fn_name="borrowBalanceStored", args=[user_address]
-                            )
-                            if market not in self.non_borrowable_markets
-                            else ctoken.encodeABI(
-                                fn_name="balanceOf", args=[user_address]
-                            )
-                        ),
-                    }
-                )
-
-        collateral_balance_results = self.multicall.functions["tryAggregate"](
-            False, collateral_balance_calls
-        ).call()
-        borrow_balance_results = self.multicall.functions["tryAggregate"](
-            False, borrow_balance_calls
-        ).call()
-
-        user_index = 0
-        global_index = 0
-        users_data = {}
-        for user_address in user_addresses:
-            success = True
-            success = success and asset_in_result[user_index][0]
-            asset_in: Optional[str] = (
-                eth_abi.decode_single("(address[])", asset_in_result[user_index][1])[0]
-                if success
-                else None
-            )
-            if asset_in is not None:
-                asset_in = [self.w3.toChecksumAddress(a) for a in asset_in]
-            user_index += 1
-
             borrow_balances = {}
             collateral_balances = {}
+            for market in assets_in[user_address] or []:
+                if (user_address, market) in balances:
+                    collateral, borrow = balances[(user_address, market)]
+                    collateral_balances[market] = collateral
+                    borrow_balances[market] = borrow
 
-            for market in markets:
-                success = success and collateral_balance_results[global_index][0]
-                success = success and borrow_balance_results[global_index][0]
-                collateral_balance = (
-                    eth_abi.decode_single(
-                        "(uint256)", collateral_balance_results[global_index][1]
-                    )[0]
-                    if success
-                    else None
-                )
-                borrow_balance = (
-                    eth_abi.decode_single(
-                        "(uint256)", borrow_balance_results[global_index][1]
-                    )[0]
-                    if success
-                    else None
-                )
-
-                collateral_balances[market] = collateral_balance
-                borrow_balances[market] = borrow_balance
-
-                global_index += 1
-
-            user_data = Borrower(
+            users_data.add(
                 user_address,
-                asset_in,
+                assets_in[user_address],
                 borrow_balances,
                 collateral_balances,
+                self.snapshot_block,
             )
-            users_data[user_address] = user_data
 
         return users_data
+
+    def _pin_block(self) -> int:
+        if isinstance(self.block_identifier, int):
+            self.snapshot_block = self.block_identifier
+        else:
+            self.snapshot_block = self.w3.eth.get_block_number() - CONFIRMATIONS
+        block = self.w3.eth.get_block(self.snapshot_block)
+        self.snapshot_block_hash = bytes(block.hash)
+        self.snapshot_timestamp = block.timestamp
+        print(f"Pinned snapshot to block {self.snapshot_block}")
+        return self.snapshot_block
+
+    def _verify_block_hash(self):
+        """Fails the run if the pinned block was reorged out while it ran."""
+        block_hash = bytes(self.w3.eth.get_block(self.snapshot_block).hash)
+        if block_hash != self.snapshot_block_hash:
+            raise InconsistentBlockError(
+                f"Block {self.snapshot_block} hash changed from "
+                f"{Web3.toHex(self.snapshot_block_hash)} to {Web3.toHex(block_hash)}"
+            )
+
+    def _try_aggregate(
+        self, calls: List[Tuple[str, bytes]]
+    ) -> List[Tuple[bool, bytes]]:
+        if self.snapshot_block is None:
+            return try_aggregate(
+                self.w3, self.multicall.address, calls, self.block_identifier
+            )
+
+        # Verify each multicall ran at the pinned block. The returned hash is
+        # not checked: Multicall2 returns blockhash(block.number), always zero
+        block_number, block_hash, results = try_block_and_aggregate(
+            self.w3, self.multicall.address, calls, self.snapshot_block
+        )
+        if block_number != self.snapshot_block:
+            raise InconsistentBlockError(
+                f"Multicall ran at block {block_number}, "
+                f"expected {self.snapshot_block}"
+            )
+        return results
+
+    def _get_assets_in_batch(
+        self, user_addresses: List[str]
+    ) -> Dict[str, Optional[List[str]]]:
+        comptroller = self.comptroller.address
+        asset_in_result = self._try_aggregate(
+            [
+                (comptroller, call_data)
+                for call_data in encode_address_calls("getAssetsIn", user_addresses)
+            ]
+        )
+
+        assets_in = {}
+        for user_address, (success, data) in zip(user_addresses, asset_in_result):
+            if not success:
+                print(f"Failed to get markets of user {user_address}")
+                assets_in[user_address] = None
+                continue
+            assets_in[user_address] = decode_address_array(data)
+        return assets_in
+
+    def _get_balances_batch(
+        self, balance_calls: List[Tuple[str, str]]
+    ) -> Dict[Tuple[str, str], Tuple[Optional[int], Optional[int]]]:
+        calls = []
+        for user_address, market in balance_calls:
+            collateral_fn = (
+                "balanceOfUnderlying"
+                if market not in self.non_supplyable_markets
+                else "balanceOf"
+            )
+            borrow_fn = (
+                "borrowBalanceStored"
+                if market not in self.non_borrowable_markets
+                else "balanceOf"
+            )
+            calls.append((market, encode_address_call(collateral_fn, user_address)))
+            calls.append((market, encode_address_call(borrow_fn, user_address)))
+
+        values = decode_uint256_results(self._try_aggregate(calls))
+
+        balances = {}
+        for i, call in enumerate(balance_calls):
+            collateral, borrow = values[2 * i], values[2 * i + 1]
+            balances[call] = (
+                (collateral, borrow)
+                if collateral is not None and borrow is not None
+                else (None, None)
+            )
+        return balances
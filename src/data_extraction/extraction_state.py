@@ -0,0 +1,179 @@
+import json
+import os
+from dataclasses import dataclass, field
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+from src.borrower import BorrowerTable
+from src.data_extraction.address_set import AddressSet
+from src.paths import DATA_DIR
+
+EXTRACTION_STATE_DIR = DATA_DIR / "state"
+
+
+@dataclass
+class ExtractionState:
+    """Checkpoint of an extraction, so reruns only process what changed.
+
+    `last_scanned_block` is the last block whose events have been fully
+    processed. `pending_refresh` holds the borrowers whose balances must be
+    (re)queried: new borrowers and borrowers touched by market events since
+    their last refresh. `balances` is the last snapshot, keyed by borrower,
+    and `snapshot_block` the block the last run read balances at.
+
+    `save` appends what changed since the previous save to a journal next to
+    `path`, and only rewrites the whole state once the journal has grown
+    larger than it. Balances must be set with `update_balances` for their
+    changes to be saved.
+    """
+
+    last_scanned_block: Optional[int] = None
+    snapshot_block: Optional[int] = None
+    borrowers: AddressSet = field(default_factory=AddressSet)
+    pending_refresh: AddressSet = field(default_factory=AddressSet)
+    balances: BorrowerTable = field(default_factory=BorrowerTable)
+    path: Optional[Path] = None
+    # Last journal entry included, and what was saved as of that entry
+    _sequence: int = field(default=0, init=False, repr=False)
+    _saved_blocks: tuple = field(default=(None, None), init=False, repr=False)
+    _saved_borrowers: int = field(default=0, init=False, repr=False)
+    _saved_pending: Set[bytes] = field(default_factory=set, init=False, repr=False)
+    _changed_balances: Dict[str, None] = field(
+        default_factory=dict, init=False, repr=False
+    )
+
+    @property
+    def journal_path(self) -> Optional[Path]:
+        return self.path.with_suffix(".journal") if self.path is not None else None
+
+    def update_balances(self, table: BorrowerTable):
+        self.balances.update(table)
+        self._changed_balances.update(dict.fromkeys(table))
+
+    def to_dict(self) -> dict:
+        return {
+            "lastScannedBlock": self.last_scanned_block,
+            "snapshotBlock": self.snapshot_block,
+            "borrowers": self.borrowers.to_hex_list(),
+            "pendingRefresh": self.pending_refresh.to_hex_list(),
+            "balances": self.balances.to_dict(),
+            "journalSequence": self._sequence,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, path: Optional[Path] = None) -> "ExtractionState":
+        state = cls(
+            last_scanned_block=data["lastScannedBlock"],
+            snapshot_block=data.get("snapshotBlock"),
+            borrowers=AddressSet(data["borrowers"]),
+            pending_refresh=AddressSet(data["pendingRefresh"]),
+            balances=BorrowerTable.from_dict(data["balances"]),
+            path=path,
+        )
+        state._sequence = data.get("journalSequence", 0)
+        return state
+
+    def _apply(self, entry: dict):
+        self.last_scanned_block = entry["lastScannedBlock"]
+        self.snapshot_block = entry["snapshotBlock"]
+        for address in entry["borrowers"]:
+            self.borrowers.add(address)
+        for address in entry["pendingAdded"]:
+            self.pending_refresh.add(address)
+        for address in entry["pendingRemoved"]:
+            self.pending_refresh.discard(address)
+        self.balances.update(BorrowerTable.from_dict(entry["balances"]))
+        self._sequence = entry["sequence"]
+
+    def _mark_saved(self):
+        self._saved_blocks = (self.last_scanned_block, self.snapshot_block)
+        self._saved_borrowers = len(self.borrowers)
+        self._saved_pending = set(self.pending_refresh)
+        self._changed_balances = {}
+
+    @classmethod
+    def load(cls, path: Path) -> "ExtractionState":
+        if path.exists():
+            with path.open("r") as f:
+                state = cls.from_dict(json.load(f), path)
+        else:
+            state = cls(path=path)
+        journal_path = state.journal_path
+        if journal_path.exists():
+            with journal_path.open("r+b") as f:
+                offset = 0
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("Unterminated journal entry")
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A save interrupted mid-line: drop it, so later
+                        # entries are not appended after it
+                        f.truncate(offset)
+                        break
+                    offset += len(line)
+                    # Entries already folded into the state file are skipped
+                    if entry["sequence"] > state._sequence:
+                        state._apply(entry)
+        state._mark_saved()
+        return state
+
+    @classmethod
+    def for_protocol(cls, name: str, network: str) -> "ExtractionState":
+        return cls.load(EXTRACTION_STATE_DIR / f"{name}_{network}.json")
+
+    def _get_changes(self) -> Optional[dict]:
+        pending = set(self.pending_refresh)
+        changed = (
+            (self.last_scanned_block, self.snapshot_block) != self._saved_blocks
+            or len(self.borrowers) != self._saved_borrowers
+            or pending != self._saved_pending
+            or len(self._changed_balances) > 0
+        )
+        if not changed:
+            return None
+        return {
+            "sequence": self._sequence + 1,
+            "lastScannedBlock": self.last_scanned_block,
+            "snapshotBlock": self.snapshot_block,
+            "borrowers": [
+                "0x" + key.hex()
+                for key in islice(self.borrowers, self._saved_borrowers, None)
+            ],
+            "pendingAdded": ["0x" + key.hex() for key in pending - self._saved_pending],
+            "pendingRemoved": [
+                "0x" + key.hex() for key in self._saved_pending - pending
+            ],
+            "balances": self.balances.to_dict(self._changed_balances),
+        }
+
+    def save(self):
+        if self.path is None:
+            return
+        changes = self._get_changes()
+        if changes is None:
+            return
+        journal_path = self.journal_path
+        journal_size = journal_path.stat().st_size if journal_path.exists() else 0
+        state_size = self.path.stat().st_size if self.path.exists() else 0
+        if journal_size < state_size:
+            with journal_path.open("a") as f:
+                f.write(json.dumps(changes) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._sequence = changes["sequence"]
+        else:
+            self._sequence = changes["sequence"]
+            self._write_state()
+            journal_path.unlink(missing_ok=True)
+        self._mark_saved()
+
+    def _write_state(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Write-then-rename so an interrupted save never corrupts the checkpoint
+        tmp_path = self.path.with_suffix(".tmp")
+        with tmp_path.open("w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,184 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from time import monotonic, sleep
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+# Provider error messages that mean the range was too large, not that it failed
+RANGE_TOO_LARGE_MESSAGES = (
+    "more than",
+    "too many",
+    "limit exceeded",
+    "response size",
+    "block range",
+    "timeout",
+    "timed out",
+)
+
+
+class LogScanError(Exception):
+    def __init__(self, failed_ranges: List[Tuple[int, int]]):
+        self.failed_ranges = failed_ranges
+        super().__init__(f"Failed to get logs for block ranges {failed_ranges}")
+
+
+@dataclass
+class BlockRange:
+    from_block: int
+    to_block: int
+    attempts: int = 0
+    not_before: float = 0.0
+
+    @property
+    def size(self) -> int:
+        return self.to_block - self.from_block + 1
+
+
+def is_range_too_large(error: Optional[BaseException]) -> bool:
+    """Whether `error`, or an error it was raised from, says the range was
+    too large. Connection timeouts mean the node is unreachable instead."""
+    while error is not None:
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return False
+        if isinstance(error, requests.exceptions.Timeout):
+            return True
+        message = str(error).lower()
+        if any(m in message for m in RANGE_TOO_LARGE_MESSAGES):
+            return True
+        error = error.__cause__
+    return False
+
+
+class LogScanner:
+    """Fetches logs for a block interval with several ranges in flight at once.
+
+    Ranges that the provider rejects as too large (or that time out) are split
+    in half, and the step used for new ranges shrinks with them. Ranges that
+    come back sparse grow the step again. Any other failure puts the range in
+    a retry queue with exponential backoff. Once a range fails `max_retries`
+    times no new range is started: the ranges in flight are drained, and the
+    scan raises `LogScanError` with every range that failed.
+
+    Results are yielded in block order as `(from_block, to_block, logs)`,
+    covering the interval exactly once.
+    """
+
+    def __init__(
+        self,
+        get_logs: Callable[[int, int], List[dict]],
+        initial_step: int,
+        max_workers: int = 4,
+        min_step: int = 1,
+        max_step: Optional[int] = None,
+        sparse_results: int = 1000,
+        max_retries: int = 10,
+        retry_wait: float = 5.0,
+        max_retry_wait: float = 60.0,
+    ):
+        self.get_logs = get_logs
+        self.step = initial_step
+        self.max_workers = max_workers
+        self.min_step = min_step
+        self.max_step = max_step or initial_step * 16
+        self.sparse_results = sparse_results
+        self.max_retries = max_retries
+        self.retry_wait = retry_wait
+        self.max_retry_wait = max_retry_wait
+
+    def _shrink(self, block_range: BlockRange):
+        self.step = max(self.min_step, min(self.step, block_range.size // 2))
+
+    def _grow(self, block_range: BlockRange, num_logs: int):
+        if num_logs < self.sparse_results and block_range.size >= self.step:
+            self.step = min(self.max_step, self.step * 2)
+
+    def scan(
+        self, from_block: int, to_block: int
+    ) -> Iterator[Tuple[int, int, List[dict]]]:
+        cursor = from_block
+        pending: Deque[BlockRange] = deque()
+        retry_queue: Deque[BlockRange] = deque()
+        failed: List[BlockRange] = []
+        completed: Dict[int, Tuple[int, List[dict]]] = {}
+        next_emit = from_block
+        in_flight: Dict[Future, BlockRange] = {}
+
+        def next_range() -> Optional[BlockRange]:
+            nonlocal cursor
+            # The scan cannot complete, so nothing more is fetched for it
+            if failed:
+                return None
+            if pending:
+                return pending.popleft()
+            if retry_queue and retry_queue[0].not_before <= monotonic():
+                return retry_queue.popleft()
+            if cursor > to_block:
+                return None
+            block_range = BlockRange(cursor, min(cursor + self.step - 1, to_block))
+            cursor = block_range.to_block + 1
+            return block_range
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while True:
+                while len(in_flight) < self.max_workers:
+                    block_range = next_range()
+                    if block_range is None:
+                        break
+                    future = executor.submit(
+                        self.get_logs, block_range.from_block, block_range.to_block
+                    )
+                    in_flight[future] = block_range
+
+                if not in_flight:
+                    if not retry_queue or failed:
+                        break
+                    # Only ranges waiting for their backoff are left
+                    sleep(max(retry_queue[0].not_before - monotonic(), 0))
+                    continue
+
+                done, _ = wait(in_flight, timeout=1.0, return_when=FIRST_COMPLETED)
+                for future in done:
+                    block_range = in_flight.pop(future)
+                    try:
+                        logs = future.result()
+                    except Exception as e:
+                        if is_range_too_large(e) and block_range.size > self.min_step:
+                            middle = block_range.from_block + block_range.size // 2
+                            self._shrink(block_range)
+                            pending.extendleft(
+                                [
+                                    BlockRange(middle, block_range.to_block),
+                                    BlockRange(block_range.from_block, middle - 1),
+                                ]
+                            )
+                            continue
+                        block_range.attempts += 1
+                        print(
+                            f"Exception getting logs for blocks "
+                            f"{block_range.from_block}-{block_range.to_block}: {e}"
+                        )
+                        if block_range.attempts >= self.max_retries:
+                            failed.append(block_range)
+                            continue
+                        backoff = self.retry_wait * 2 ** (block_range.attempts - 1)
+                        block_range.not_before = monotonic() + min(
+                            backoff, self.max_retry_wait
+                        )
+                        retry_queue.append(block_range)
+                        continue
+
+                    self._grow(block_range, len(logs))
+                    completed[block_range.from_block] = (block_range.to_block, logs)
+
+                while next_emit in completed:
+                    end, logs = completed.pop(next_emit)
+                    yield next_emit, end, logs
+                    next_emit = end + 1
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        if failed:
+            raise LogScanError(sorted((r.from_block, r.to_block) for r in failed))
@@ -0,0 +1,47 @@
+from typing import List, Tuple, Union
+
+from web3 import Web3
+
+from src.data_extraction.codec import (
+    decode_try_aggregate,
+    decode_try_block_and_aggregate,
+    encode_try_aggregate,
+)
+
+BlockIdentifier = Union[int, str]
+
+
+class InconsistentBlockError(Exception):
+    pass
+
+
+def try_aggregate(
+    w3: Web3,
+    multicall_address: str,
+    calls: List[Tuple[str, bytes]],
+    block_identifier: BlockIdentifier = "latest",
+) -> List[Tuple[bool, bytes]]:
+    """Runs `calls` as `(target, calldata)` pairs in one `tryAggregate`."""
+    result = w3.eth.call(
+        {"to": multicall_address, "data": encode_try_aggregate(calls)},
+        block_identifier,
+    )
+    return decode_try_aggregate(bytes(result))
+
+
+def try_block_and_aggregate(
+    w3: Web3,
+    multicall_address: str,
+    calls: List[Tuple[str, bytes]],
+    block_identifier: BlockIdentifier = "latest",
+) -> Tuple[int, bytes, List[Tuple[bool, bytes]]]:
+    """Runs `calls` in one `tryBlockAndAggregate`, which also returns the
+    number and hash of the block they ran at."""
+    result = w3.eth.call(
+        {
+            "to": multicall_address,
+            "data": encode_try_aggregate(calls, fn_name="tryBlockAndAggregate"),
+        },
+        block_identifier,
+    )
+    return decode_try_block_and_aggregate(bytes(result))
@@ -0,0 +1,73 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+class UserDataWriter:
+    """Writes extracted users as newline-delimited JSON, one user per line.
+
+    Lines are written to `<path>.partial`, and reach it each time `flush` is
+    called, so chunks exported mid-run are on disk without waiting for the
+    rest. It is renamed to `path` once the extraction completes, so readers
+    never pick up a half-written file as finished. Run `metadata`, if given, is
+    written next to it as `<stem>.meta.json`, with the number of users written
+    and `oldestBlock`, the oldest block a written user's balances were read
+    at. It is also written to a temporary file and renamed.
+    """
+
+    def __init__(self, path: Path, metadata: Optional[dict] = None):
+        self.path = Path(path)
+        self.partial_path = self.path.with_name(self.path.name + ".partial")
+        self.metadata_path = self.path.with_suffix(".meta.json")
+        self.metadata = metadata
+        self.users_written = 0
+        self.oldest_block: Optional[int] = None
+
+    def __enter__(self) -> "UserDataWriter":
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.partial_path.open("w")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._file.close()
+        if exc_type is not None:
+            return
+        if self.metadata is not None:
+            tmp_path = self.metadata_path.with_suffix(".tmp")
+            with tmp_path.open("w") as f:
+                json.dump(
+                    {
+                        **self.metadata,
+                        "users": self.users_written,
+                        "oldestBlock": self.oldest_block,
+                    },
+                    f,
+                )
+            os.replace(tmp_path, self.metadata_path)
+        os.replace(self.partial_path, self.path)
+
+    def flush(self):
+        self._file.flush()
+
+    def write(
+        self,
+        user_address: str,
+        markets: List[Dict[str, float]],
+        block: Optional[int] = None,
+    ):
+        collateral = sum(m["collateral"] for m in markets)
+        debt = sum(m["debt"] for m in markets)
+        record = {
+            "user": user_address,
+            "markets": markets,
+            "collateral": collateral,
+            "debt": debt,
+            "netValue": collateral - debt,
+        }
+        if block is not None:
+            record["block"] = block
+            if self.oldest_block is None or block < self.oldest_block:
+                self.oldest_block = block
+        self._file.write(json.dumps(record) + "\n")
+        self.users_written += 1
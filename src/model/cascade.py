@@ -0,0 +1,94 @@
+from dataclasses import dataclass
+from typing import Callable
+
+import numpy as np
+
+# Price factor left after selling amounts of collateral (e.g. 0.97 for 3%),
+# given those amounts and the indices of the shocks they were sold in
+SlippageModel = Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+
+@dataclass(frozen=True)
+class CascadeIndex:
+    """Positions sorted by the price drop that makes them liquidatable.
+
+    `cumulative_sold[i]` is the collateral sold once the first `i` positions
+    are liquidated, so the amount sold at any drop is one bisection away.
+    """
+
+    thresholds: np.ndarray
+    cumulative_sold: np.ndarray
+
+    @classmethod
+    def from_positions(
+        cls, thresholds: np.ndarray, amounts: np.ndarray
+    ) -> "CascadeIndex":
+        thresholds = np.asarray(thresholds, dtype=np.float64)
+        order = np.argsort(thresholds, kind="stable")
+        cumulative_sold = np.zeros(len(order) + 1)
+        np.cumsum(np.asarray(amounts, dtype=np.float64)[order], out=cumulative_sold[1:])
+        return cls(thresholds[order], cumulative_sold)
+
+    def __len__(self) -> int:
+        return len(self.thresholds)
+
+    def liquidated(self, price_drops: np.ndarray) -> np.ndarray:
+        """Number of positions liquidatable at each price drop."""
+        return np.searchsorted(self.thresholds, price_drops, side="right")
+
+
+@dataclass(frozen=True)
+class CascadeResult:
+    price_drop: np.ndarray
+    sold: np.ndarray
+    liquidated: np.ndarray
+    rounds: np.ndarray
+    converged: np.ndarray
+
+    @property
+    def equilibrium_price(self) -> np.ndarray:
+        """Post-cascade price, relative to the price before the shock."""
+        return 1 - self.price_drop
+
+
+def simulate_cascades(
+    index: CascadeIndex,
+    shocks: np.ndarray,
+    slippage: SlippageModel,
+    max_rounds: int = 1000,
+) -> CascadeResult:
+    """Runs one liquidation cascade per initial price drop in `shocks`.
+
+    Every round, the collateral of the liquidated positions is sold, which
+    moves the price to `(1 - shock) * slippage(sold)`, and the positions
+    liquidatable at that price are found by bisection on the index. A
+    scenario converges when a round liquidates nobody new; the price only
+    depends on what was sold, so it is then at its equilibrium. All
+    scenarios still running advance together in each round.
+    """
+    shocks = np.asarray(shocks, dtype=np.float64)
+    liquidated = index.liquidated(shocks)
+    rounds = np.zeros(len(shocks), dtype=np.int64)
+    running = np.arange(len(shocks))
+    for _ in range(max_rounds):
+        if len(running) == 0:
+            break
+        price_drop = 1 - (1 - shocks[running]) * slippage(
+            index.cumulative_sold[liquidated[running]], running
+        )
+        newly_liquidated = index.liquidated(price_drop)
+        rounds[running] += 1
+        grew = newly_liquidated > liquidated[running]
+        liquidated[running] = newly_liquidated
+        running = running[grew]
+
+    sold = index.cumulative_sold[liquidated]
+    converged = np.ones(len(shocks), dtype=bool)
+    converged[running] = False
+    return CascadeResult(
+        price_drop=1 - (1 - shocks) * slippage(sold, np.arange(len(shocks))),
+        sold=sold,
+        liquidated=liquidated,
+        rounds=rounds,
+        converged=converged,
+    )
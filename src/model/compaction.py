@@ -0,0 +1,59 @@
+from typing import Dict, Mapping, Sequence
+
+import numpy as np
+
+
+def simplify_curve(
+    x: np.ndarray, columns: Sequence[np.ndarray], max_error: float
+) -> np.ndarray:
+    """Indices of the points of a piecewise-linear curve kept by
+    Ramer-Douglas-Peucker.
+
+    The error of a dropped point is its vertical distance to the segment
+    between the kept points around it, as a fraction of its column's range.
+    Every column stays within `max_error` of the original at every original
+    point, and the first and last points are always kept.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    if len(x) <= 2:
+        return np.arange(len(x))
+    ys = np.stack([np.asarray(c, dtype=np.float64) for c in columns])
+    ranges = np.ptp(ys, axis=1)
+    scales = np.where(ranges > 0, ranges, 1.0)[:, None]
+
+    keep = np.zeros(len(x), dtype=bool)
+    keep[[0, -1]] = True
+    segments = [(0, len(x) - 1)]
+    while segments:
+        start, end = segments.pop()
+        if end - start < 2:
+            continue
+        t = (x[start + 1 : end] - x[start]) / (x[end] - x[start])
+        chord = ys[:, [start]] + t * (ys[:, [end]] - ys[:, [start]])
+        errors = np.max(np.abs(ys[:, start + 1 : end] - chord) / scales, axis=0)
+        worst = int(np.argmax(errors))
+        if errors[worst] > max_error:
+            split = start + 1 + worst
+            keep[split] = True
+            segments.append((start, split))
+            segments.append((split, end))
+    return np.flatnonzero(keep)
+
+
+def compact_curve(
+    curve: Mapping[str, np.ndarray], columns: Sequence[str], max_error: float
+) -> Dict[str, np.ndarray]:
+    """`curve`, sorted by price change, reduced to the points `simplify_curve`
+    keeps for `columns`."""
+    x = np.asarray(curve["price_change"], dtype=np.float64)
+    order = np.argsort(x, kind="stable")
+    sorted_columns = {
+        name: np.asarray(curve[name], dtype=np.float64)[order]
+        for name in ("price_change", *columns)
+    }
+    kept = simplify_curve(
+        sorted_columns["price_change"],
+        [sorted_columns[name] for name in columns],
+        max_error,
+    )
+    return {name: values[kept] for name, values in sorted_columns.items()}
@@ -0,0 +1,127 @@
+import csv
+import hashlib
+import io
+import os
+from dataclasses import dataclass, fields
+from pathlib import Path
+
+import numpy as np
+
+from src.model.slippage import get_slippage_dollars
+from src.paths import DATA_DIR
+
+LIQUIDITY_CACHE_DIR = DATA_DIR / "cache" / "liquidity"
+
+_USD_FORMATTING = str.maketrans("", "", "$,")
+
+
+@dataclass(frozen=True)
+class LiquidityBook:
+    """Order book depth of every venue (an exchange and pair), in USD, within
+    2% above (`up_depth`) and below (`down_depth`) the price."""
+
+    exchanges: np.ndarray
+    pairs: np.ndarray
+    up_depth: np.ndarray
+    down_depth: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.pairs)
+
+    def usd_pairs(self) -> "LiquidityBook":
+        """Venues quoted against USD or a USD stablecoin."""
+        mask = np.char.find(self.pairs, "/US") >= 0
+        return LiquidityBook(*(getattr(self, f.name)[mask] for f in fields(self)))
+
+    @property
+    def market_sizes(self) -> np.ndarray:
+        """Virtual market size of each venue: its 2% depths extrapolated to a
+        100% move, averaged over both sides."""
+        return (self.up_depth * 0.98 * 100 + self.down_depth * 1.02 * 100) / 2
+
+    @property
+    def sale_sizes(self) -> np.ndarray:
+        """Virtual market size of each venue for sales, which only hit its
+        bids: the -2% depth extrapolated to a 100% move."""
+        return self.down_depth * 1.02 * 100
+
+    @property
+    def total_market_size(self) -> float:
+        return float(self.market_sizes.sum())
+
+    def get_venue_sales(self, sale_amounts: np.ndarray) -> np.ndarray:
+        """Amount of each sale routed to each venue, of shape
+        `sale_amounts.shape + (venues,)`.
+
+        Sales go to the deepest venues first, each taking at most its -2%
+        depth. Once every venue has taken its depth, the rest is routed the
+        same way again, one depth at a time.
+        """
+        sale_amounts = np.asarray(sale_amounts, dtype=np.float64)[..., None]
+        depths = self.down_depth
+        filled_before = np.zeros_like(depths)
+        order = np.argsort(-depths, kind="stable")
+        filled_before[order] = np.cumsum(depths[order]) - depths[order]
+        total_depth = depths.sum()
+        rounds = np.floor(sale_amounts / total_depth)
+        rest = sale_amounts - rounds * total_depth
+        return rounds * depths + np.clip(rest - filled_before, 0, depths)
+
+    def get_slippage(self, sale_amounts: np.ndarray) -> np.ndarray:
+        """Price factor left after selling each amount, routed by
+        `get_venue_sales`: the average of each venue's price factor after its
+        part of the sale, weighted by that part."""
+        sale_amounts = np.asarray(sale_amounts, dtype=np.float64)
+        venue_sales = self.get_venue_sales(sale_amounts)
+        proceeds = (
+            venue_sales * get_slippage_dollars(venue_sales, self.sale_sizes)
+        ).sum(axis=-1)
+        return np.divide(
+            proceeds,
+            sale_amounts,
+            out=np.ones_like(proceeds),
+            where=sale_amounts > 0,
+        )
+
+
+def parse_liquidity_book(data: bytes) -> LiquidityBook:
+    """Parses a CoinGecko markets CSV export."""
+    rows = list(csv.DictReader(io.StringIO(data.decode())))
+    return LiquidityBook(
+        exchanges=np.array([row["Exchange"] for row in rows]),
+        pairs=np.array([row["Pair"] for row in rows]),
+        up_depth=np.array(
+            [float(row["2% Depth"].translate(_USD_FORMATTING)) for row in rows]
+        ),
+        down_depth=np.array(
+            [float(row["-2% Depth"].translate(_USD_FORMATTING)) for row in rows]
+        ),
+    )
+
+
+def load_liquidity_book(
+    csv_path: Path, cache_dir: Path = LIQUIDITY_CACHE_DIR
+) -> LiquidityBook:
+    """The liquidity book of `csv_path`, parsed once and then read from a
+    typed `.npz` artifact in `cache_dir` named after the CSV's hash."""
+    data = csv_path.read_bytes()
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    cache_path = cache_dir / f"{digest}.npz"
+    try:
+        with np.load(cache_path, allow_pickle=False) as cached:
+            return LiquidityBook(
+                **{f.name: cached[f.name] for f in fields(LiquidityBook)}
+            )
+    except (OSError, ValueError, KeyError):
+        pass
+
+    book = parse_liquidity_book(data)
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        with tmp_path.open("wb") as out:
+            np.savez(out, **{f.name: getattr(book, f.name) for f in fields(book)})
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Could not cache the liquidity book in {cache_dir}: {e}")
+    return book
@@ -0,0 +1,2 @@
+def get_slippage_dollars(sale_amount: float, market_size: float):
+    return 1 / (1 + 2 * sale_amount / market_size)
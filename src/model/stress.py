@@ -0,0 +1,103 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from src.model.cascade import CascadeIndex, simulate_cascades
+from src.model.slippage import get_slippage_dollars
+
+
+@dataclass(frozen=True)
+class StressConfig:
+    """Distributions sampled by every stress scenario.
+
+    - The market depth is a bootstrap resample of the venues' depths, scaled
+      by a lognormal factor of `depth_volatility` for the market regime.
+    - The protocol's share of the industry is uniform in `industry_share`.
+    - The price reached at each shock gets lognormal noise of
+      `price_volatility`, independently per scenario and curve point.
+
+    Scenarios are drawn in batches of `batch_size`, each seeded from `seed`,
+    so results do not depend on how many workers run them.
+    """
+
+    scenarios: int = 1000
+    seed: int = 0
+    depth_volatility: float = 0.5
+    industry_share: Tuple[float, float] = (0.05, 0.2)
+    price_volatility: float = 0.05
+    batch_size: int = 64
+    percentiles: Tuple[int, ...] = (5, 50, 95)
+
+
+def _lognormal(rng: np.random.Generator, sigma: float, size) -> np.ndarray:
+    # Mean of one, so the volatility never shifts the expected value
+    return rng.lognormal(-(sigma**2) / 2, sigma, size)
+
+
+def run_stress_batch(
+    index: CascadeIndex,
+    shocks: np.ndarray,
+    depths: np.ndarray,
+    config: StressConfig,
+    seed: np.random.SeedSequence,
+    scenarios: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Equilibrium prices and amounts sold, of shape (scenarios, shocks), for
+    one batch of sampled scenarios, all cascading together."""
+    rng = np.random.default_rng(seed)
+    market_size = rng.choice(depths, size=(scenarios, len(depths))).sum(
+        axis=1
+    ) * _lognormal(rng, config.depth_volatility, scenarios)
+    industry_share = rng.uniform(*config.industry_share, scenarios)
+    price = (1 - shocks) * _lognormal(
+        rng, config.price_volatility, (scenarios, len(shocks))
+    )
+
+    def slippage(sold: np.ndarray, flat_scenarios: np.ndarray) -> np.ndarray:
+        scenario = flat_scenarios // len(shocks)
+        return get_slippage_dollars(
+            sold / industry_share[scenario], market_size[scenario]
+        )
+
+    result = simulate_cascades(index, 1 - price.ravel(), slippage)
+    return (
+        result.equilibrium_price.reshape(scenarios, -1).astype(np.float32),
+        result.sold.reshape(scenarios, -1).astype(np.float32),
+    )
+
+
+def run_stress(
+    index: CascadeIndex,
+    shocks: np.ndarray,
+    depths: np.ndarray,
+    config: StressConfig = StressConfig(),
+    workers: int = 1,
+) -> Dict[str, np.ndarray]:
+    """Percentile bands of the equilibrium price and of the collateral sold at
+    every shock, over `config.scenarios` sampled scenarios, e.g.
+    `equilibrium_price_p5`."""
+    shocks = np.asarray(shocks, dtype=np.float64)
+    sizes = [
+        min(config.batch_size, config.scenarios - start)
+        for start in range(0, config.scenarios, config.batch_size)
+    ]
+    seeds = np.random.SeedSequence(config.seed).spawn(len(sizes))
+    args = [(index, shocks, depths, config, s, n) for s, n in zip(seeds, sizes)]
+
+    batches: List[Tuple[np.ndarray, np.ndarray]]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            batches = list(executor.map(run_stress_batch, *zip(*args)))
+    else:
+        batches = [run_stress_batch(*a) for a in args]
+
+    bands = {}
+    for i, name in enumerate(("equilibrium_price", "total_liquidation")):
+        values = np.concatenate([batch[i] for batch in batches])
+        for q, band in zip(
+            config.percentiles, np.percentile(values, config.percentiles, axis=0)
+        ):
+            bands[f"{name}_p{q}"] = band.astype(np.float64)
+    return bands
@@ -0,0 +1,59 @@
+from typing import Dict, List
+
+from web3 import Web3
+
+from src.addresses import get_multicall_address
+from src.data_extraction.codec import (
+    SELECTORS,
+    decode_address,
+    decode_uint256,
+    encode_address_call,
+)
+from src.data_extraction.multicall import BlockIdentifier, try_aggregate
+
+
+class OraclePriceProvider:
+    """Reads on-chain prices for many assets in a single multicall.
+
+    All reads happen at `block_identifier`, so prices can be pinned to the
+    same block as a balance snapshot.
+    """
+
+    def __init__(
+        self, w3: Web3, network: str, block_identifier: BlockIdentifier = "latest"
+    ):
+        self.w3 = w3
+        self.multicall_address = get_multicall_address(network)
+        self.block_identifier = block_identifier
+
+    def _try_aggregate(self, calls):
+        return try_aggregate(
+            self.w3, self.multicall_address, calls, self.block_identifier
+        )
+
+    def get_compound_oracle(self, comptroller_address: str) -> str:
+        ((success, data),) = self._try_aggregate(
+            [(comptroller_address, SELECTORS["oracle"])]
+        )
+        if not success:
+            raise ValueError(f"Could not read oracle of {comptroller_address}")
+        return decode_address(data)
+
+    def get_compound_prices(
+        self, comptroller_address: str, markets: List[str]
+    ) -> Dict[str, float]:
+        """Prices of every market from the comptroller's price oracle.
+
+        The oracle scales prices by 1e(36 - underlying decimals), so the
+        returned `price / 1e18` values satisfy `balance * price / 1e18 == USD`
+        for balances in underlying base units, whatever the token decimals.
+        Markets the oracle cannot price map to 0.0.
+        """
+        oracle = self.get_compound_oracle(comptroller_address)
+        results = self._try_aggregate(
+            [(oracle, encode_address_call("getUnderlyingPrice", m)) for m in markets]
+        )
+        return {
+            market: decode_uint256(data) / 1e18 if success and len(data) >= 32 else 0.0
+            for market, (success, data) in zip(markets, results)
+        }
@@ -0,0 +1,13 @@
+from os import getenv
+from pathlib import Path
+
+# Resolved from the repository root, not the working directory, so jobs and
+# the API find their data wherever they are started from
+DATA_DIR = Path(getenv("DATA_DIR") or Path(__file__).resolve().parents[1] / "data")
+USERS_DIR = DATA_DIR / "users"
+
+
+def get_users_path(protocol: str, network: str) -> Path:
+    """Extraction output of `protocol` on `network`, as written by every
+    extraction job and read by apply_model."""
+    return USERS_DIR / f"{protocol}_{network}_data.ndjson"
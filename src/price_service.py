@@ -0,0 +1,266 @@
+import json
+import os
+import threading
+from concurrent.futures import Future
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from time import sleep, time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.paths import DATA_DIR
+
+COINGECKO_URL = "https://api.coingecko.com/api/v3"
+KRYSTAL_URL = "https://pricing-prod.krystal.team/v1"
+CRYPTOCOMPARE_URL = "https://min-api.cryptocompare.com/data"
+
+COINGECKO_SYMBOLS_PATH = DATA_DIR / "coingecko_symbols.json"
+
+# Coingecko asset platform ids, used by the token_price endpoint
+COINGECKO_PLATFORMS = {
+    "ETH": "ethereum",
+    "BSC": "binance-smart-chain",
+    "AVAX": "avalanche",
+    "MATIC": "polygon-pos",
+    "FTM": "fantom",
+    "CRO": "cronos",
+    "NEAR": "aurora",
+    "ARBITRUM": "arbitrum-one",
+    "MOONBEAM": "moonbeam",
+}
+KRYSTAL_CHAINS = {"ETH": "ethereum@1"}
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class PriceService:
+    """USD prices for native coins and tokens, shared by every extractor.
+
+    HTTP requests go through one pooled session and are retried with
+    exponential backoff, honoring `Retry-After`. Token prices are requested
+    in batches and kept in a TTL cache, optionally persisted to
+    `snapshot_path`. Concurrent lookups of a price already being fetched wait
+    for that request instead of issuing their own.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 300.0,
+        snapshot_path: Optional[Path] = None,
+        batch_size: int = 50,
+        pool_size: int = 16,
+        retries: int = 5,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        timeout: float = 10.0,
+        coingecko_url: str = COINGECKO_URL,
+        krystal_url: Optional[str] = KRYSTAL_URL,
+        cryptocompare_url: str = CRYPTOCOMPARE_URL,
+    ):
+        self.ttl = ttl
+        self.snapshot_path = snapshot_path
+        self.batch_size = batch_size
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.coingecko_url = coingecko_url
+        self.krystal_url = krystal_url
+        self.cryptocompare_url = cryptocompare_url
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._cache: Dict[str, Tuple[float, float]] = {}
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._coingecko_symbols: Optional[Dict[str, str]] = None
+        if snapshot_path is not None and snapshot_path.exists():
+            with snapshot_path.open("r") as f:
+                self._cache = {k: tuple(v) for k, v in json.load(f).items()}
+
+    @property
+    def coingecko_symbols(self) -> Dict[str, str]:
+        if self._coingecko_symbols is None:
+            with COINGECKO_SYMBOLS_PATH.open("r") as f:
+                self._coingecko_symbols = json.load(f)
+        return self._coingecko_symbols
+
+    def request_get(self, url: str, params: Optional[dict] = None) -> requests.Response:
+        response = None
+        for attempt in range(self.retries):
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                print(f"Exception requesting {url}: {e}")
+                wait_time = None
+            else:
+                if response.status_code not in RETRY_STATUS_CODES:
+                    return response
+                wait_time = parse_retry_after(response.headers.get("Retry-After"))
+            if attempt == self.retries - 1:
+                break
+            if wait_time is None:
+                wait_time = self.backoff * 2**attempt
+            sleep(min(wait_time, self.max_backoff))
+        if response is None:
+            raise requests.exceptions.ConnectionError(f"Could not reach {url}")
+        return response
+
+    def _get_cached(self, key: str) -> Optional[float]:
+        cached = self._cache.get(key)
+        if cached is not None and cached[1] > time():
+            return cached[0]
+        return None
+
+    def _save_snapshot(self):
+        if self.snapshot_path is None:
+            return
+        self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.snapshot_path.with_suffix(".tmp")
+        with tmp_path.open("w") as f:
+            json.dump(self._cache, f)
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _get_many(self, keys: List[str], fetch) -> Dict[str, float]:
+        """Resolves keys from the cache, from requests already in flight, or
+        by calling `fetch` with the keys nobody is fetching yet."""
+        prices: Dict[str, float] = {}
+        waiting: Dict[str, Future] = {}
+        owned: Dict[str, Future] = {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                price = self._get_cached(key)
+                if price is not None:
+                    prices[key] = price
+                elif key in self._in_flight:
+                    waiting[key] = self._in_flight[key]
+                else:
+                    owned[key] = self._in_flight[key] = Future()
+
+        if owned:
+            try:
+                fetched = fetch(list(owned))
+            except Exception as e:
+                fetched = {}
+                print(f"Exception fetching prices: {e}")
+            expires_at = time() + self.ttl
+            with self._lock:
+                for key, future in owned.items():
+                    price = fetched.get(key, 0.0)
+                    if key in fetched:
+                        self._cache[key] = (price, expires_at)
+                    del self._in_flight[key]
+                    future.set_result(price)
+                    prices[key] = price
+                if fetched:
+                    self._save_snapshot()
+
+        for key, future in waiting.items():
+            prices[key] = future.result()
+        return prices
+
+    def get_native_price(self, network: str) -> float:
+        return self._get_many([network], self._fetch_native_prices)[network]
+
+    def _fetch_native_prices(self, networks: List[str]) -> Dict[str, float]:
+        symbols = {n: self.coingecko_symbols[n] for n in networks}
+        response = self.request_get(
+            f"{self.coingecko_url}/simple/price",
+            {"ids": ",".join(symbols.values()), "vs_currencies": "usd"},
+        )
+        prices = {}
+        if response.status_code == 200:
+            data = response.json()
+            prices = {
+                n: data[s]["usd"]
+                for n, s in symbols.items()
+                if "usd" in data.get(s, {})
+            }
+        for network in networks:
+            if network in prices:
+                continue
+            # fallback
+            response = self.request_get(
+                f"{self.cryptocompare_url}/price", {"fsym": network, "tsyms": "USD"}
+            )
+            if response.status_code == 200 and "USD" in response.json():
+                prices[network] = response.json()["USD"]
+        return prices
+
+    def get_token_prices(
+        self, network: str, addresses: Iterable[str]
+    ) -> Dict[str, float]:
+        """Prices by token address; tokens without a price map to 0.0."""
+        addresses = list(addresses)
+        keys = [f"{network}:{address.lower()}" for address in addresses]
+        prices = self._get_many(keys, lambda k: self._fetch_token_prices(network, k))
+        return {address: prices[key] for address, key in zip(addresses, keys)}
+
+    def get_token_price(self, network: str, address: str) -> float:
+        return self.get_token_prices(network, [address])[address]
+
+    def _fetch_token_prices(self, network: str, keys: List[str]) -> Dict[str, float]:
+        addresses = {key.split(":", 1)[1]: key for key in keys}
+        prices: Dict[str, float] = {}
+        for i in range(0, len(addresses), self.batch_size):
+            batch = list(addresses)[i : i + self.batch_size]
+            batch_prices = {}
+            if self.krystal_url is not None and network in KRYSTAL_CHAINS:
+                batch_prices.update(self._fetch_krystal_prices(network, batch))
+            missing = [a for a in batch if not batch_prices.get(a)]
+            if missing and network in COINGECKO_PLATFORMS:
+                batch_prices.update(self._fetch_coingecko_prices(network, missing))
+            prices.update({addresses[a]: p for a, p in batch_prices.items() if p})
+        return prices
+
+    def _fetch_krystal_prices(
+        self, network: str, addresses: List[str]
+    ) -> Dict[str, float]:
+        response = self.request_get(
+            f"{self.krystal_url}/market",
+            {
+                "addresses": ",".join(addresses),
+                "chain": KRYSTAL_CHAINS[network],
+                "sparkline": "false",
+            },
+        )
+        if response.status_code != 200:
+            return {}
+        return {
+            market["address"].lower(): market["price"] or 0.0
+            for market in response.json().get("marketData", [])
+            if "address" in market
+        }
+
+    def _fetch_coingecko_prices(
+        self, network: str, addresses: List[str]
+    ) -> Dict[str, float]:
+        response = self.request_get(
+            f"{self.coingecko_url}/simple/token_price/{COINGECKO_PLATFORMS[network]}",
+            {"contract_addresses": ",".join(addresses), "vs_currencies": "usd"},
+        )
+        if response.status_code != 200:
+            return {}
+        return {
+            address.lower(): data["usd"]
+            for address, data in response.json().items()
+            if "usd" in data
+        }
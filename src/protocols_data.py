@@ -1,10 +1,11 @@
 from dataclasses import dataclass, field
 import json
-from pathlib import Path
 from typing import List, Optional
 from web3 import Web3
 
-PROTOCOL_REFERENCE_PATH = Path("data/protocol_reference.json")
+from src.paths import DATA_DIR
+
+PROTOCOL_REFERENCE_PATH = DATA_DIR / "protocol_reference.json"
 
 
 @dataclass
@@ -34,9 +35,9 @@ class CompoundProtocolReference:
             deploy_block=int(data["deployBlock"]),
             block_step_in_init=int(data["blockStepInInit"]),
             multicall_size=int(data["multicallSize"]),
-            ceth2_address=Web3.toChecksumAddress(data["cETH2"])
-            if "cETH2" in data
-            else None,
+            ceth2_address=(
+                Web3.toChecksumAddress(data["cETH2"]) if "cETH2" in data else None
+            ),
             non_borrowable_markets=[
                 Web3.toChecksumAddress(a)
                 for a in data.get("nonBorrowableMarkets", list())
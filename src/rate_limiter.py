@@ -0,0 +1,28 @@
+import threading
+from time import monotonic, sleep
+from typing import Optional
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` requests per second, in bursts of up to
+    `burst` requests. Safe to share between threads."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        self._tokens = self.burst
+        self._updated_at = monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated_at) * self.rate
+            )
+            self._updated_at = now
+            self._tokens -= 1
+            # Reserve the token now and sleep outside the lock until it exists
+            wait_time = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait_time > 0:
+            sleep(wait_time)
@@ -0,0 +1,221 @@
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from time import monotonic, perf_counter
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from web3.providers.base import JSONBaseProvider
+from web3.types import RPCEndpoint, RPCResponse
+
+from src.rate_limiter import RateLimiter
+
+# HTTP statuses that mean the node is unhealthy rather than the request bad
+UNHEALTHY_STATUS_CODES = (429, 500, 502, 503, 504)
+# URL path segments at least this long are taken for API keys
+SECRET_SEGMENT_LENGTH = 16
+
+
+class NoEndpointAvailable(requests.exceptions.ConnectionError):
+    pass
+
+
+@dataclass
+class Endpoint:
+    """An RPC node. `weight` is its share of the traffic, `rate_limit` caps
+    its requests per second and `budget` its total requests."""
+
+    url: str
+    weight: int = 1
+    rate_limit: Optional[float] = None
+    budget: Optional[int] = None
+
+    @property
+    def name(self) -> str:
+        """The URL without credentials, query or API keys in the path, so
+        they never reach logs or metrics."""
+        parsed = urlparse(self.url)
+        path = "/".join(
+            "***" if len(segment) >= SECRET_SEGMENT_LENGTH else segment
+            for segment in parsed.path.split("/")
+        )
+        query = "?***" if parsed.query else ""
+        return f"{parsed.scheme}://{parsed.netloc.rpartition('@')[2]}{path}{query}"
+
+
+@dataclass
+class EndpointMetrics:
+    requests: int = 0
+    errors: int = 0
+    latency: float = 0.0
+    max_latency: float = 0.0
+    circuit_opened: int = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "errorRate": self.errors / self.requests if self.requests else 0.0,
+            "avgLatency": self.latency / self.requests if self.requests else 0.0,
+            "maxLatency": self.max_latency,
+            "circuitOpened": self.circuit_opened,
+        }
+
+
+@dataclass
+class EndpointState:
+    endpoint: Endpoint
+    # Unique among the provider's endpoints; keys the metrics
+    name: str
+    limiter: Optional[RateLimiter]
+    metrics: EndpointMetrics = field(default_factory=EndpointMetrics)
+    current_weight: int = 0
+    consecutive_failures: int = 0
+    open_until: float = 0.0
+    trial_in_flight: bool = False
+
+    @property
+    def budget_left(self) -> bool:
+        budget = self.endpoint.budget
+        return budget is None or self.metrics.requests < budget
+
+
+class LoadBalancedProvider(JSONBaseProvider):
+    """JSON-RPC provider spreading requests over several endpoints.
+
+    Endpoints are picked by smooth weighted round-robin and share one
+    keep-alive session whose pool holds `pool_size` connections per host.
+    After `failure_threshold` consecutive connection errors or unhealthy
+    responses an endpoint's circuit opens for `reset_timeout` seconds, then
+    a single trial request decides whether it closes again. A failed request
+    is retried on the next endpoint; JSON-RPC errors are returned as they
+    are, since they come from a healthy node. So are read timeouts, which
+    usually mean the request is too heavy rather than the node unhealthy:
+    the caller decides what to do, e.g. split a log range.
+    """
+
+    def __init__(
+        self,
+        endpoints: List[Endpoint],
+        pool_size: int = 16,
+        timeout: float = 30.0,
+        failure_threshold: int = 3,
+        reset_timeout: float = 30.0,
+    ):
+        super().__init__()
+        if not endpoints:
+            raise ValueError("At least one endpoint is required")
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        # Endpoints differing only in their redacted parts, like two API keys
+        # on one host, are told apart by their position
+        names = Counter(endpoint.name for endpoint in endpoints)
+        self.states = [
+            EndpointState(
+                endpoint,
+                endpoint.name if names[endpoint.name] == 1 else f"{endpoint.name}#{i}",
+                RateLimiter(endpoint.rate_limit) if endpoint.rate_limit else None,
+            )
+            for i, endpoint in enumerate(endpoints)
+        ]
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._lock = threading.Lock()
+
+    def __str__(self) -> str:
+        return f"LoadBalancedProvider({[s.name for s in self.states]})"
+
+    def _is_available(self, state: EndpointState, now: float) -> bool:
+        return (
+            state.budget_left and state.open_until <= now and not state.trial_in_flight
+        )
+
+    def _select(self, excluded: List[EndpointState]) -> Optional[EndpointState]:
+        with self._lock:
+            now = monotonic()
+            candidates = [
+                s
+                for s in self.states
+                if s not in excluded and self._is_available(s, now)
+            ]
+            if not candidates:
+                return None
+            total = sum(s.endpoint.weight for s in candidates)
+            for s in candidates:
+                s.current_weight += s.endpoint.weight
+            selected = max(candidates, key=lambda s: s.current_weight)
+            selected.current_weight -= total
+            if selected.open_until:
+                # The open period is over: this is the single trial request
+                selected.open_until = 0.0
+                selected.trial_in_flight = True
+            selected.metrics.requests += 1
+            return selected
+
+    def _record(self, state: EndpointState, latency: float, failed: Optional[bool]):
+        """Records a request's outcome; `failed` is None when the outcome says
+        nothing about the endpoint's health."""
+        with self._lock:
+            metrics = state.metrics
+            metrics.latency += latency
+            metrics.max_latency = max(metrics.max_latency, latency)
+            trial, state.trial_in_flight = state.trial_in_flight, False
+            if failed is None:
+                return
+            if not failed:
+                state.consecutive_failures = 0
+                return
+            metrics.errors += 1
+            state.consecutive_failures += 1
+            if trial or state.consecutive_failures >= self.failure_threshold:
+                state.open_until = monotonic() + self.reset_timeout
+                state.consecutive_failures = 0
+                metrics.circuit_opened += 1
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        request_data = self.encode_rpc_request(method, params)
+        tried: List[EndpointState] = []
+        last_error: Optional[Exception] = None
+        while True:
+            state = self._select(tried)
+            if state is None:
+                break
+            tried.append(state)
+            if state.limiter is not None:
+                state.limiter.acquire()
+            start = perf_counter()
+            try:
+                response = self.session.post(
+                    state.endpoint.url,
+                    data=request_data,
+                    headers={"Content-Type": "application/json"},
+                    timeout=self.timeout,
+                )
+                if response.status_code in UNHEALTHY_STATUS_CODES:
+                    raise requests.exceptions.HTTPError(
+                        f"{response.status_code} from {state.name}",
+                        response=response,
+                    )
+                decoded = self.decode_rpc_response(response.content)
+            except requests.exceptions.ReadTimeout:
+                self._record(state, perf_counter() - start, failed=None)
+                raise
+            except (requests.exceptions.RequestException, ValueError) as e:
+                self._record(state, perf_counter() - start, failed=True)
+                last_error = e
+                continue
+            self._record(state, perf_counter() - start, failed=False)
+            return decoded
+
+        raise NoEndpointAvailable(f"No RPC endpoint available for {method}") from (
+            last_error
+        )
+
+    def get_metrics(self) -> Dict[str, dict]:
+        with self._lock:
+            return {s.name: s.metrics.to_dict() for s in self.states}
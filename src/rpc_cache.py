@@ -0,0 +1,246 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+from time import time
+from typing import Any, Callable, Optional, Tuple
+
+from web3 import Web3
+from web3.types import RPCEndpoint, RPCResponse
+
+from src.data_extraction.codec import SELECTORS
+from src.paths import DATA_DIR
+
+RPC_CACHE_PATH = DATA_DIR / "cache" / "rpc_cache.sqlite"
+
+CACHE_MODES = ("off", "cache", "record", "replay")
+
+# Calls whose result never changes, whatever block they run at
+IMMUTABLE_CALLS = {"0x" + SELECTORS[name].hex() for name in ("underlying", "decimals")}
+# Calls whose result changes rarely, cached for `latest_ttl` when not pinned
+STABLE_CALLS = {"0x" + SELECTORS[name].hex() for name in ("getAllMarkets", "oracle")}
+NAMED_BLOCKS = ("latest", "pending", "earliest", "safe", "finalized")
+
+
+class CacheMissError(Exception):
+    pass
+
+
+class ResponseCache:
+    """On-disk store of JSON-RPC results, keyed by namespace, method and
+    params.
+
+    Entries are zlib-compressed rows in SQLite. Once the database's used
+    pages go over `max_bytes`, the least recently used entries are evicted
+    down to 90% of it. The size is read from the database rather than
+    tallied, so it stays right when several processes share the file. Safe
+    to share between threads.
+    """
+
+    def __init__(self, path: Path = RPC_CACHE_PATH, max_bytes: int = 2**30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(
+            str(path), check_same_thread=False, isolation_level=None, timeout=30.0
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key BLOB PRIMARY KEY, value BLOB, size INTEGER, "
+            "accessed REAL, expires_at REAL)"
+        )
+        self._lock = threading.Lock()
+        (self._page_size,) = self._connection.execute("PRAGMA page_size").fetchone()
+
+    @staticmethod
+    def key(namespace: str, method: str, params: Any) -> bytes:
+        request = json.dumps([namespace, method, params], sort_keys=True)
+        return hashlib.sha256(request.encode()).digest()
+
+    def get(self, key: bytes, include_expired: bool = False) -> Optional[Any]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            now = time()
+            expired = row is not None and row[1] is not None and row[1] < now
+            if row is None or (expired and not include_expired):
+                self.misses += 1
+                return None
+            self._connection.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (now, key)
+            )
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, key: bytes, result: Any, ttl: Optional[float] = None):
+        value = zlib.compress(json.dumps(result).encode(), 1)
+        now = time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now + ttl if ttl is not None else None),
+            )
+            size = self._get_size()
+            if size > self.max_bytes:
+                self._evict(size - int(self.max_bytes * 0.9))
+
+    def _get_size(self) -> int:
+        """Bytes of the database's pages in use, by every process."""
+        (page_count,) = self._connection.execute("PRAGMA page_count").fetchone()
+        (free_pages,) = self._connection.execute("PRAGMA freelist_count").fetchone()
+        return (page_count - free_pages) * self._page_size
+
+    def _evict(self, excess_bytes: int):
+        rows = self._connection.execute(
+            "SELECT key, size FROM responses ORDER BY accessed"
+        )
+        evicted = []
+        for key, size in rows:
+            if excess_bytes <= 0:
+                break
+            evicted.append((key,))
+            excess_bytes -= size
+        self._connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._get_size()
+        return {"hits": self.hits, "misses": self.misses, "bytes": size}
+
+    def close(self):
+        self._connection.close()
+
+
+def _block_number(block: Any) -> Optional[int]:
+    if isinstance(block, int):
+        return block
+    if isinstance(block, str) and block not in NAMED_BLOCKS:
+        return int(block, 16)
+    return None
+
+
+def get_cache_policy(
+    method: str,
+    params: Any,
+    get_head: Callable[[], int],
+    finality_depth: int,
+    latest_ttl: float,
+) -> Tuple[bool, Optional[float]]:
+    """Whether a request's result is deterministic enough to cache, and for
+    how long (None meaning forever)."""
+    if method in ("eth_chainId", "net_version"):
+        return True, None
+    if method == "eth_call":
+        transaction, block = params[0], params[1] if len(params) > 1 else "latest"
+        selector = str(transaction.get("data", ""))[:10]
+        if selector in IMMUTABLE_CALLS:
+            return True, None
+        if isinstance(block, dict):
+            if "blockHash" in block:
+                return True, None
+            block = block.get("blockNumber", "latest")
+        # A block by number can still be reorged until it is final
+        number = _block_number(block)
+        if number is not None and number <= get_head() - finality_depth:
+            return True, None
+        if selector in STABLE_CALLS:
+            return True, latest_ttl
+        return False, None
+    if method == "eth_getLogs":
+        log_filter = params[0]
+        if "blockHash" in log_filter:
+            return True, None
+        to_block = _block_number(log_filter.get("toBlock", "latest"))
+        if to_block is not None and to_block <= get_head() - finality_depth:
+            return True, None
+    return False, None
+
+
+def construct_response_cache_middleware(
+    cache: ResponseCache,
+    namespace: str,
+    mode: str = "cache",
+    finality_depth: int = 64,
+    latest_ttl: float = 3600.0,
+):
+    """Web3 middleware serving deterministic requests from `cache`.
+
+    - "cache" stores and serves eth_call by block hash or at least
+      `finality_depth` blocks behind the head (plus calls that never change,
+      like `underlying()`), eth_getLogs ranges as far behind, and the chain id.
+    - "record" also stores every other successful response, so the run can
+      be replayed.
+    - "replay" serves everything from the cache, expired or not, and never
+      reaches the provider; a request that was not recorded raises
+      CacheMissError.
+
+    `namespace` must differ between chains sharing a cache file.
+    """
+    if mode not in CACHE_MODES:
+        raise ValueError(f"Unknown cache mode {mode}")
+
+    def response_cache_middleware(
+        make_request: Callable[[RPCEndpoint, Any], RPCResponse], w3: Web3
+    ) -> Callable[[RPCEndpoint, Any], RPCResponse]:
+        if mode == "off":
+            return make_request
+
+        head = {"block": None}
+
+        def get_head() -> int:
+            if head["block"] is None:
+                head["block"] = int(make_request("eth_blockNumber", [])["result"], 16)
+            return head["block"]
+
+        def middleware(method: RPCEndpoint, params: Any) -> RPCResponse:
+            key = ResponseCache.key(namespace, method, params)
+            if mode == "replay":
+                result = cache.get(key, include_expired=True)
+                if result is None:
+                    raise CacheMissError(f"{method} {params} was not recorded")
+                return {"jsonrpc": "2.0", "id": 0, "result": result}
+
+            cacheable, ttl = get_cache_policy(
+                method, params, get_head, finality_depth, latest_ttl
+            )
+            if cacheable:
+                result = cache.get(key)
+                if result is not None:
+                    return {"jsonrpc": "2.0", "id": 0, "result": result}
+
+            response = make_request(method, params)
+            if "error" in response or response.get("result") is None:
+                return response
+            if method == "eth_blockNumber":
+                head["block"] = int(response["result"], 16)
+            if cacheable:
+                cache.put(key, response["result"], ttl)
+            elif mode == "record":
+                cache.put(key, response["result"])
+            return response
+
+        return middleware
+
+    return response_cache_middleware
+
+
+def add_response_cache(
+    w3: Web3, namespace: str, mode: str = "cache", path: Path = RPC_CACHE_PATH
+) -> Optional[ResponseCache]:
+    """Installs the response cache closest to the provider, so it stores raw
+    results. Returns the cache, or None when `mode` is "off"."""
+    if mode == "off":
+        return None
+    cache = ResponseCache(path)
+    w3.middleware_onion.inject(
+        construct_response_cache_middleware(cache, namespace, mode),
+        name="response_cache",
+        layer=0,
+    )
+    return cache
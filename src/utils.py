@@ -1,43 +1,70 @@
 from dotenv import load_dotenv
 from os import getenv
-from web3 import Web3, HTTPProvider
+from typing import List, Optional
+from web3 import Web3
+
+from src.rpc import Endpoint, LoadBalancedProvider
 
 load_dotenv()
 INFURA_API_KEY = getenv("INFURA_API_KEY")
 GETBLOCK_API_KEY = getenv("GETBLOCK_API_KEY")
 CRONOS_API_KEY = getenv("CRONOS_API_KEY")
 
+# Default RPC endpoints of each network, overridable with `<NETWORK>_RPC_URLS`
+# as comma-separated `url` or `url|weight` items
+RPC_URLS = {
+    "ETH": [f"https://mainnet.infura.io/v3/{INFURA_API_KEY}"],
+    "AVAX": [f"https://avalanche-mainnet.infura.io/v3/{INFURA_API_KEY}"],
+    "NEAR": ["https://mainnet.aurora.dev"],
+    "CRO": [f"https://mainnet-archive.cronoslabs.com/v1/{CRONOS_API_KEY}"],
+    "BSC": ["https://bsc-dataseed.binance.org"],
+    "MATIC": ["https://polygon-rpc.com"],
+    "FTM": ["https://rpc.ftm.tools"],
+    "MOONBEAM": ["https://rpc.api.moonbeam.network"],
+}
 
-def get_ethereum_web3_client(network: str) -> Web3:
-    url = f"https://{network}.infura.io/v3/{INFURA_API_KEY}"
-    print(f"Connecting to {url}")
-    client = Web3(HTTPProvider(url))
+
+def get_rpc_endpoints(
+    network: str, rate_limit: Optional[float] = None
+) -> List[Endpoint]:
+    configured = getenv(f"{network}_RPC_URLS")
+    items = configured.split(",") if configured else RPC_URLS[network]
+    endpoints = []
+    for item in items:
+        url, _, weight = item.strip().partition("|")
+        endpoints.append(Endpoint(url, int(weight or 1), rate_limit))
+    return endpoints
+
+
+def get_web3_client_from_endpoints(
+    endpoints: List[Endpoint], pool_size: int = 16
+) -> Web3:
+    provider = LoadBalancedProvider(endpoints, pool_size=pool_size)
+    print(f"Connecting to {provider}")
+    client = Web3(provider)
     assert client.isConnected(), "Web3 client is not connected"
     return client
 
 
+def get_web3_client(network: str, pool_size: int = 16) -> Web3:
+    return get_web3_client_from_endpoints(get_rpc_endpoints(network), pool_size)
+
+
+def get_ethereum_web3_client(network: str) -> Web3:
+    if network == "mainnet":
+        return get_web3_client("ETH")
+    return get_web3_client_from_endpoints(
+        [Endpoint(f"https://{network}.infura.io/v3/{INFURA_API_KEY}")]
+    )
+
+
 def get_near_web3_client() -> Web3:
-    load_dotenv()
-    url = f"https://avalanche-mainnet.infura.io/v3/{INFURA_API_KEY}"
-    print(f"Connecting to {url}")
-    client = Web3(HTTPProvider(url))
-    assert client.isConnected(), "Web3 client is not connected"
-    return client
+    return get_web3_client("NEAR")
 
 
 def get_avalanche_web3_client() -> Web3:
-    load_dotenv()
-    url = f"https://avalanche-mainnet.infura.io/v3/{INFURA_API_KEY}"
-    print(f"Connecting to {url}")
-    client = Web3(HTTPProvider(url))
-    assert client.isConnected(), "Web3 client is not connected"
-    return client
+    return get_web3_client("AVAX")
 
 
 def get_cronos_web3_client() -> Web3:
-    load_dotenv()
-    url = f"https://mainnet-archive.cronoslabs.com/v1/{CRONOS_API_KEY}"
-    print(f"Connecting to {url}")
-    client = Web3(HTTPProvider(url))
-    assert client.isConnected(), "Web3 client is not connected"
-    return client
+    return get_web3_client("CRO")
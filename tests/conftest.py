@@ -0,0 +1,45 @@
+import pytest
+from web3 import HTTPProvider, Web3
+
+from src.data_extraction.compound import CompoundDataExtractor
+from src.protocols_data import CompoundProtocolReference
+from tests.stub_rpc import JsonRpcServer, StubChain
+
+
+@pytest.fixture
+def chain() -> StubChain:
+    return StubChain()
+
+
+@pytest.fixture
+def node(chain):
+    server = JsonRpcServer(chain)
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def w3(node) -> Web3:
+    return Web3(HTTPProvider(node.url))
+
+
+@pytest.fixture
+def protocol_info(chain) -> CompoundProtocolReference:
+    return CompoundProtocolReference(
+        comptroller_address=chain.comptroller,
+        ceth_address=chain.market_addresses[0],
+        deploy_block=0,
+        block_step_in_init=20_000,
+        multicall_size=5,
+    )
+
+
+@pytest.fixture
+def make_extractor(w3, protocol_info):
+    def make_extractor(**kwargs) -> CompoundDataExtractor:
+        # Oracle prices keep the run on the stub node
+        return CompoundDataExtractor(
+            w3, protocol_info, "ETH", price_source="oracle", **kwargs
+        )
+
+    return make_extractor
@@ -0,0 +1,335 @@
+"""Local stand-ins for RPC nodes, so extraction code can be tested offline."""
+
+import json
+import random
+import threading
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import eth_abi
+from eth_utils import event_signature_to_log_topic, keccak, to_checksum_address
+
+from src.data_extraction.codec import SELECTORS
+
+CALL_NAMES = {selector: name for name, selector in SELECTORS.items()}
+TOPICS = {
+    name: event_signature_to_log_topic(signature)
+    for name, signature in (
+        ("MarketEntered", "MarketEntered(address,address)"),
+        ("MarketExited", "MarketExited(address,address)"),
+        ("Mint", "Mint(address,uint256,uint256)"),
+    )
+}
+ZERO_HASH = "0x" + "00" * 32
+
+
+class RpcError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+# Answers a JSON-RPC method and params with a result, or raises RpcError
+RpcHandler = Callable[[str, list], Any]
+
+
+class JsonRpcServer:
+    """HTTP JSON-RPC server on a free local port, answering with `handler`.
+
+    `status_code`, when set, is returned instead of any answer, and `delay`
+    is slept before every answer. Requests are counted, with the most seen
+    in flight at once.
+    """
+
+    def __init__(self, handler: RpcHandler):
+        self.handler = handler
+        self.status_code: Optional[int] = None
+        self.delay = 0.0
+        self.requests = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                with server._lock:
+                    server.requests += 1
+                    server._in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server._in_flight)
+                try:
+                    if server.delay:
+                        sleep(server.delay)
+                    status_code = server.status_code
+                    if status_code is None:
+                        data = json.dumps(server.answer(json.loads(body))).encode()
+                finally:
+                    with server._lock:
+                        server._in_flight -= 1
+                if status_code is not None:
+                    self.send_response(status_code)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), RequestHandler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, args=(0.05,), daemon=True
+        )
+        self._thread.start()
+
+    def answer(self, request: dict) -> dict:
+        try:
+            result = self.handler(request["method"], request.get("params", []))
+        except RpcError as e:
+            return {
+                "jsonrpc": "2.0",
+                "id": request["id"],
+                "error": {"code": e.code, "message": e.message},
+            }
+        return {"jsonrpc": "2.0", "id": request["id"], "result": result}
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _address(seed: bytes) -> str:
+    return to_checksum_address(seed.rjust(20, b"\0"))
+
+
+@dataclass
+class Log:
+    block: int
+    address: str
+    event: str
+    # ABI-encoded non-indexed arguments
+    data: bytes
+
+
+@dataclass
+class StubChain:
+    """A Compound deployment, multicall contract and price oracle that answer
+    JSON-RPC like a node.
+
+    Balances do not depend on the block. Calls about `reverting_accounts`
+    fail inside multicalls. `max_logs` caps the logs one `eth_getLogs` may
+    return, like hosted nodes do. The blocks `eth_call` ran at and the number
+    of calls in each multicall are recorded.
+    """
+
+    users: int = 40
+    markets: int = 4
+    head: int = 100_000
+    max_logs: int = 10_000
+    seed: int = 0
+    reverting_accounts: Set[str] = field(default_factory=set)
+    hash_salt: bytes = b""
+
+    def __post_init__(self):
+        rng = random.Random(self.seed)
+        self.comptroller = _address(b"\xcc" * 20)
+        self.oracle = _address(b"\x0c" * 20)
+        self.market_addresses = [
+            _address(bytes([0xAA, i])) for i in range(self.markets)
+        ]
+        self.underlyings = {
+            market: _address(bytes([0xBB, i]))
+            for i, market in enumerate(self.market_addresses)
+        }
+        self.user_addresses = [
+            to_checksum_address(rng.randbytes(20)) for _ in range(self.users)
+        ]
+        self.assets_in: Dict[str, List[str]] = {}
+        self.balances: Dict[Tuple[str, str], int] = {}
+        self.logs: List[Log] = []
+        for user in self.user_addresses:
+            entered = rng.sample(self.market_addresses, rng.randint(1, self.markets))
+            for market in entered:
+                self.enter_market(user, market, rng.randint(1, self.head))
+                self.balances[(user, market)] = rng.randint(1, 10**24)
+        self.eth_calls = 0
+        self.call_blocks: Set[Any] = set()
+        self.multicall_sizes: List[int] = []
+
+    def enter_market(self, user: str, market: str, block: int):
+        self.assets_in.setdefault(user, []).append(market)
+        self.add_log(block, self.comptroller, "MarketEntered", market, user)
+
+    def exit_market(self, user: str, market: str, block: int):
+        self.assets_in[user].remove(market)
+        self.balances.pop((user, market), None)
+        self.add_log(block, self.comptroller, "MarketExited", market, user)
+
+    def mint(self, user: str, market: str, block: int, amount: int):
+        self.balances[(user, market)] = self.balances.get((user, market), 0) + amount
+        self.logs.append(
+            Log(
+                block,
+                market,
+                "Mint",
+                eth_abi.encode_abi(
+                    ["address", "uint256", "uint256"], [user, amount, 0]
+                ),
+            )
+        )
+
+    def add_log(self, block: int, address: str, event: str, market: str, user: str):
+        data = eth_abi.encode_abi(["address", "address"], [market, user])
+        self.logs.append(Log(block, address, event, data))
+
+    def price(self, market: str) -> int:
+        return (self.market_addresses.index(market) + 1) * 10**18
+
+    def call(self, to: str, data: bytes, block: int) -> Tuple[bool, bytes]:
+        """Runs a contract call, returning whether it succeeded and its output."""
+        name, args = CALL_NAMES.get(data[:4]), data[4:]
+        if name in ("tryAggregate", "tryBlockAndAggregate"):
+            _, calls = eth_abi.decode_abi(["bool", "(address,bytes)[]"], args)
+            self.multicall_sizes.append(len(calls))
+            results = [
+                self.call(to_checksum_address(target), call_data, block)
+                for target, call_data in calls
+            ]
+            if name == "tryAggregate":
+                return True, eth_abi.encode_abi(["(bool,bytes)[]"], [results])
+            return True, eth_abi.encode_abi(
+                ["uint256", "bytes32", "(bool,bytes)[]"],
+                [block, bytes(32), results],
+            )
+        account = (
+            to_checksum_address(eth_abi.decode_abi(["address"], args)[0])
+            if len(args) == 32
+            else None
+        )
+        if account in self.reverting_accounts:
+            return False, b""
+        if name == "getAllMarkets":
+            return True, eth_abi.encode_abi(["address[]"], [self.market_addresses])
+        if name == "getAssetsIn":
+            return True, eth_abi.encode_abi(
+                ["address[]"], [self.assets_in.get(account, [])]
+            )
+        if name in ("balanceOf", "balanceOfUnderlying", "borrowBalanceStored"):
+            balance = self.balances.get((account, to), 0)
+            return True, eth_abi.encode_abi(
+                ["uint256"],
+                [balance // 3 if name == "borrowBalanceStored" else balance],
+            )
+        if name == "underlying" and to in self.underlyings:
+            return True, eth_abi.encode_abi(["address"], [self.underlyings[to]])
+        if name == "oracle":
+            return True, eth_abi.encode_abi(["address"], [self.oracle])
+        if name == "getUnderlyingPrice":
+            price = self.price(account) if account in self.market_addresses else 0
+            return True, eth_abi.encode_abi(["uint256"], [price])
+        return False, b""
+
+    def _block_number(self, block: Any) -> int:
+        return self.head if block in ("latest", "pending") else int(block, 16)
+
+    def get_logs(self, log_filter: dict) -> List[dict]:
+        from_block = int(log_filter["fromBlock"], 16)
+        to_block = int(log_filter["toBlock"], 16)
+        addresses = log_filter.get("address")
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        addresses = {a.lower() for a in addresses} if addresses else None
+        topics = (log_filter.get("topics") or [None])[0]
+        if isinstance(topics, str):
+            topics = [topics]
+        topics = {bytes.fromhex(t[2:]) for t in topics} if topics else None
+
+        matching = [
+            log
+            for log in self.logs
+            if from_block <= log.block <= to_block
+            and (addresses is None or log.address.lower() in addresses)
+            and (topics is None or TOPICS[log.event] in topics)
+        ]
+        if len(matching) > self.max_logs:
+            raise RpcError(-32005, f"query returned more than {self.max_logs} results")
+        matching.sort(key=lambda log: log.block)
+        return [
+            {
+                "address": log.address,
+                "topics": ["0x" + TOPICS[log.event].hex()],
+                "data": "0x" + log.data.hex(),
+                "blockNumber": hex(log.block),
+                "blockHash": ZERO_HASH,
+                "transactionHash": ZERO_HASH,
+                "transactionIndex": "0x0",
+                "logIndex": hex(i),
+                "removed": False,
+            }
+            for i, log in enumerate(matching)
+        ]
+
+    def get_block(self, number: int) -> dict:
+        block_hash = keccak(self.hash_salt + number.to_bytes(32, "big"))
+        return {
+            "number": hex(number),
+            "hash": "0x" + block_hash.hex(),
+            "parentHash": ZERO_HASH,
+            "timestamp": hex(1_600_000_000 + 12 * number),
+            "transactions": [],
+            "uncles": [],
+            "gasLimit": "0x0",
+            "gasUsed": "0x0",
+            "miner": "0x" + "00" * 20,
+            "difficulty": "0x0",
+            "totalDifficulty": "0x0",
+            "size": "0x0",
+            "extraData": "0x",
+            "logsBloom": "0x" + "00" * 256,
+            "nonce": "0x" + "00" * 8,
+            "sha3Uncles": ZERO_HASH,
+            "stateRoot": ZERO_HASH,
+            "receiptsRoot": ZERO_HASH,
+            "transactionsRoot": ZERO_HASH,
+            "mixHash": ZERO_HASH,
+        }
+
+    def __call__(self, method: str, params: list) -> Any:
+        if method == "eth_chainId":
+            return "0x1"
+        if method == "net_version":
+            return "1"
+        if method == "web3_clientVersion":
+            return "stub"
+        if method == "eth_blockNumber":
+            return hex(self.head)
+        if method == "eth_getBlockByNumber":
+            return self.get_block(self._block_number(params[0]))
+        if method == "eth_getLogs":
+            return self.get_logs(params[0])
+        if method == "eth_call":
+            transaction, block = params[0], params[1]
+            self.eth_calls += 1
+            self.call_blocks.add(block)
+            success, output = self.call(
+                to_checksum_address(transaction["to"]),
+                bytes.fromhex(transaction["data"][2:]),
+                self._block_number(block),
+            )
+            if not success:
+                raise RpcError(3, "execution reverted")
+            return "0x" + output.hex()
+        raise RpcError(-32601, f"Method {method} not found")
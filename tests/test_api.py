@@ -0,0 +1,234 @@
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from api import app as app_module
+from api.utils.curve_data_loader import CurveData
+from api.utils.history_lookup import interpolate_snapshots
+from src.curve_history import CurveHistory, CurveSnapshot
+
+
+def make_curve(price_change, total_liquidation, slippage) -> CurveData:
+    return CurveData(
+        price_change=np.asarray(price_change, dtype=np.float64),
+        total_liquidation=np.asarray(total_liquidation, dtype=np.float64),
+        liquidation_slippage=np.asarray(slippage, dtype=np.float64),
+        mtime_ns=0,
+    )
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(
+        app_module.curve_store,
+        "_curves",
+        {
+            "eth": make_curve([0.1, 0.5], [100.0, 300.0], [0.99, 0.9]),
+            "wbtc": make_curve([], [], []),
+        },
+    )
+    # Without a context manager the startup handlers, which load files, never run
+    return TestClient(app_module.app)
+
+
+def test_get_accumulated_debt(client):
+    response = client.get(
+        "/getAccumulatedDebt", params={"asset": "ETH", "priceDescent": 3 * 10**17}
+    )
+    assert response.status_code == 200
+    assert response.json()["accumulatedLiquidations"] == str(300 * 10**18)
+
+
+def test_unknown_asset_is_an_error(client):
+    response = client.get(
+        "/getAccumulatedDebt", params={"asset": "doge", "priceDescent": 0}
+    )
+    assert response.status_code == 200
+    assert "error" in response.json()
+
+
+def test_empty_curve_is_an_error(client):
+    response = client.get(
+        "/getAccumulatedDebt", params={"asset": "wbtc", "priceDescent": 10**17}
+    )
+    assert response.status_code == 200
+    assert "error" in response.json()
+
+    response = client.post(
+        "/getAccumulatedDebtBatch",
+        json={"asset": "wbtc", "priceDescents": [0, 10**17]},
+    )
+    assert response.status_code == 200
+    assert "error" in response.json()
+
+
+@pytest.fixture
+def compact_curve(monkeypatch):
+    # Wei values far past 2**64, and fractions that are inexact in binary
+    curve = make_curve(
+        [0.0, 0.1, 0.35, 1.0],
+        [22.8768, 1164081.43, 5e6, 1.2e10],
+        [1.0, 0.9993, 0.98, 0.5],
+    )
+    monkeypatch.setattr(app_module.compact_curve_store, "_curves", {"eth": curve})
+    return curve
+
+
+def get_compacted(client, encoding: str, **headers):
+    return client.get(
+        "/getCompactedCurve",
+        params={"asset": "ETH", "encoding": encoding},
+        headers=headers,
+    )
+
+
+def test_compacted_curve_is_revalidated_with_its_etag(client, compact_curve):
+    response = get_compacted(client, "absolute")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    for if_none_match in [etag, f"W/{etag}", f'"other", {etag}', "*"]:
+        cached = get_compacted(client, "absolute", **{"If-None-Match": if_none_match})
+        assert (cached.status_code, cached.content) == (304, b"")
+        assert cached.headers["ETag"] == etag
+    assert get_compacted(client, "absolute", **{"If-None-Match": '"other"'}).json()
+
+    # Each encoding is its own representation
+    delta = get_compacted(client, "delta", **{"If-None-Match": etag})
+    assert delta.status_code == 200
+    assert delta.headers["ETag"] != etag
+
+
+def test_delta_encoding_round_trips_exactly(client, compact_curve):
+    absolute = get_compacted(client, "absolute").json()
+    delta = get_compacted(client, "delta").json()
+    assert delta["encoding"] == "delta"
+
+    for column in ["priceDescents", "accumulatedLiquidations", "slippages"]:
+        restored = np.cumsum([int(v) for v in delta[column]], dtype=object)
+        assert [str(v) for v in restored] == absolute[column]
+    assert absolute["accumulatedLiquidations"] == [
+        str(int(v * 1e18)) for v in compact_curve.total_liquidation
+    ]
+    assert "error" in client.get("/getCompactedCurve", params={"asset": "doge"}).json()
+
+
+@pytest.fixture
+def history(client, monkeypatch, tmp_path):
+    history = CurveHistory(tmp_path / "curves.sqlite")
+    curve = {
+        "price_change": [0.1, 0.5],
+        "total_liquidation": [100.0, 300.0],
+        "liquidation_slippage": [0.99, 0.9],
+        "equilibrium_price": [0.8, 0.4],
+    }
+    for i in range(5):
+        history.append("eth", 1_000 + i, 100 * i, curve)
+    monkeypatch.setattr(app_module.app.state, "curve_history", history, raising=False)
+    monkeypatch.setattr(app_module, "MAX_HISTORY_SNAPSHOTS", 2)
+    yield history
+    history.close()
+
+
+def get_history(client, asset, start, end):
+    response = client.get(
+        "/getAccumulatedDebtHistory",
+        params={"asset": asset, "priceDescent": 0, "start": start, "end": end},
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_history_is_paged(client, history):
+    timestamps, start = [], 0
+    while start is not None:
+        page = get_history(client, "eth", start, 1_000)
+        assert len(page["timestamps"]) <= 2
+        assert page["truncated"] == (page["nextStart"] is not None)
+        timestamps += page["timestamps"]
+        start = page["nextStart"]
+    assert timestamps == [0, 100, 200, 300, 400]
+
+
+def test_history_of_unknown_asset_is_an_error(client, history):
+    assert "error" in get_history(client, "doge", 0, 1_000)
+
+    empty = get_history(client, "eth", 10_000, 20_000)
+    assert (empty["timestamps"], empty["truncated"]) == ([], False)
+
+
+EMPTY_CURVE = {
+    "price_change": [],
+    "total_liquidation": [],
+    "liquidation_slippage": [],
+    "equilibrium_price": [],
+}
+
+
+def test_history_leaves_out_snapshots_without_points(client, history):
+    history.append("eth", 999, -100, EMPTY_CURVE)
+    history.append("eth", 1_010, 1_000, EMPTY_CURVE)
+
+    # The empty snapshot still counts towards the page size
+    page = get_history(client, "eth", -100, 100)
+    assert (page["timestamps"], page["nextStart"]) == ([0], 100)
+    assert page["accumulatedLiquidations"] == [str(100 * 10**18)]
+    assert get_history(client, "eth", 1_000, 1_000)["timestamps"] == []
+
+
+def test_debt_at_a_snapshot_without_points_is_an_error(client, history):
+    history.append("eth", 1_010, 1_000, EMPTY_CURVE)
+
+    def debt_at(block):
+        response = client.get(
+            "/getAccumulatedDebtAt",
+            params={"asset": "eth", "priceDescent": 3 * 10**17, "block": block},
+        )
+        assert response.status_code == 200
+        return response.json()
+
+    # Halfway between the two points, like np.interp
+    assert debt_at(1_004)["accumulatedLiquidations"] == str(200 * 10**18)
+    assert debt_at(1_004)["block"] == 1_004
+    assert "error" in debt_at(1_010)
+    assert "error" in debt_at(10)
+
+
+def make_snapshot(timestamp: int, points: int, rng) -> CurveSnapshot:
+    price_change = np.sort(rng.uniform(0, 1, points))
+    data = np.stack([price_change, *rng.uniform(0, 1e6, (3, points))])
+    return CurveSnapshot(
+        asset="eth",
+        block=timestamp,
+        timestamp=timestamp,
+        columns=(
+            "price_change",
+            "total_liquidation",
+            "liquidation_slippage",
+            "equilibrium_price",
+        ),
+        data=data,
+    )
+
+
+@pytest.mark.parametrize("price_descent", [0.0, 0.01, 0.3, 0.5, 0.99, 1.0])
+def test_interpolate_snapshots_matches_np_interp(price_descent):
+    rng = np.random.default_rng(0)
+    # Empty snapshots first and in the middle, and a single-point one
+    lengths = [0, 5, 1, 0, 0, 40, 3, 0, 12]
+    snapshots = [make_snapshot(i, n, rng) for i, n in enumerate(lengths)]
+
+    values = interpolate_snapshots(snapshots, price_descent)
+    for column in ["total_liquidation", "liquidation_slippage", "equilibrium_price"]:
+        expected = [
+            (
+                np.interp(price_descent, s.get("price_change"), s.get(column))
+                if s.data.shape[1] > 0
+                else np.nan
+            )
+            for s in snapshots
+        ]
+        np.testing.assert_allclose(values[column], expected)
+
+    empty = interpolate_snapshots([make_snapshot(0, 0, rng)], price_descent)
+    assert np.isnan(empty["total_liquidation"]).all()
@@ -0,0 +1,169 @@
+import json
+import random
+from typing import List
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from etl.apply_model import (
+    ETHEREUM_COMPOUND_PATH,
+    LIQUIDATION_THESHOLD,
+    STABLECOIN_MARKETS,
+    compute_asset_curves,
+    compute_liquidation_curve,
+    flatten_users,
+    get_collateral_ratios,
+    get_liquidation_positions,
+    get_liquidity_book,
+    get_slippage_model,
+    iter_users,
+)
+from etl.extract_data import get_jobs
+
+MARKETS = {
+    "ETH": "0x4Ddc2D193948926D02f9B1fE9e1daa0718270ED5",
+    "WBTC": "0xccF4429DB6322D5C611ee964527D42E5d685DD6a",
+    "UNI": "0x35A18000230DA775CAc24873d00Ff85BccdeD550",
+    "DAI": "0x5d3a536E4D6DbD6114cc1Ead35777bAB948E3643",
+}
+
+
+@pytest.fixture(scope="module")
+def users() -> List[dict]:
+    rng = random.Random(0)
+    users = []
+    for i in range(2_000):
+        markets = [
+            {"market": MARKETS[symbol], "collateral": rng.lognormvariate(7, 2)}
+            for symbol in rng.sample(list(MARKETS), rng.randint(1, 3))
+        ]
+        collateral = sum(m["collateral"] for m in markets)
+        debt = collateral * rng.uniform(0.1, 1.2)
+        users.append(
+            {
+                "user": f"0x{i:040x}",
+                "markets": markets,
+                "collateral": collateral,
+                "debt": debt,
+                "netValue": collateral - debt * rng.uniform(0, 1.2),
+            }
+        )
+    # Without markets, and on the 4-decimal rounding boundary of price change
+    users.append({**users[0], "user": "0x" + "ff" * 20, "markets": []})
+    for i, perc in enumerate([0.00015, 0.00035, 0.00065, 0.5, 0.5]):
+        # A collateral of 1 keeps the liquidation percentage exactly `perc`
+        users.append(
+            {
+                "user": f"0x{10**6 + i:040x}",
+                "markets": [{"market": MARKETS["ETH"], "collateral": 1.0}],
+                "collateral": 1.0,
+                "debt": perc,
+                "netValue": 1.0,
+            }
+        )
+    return users
+
+
+@pytest.fixture(scope="module")
+def frames(users):
+    return flatten_users(users)
+
+
+@pytest.fixture(scope="module")
+def liquidity():
+    return get_liquidity_book()
+
+
+def test_only_modelled_assets_get_curves(frames, liquidity):
+    df_users, df_markets = frames
+    curves = compute_asset_curves(df_users, df_markets, liquidity)
+
+    assert list(curves) == ["eth"]
+    ratio_eth = get_collateral_ratios(df_markets)["ETH"]
+    pd.testing.assert_frame_equal(
+        curves["eth"],
+        compute_liquidation_curve(df_users, df_markets, ratio_eth, liquidity),
+    )
+
+
+def test_default_input_is_the_compound_extraction(tmp_path):
+    (job,) = get_jobs(protocols=["compound"], networks=["ETH"])
+    assert job.save_to == str(ETHEREUM_COMPOUND_PATH)
+    assert ETHEREUM_COMPOUND_PATH.suffix == ".ndjson"
+
+    users = [{"user": "0x1", "markets": []}, {"user": "0x2", "markets": []}]
+    path = tmp_path / ETHEREUM_COMPOUND_PATH.name
+    path.write_text("".join(json.dumps(user) + "\n" for user in users))
+    assert list(iter_users(path)) == users
+
+
+def positions_with_dicts(users: List[dict]) -> pd.DataFrame:
+    """Liquidatable users the way the per-user dict pipeline found them."""
+    users = [u for u in users if len(u["markets"]) > 0]
+    users = [
+        {
+            **u,
+            "stable_collateral": np.sum(
+                [
+                    m["collateral"]
+                    for m in u["markets"]
+                    if m["market"] in STABLECOIN_MARKETS
+                ]
+            ),
+        }
+        for u in users
+    ]
+    users = [
+        {
+            **u,
+            "liquidation_value": (u["debt"] - u["stable_collateral"])
+            / LIQUIDATION_THESHOLD,
+        }
+        for u in users
+    ]
+    users = [
+        {
+            **u,
+            "liquidation_perc": u["liquidation_value"]
+            / (u["collateral"] - u["stable_collateral"]),
+        }
+        for u in users
+        if u["liquidation_value"] > 0 and u["collateral"] - u["stable_collateral"] > 0
+    ]
+    df = pd.DataFrame(users)
+    df["eth_collateral"] = df["collateral"] - df["stable_collateral"]
+    return df[(df["eth_collateral"] > 0) & (df["netValue"] > 0)]
+
+
+def curve_with_dicts(users: List[dict], ratio_eth: float, liquidity) -> pd.DataFrame:
+    """The liquidation curve the way the per-user dict pipeline built it."""
+    df = positions_with_dicts(users).sort_values("liquidation_perc", ascending=False)
+    df["total_liquidation"] = df["eth_collateral"].cumsum() * ratio_eth
+    df["liquidation_slippage"] = get_slippage_model(liquidity)(df["total_liquidation"])
+    df["price_change"] = (1 - df["liquidation_perc"]).apply(lambda x: round(x, 4))
+    return df.groupby("price_change", as_index=False).agg(
+        total_liquidation=pd.NamedAgg(column="total_liquidation", aggfunc="max"),
+        liquidation_slippage=pd.NamedAgg(column="liquidation_slippage", aggfunc="min"),
+    )
+
+
+def test_vectorized_transform_matches_the_dict_pipeline(users, frames, liquidity):
+    df_users, df_markets = frames
+    expected = positions_with_dicts(users)
+    liquidation_perc, eth_collateral = get_liquidation_positions(df_users, df_markets)
+    # Same users, in the same order
+    np.testing.assert_array_equal(liquidation_perc, expected["liquidation_perc"])
+    np.testing.assert_array_equal(eth_collateral, expected["eth_collateral"])
+    # Some price changes are rounded differently by np.round
+    price_change = 1 - liquidation_perc
+    assert np.any(
+        np.round(price_change, 4) != [round(float(x), 4) for x in price_change]
+    )
+
+    ratio_eth = get_collateral_ratios(df_markets)["ETH"]
+    curve = compute_liquidation_curve(df_users, df_markets, ratio_eth, liquidity)
+    expected = curve_with_dicts(users, ratio_eth, liquidity)
+    pd.testing.assert_frame_equal(
+        curve[list(expected.columns)], expected, check_exact=False, rtol=1e-12
+    )
@@ -0,0 +1,161 @@
+import random
+
+import eth_abi
+import pytest
+from eth_utils import to_checksum_address
+
+from src.abis import ABIS
+from src.data_extraction import codec
+from src.data_extraction.compound import MARKET_EVENT_ACCOUNTS, MEMBERSHIP_EVENTS
+
+rng = random.Random(0)
+ADDRESSES = [to_checksum_address(rng.randbytes(20)) for _ in range(8)]
+CALL_DATA = [b"", b"\x01", rng.randbytes(4), rng.randbytes(32), rng.randbytes(100)]
+
+
+def _call_results(n: int, seed: int):
+    rng = random.Random(seed)
+    return [
+        (rng.random() < 0.7, rng.randbytes(rng.choice([0, 31, 32, 33, 96])))
+        for _ in range(n)
+    ]
+
+
+@pytest.mark.parametrize("fn_name", ["getAssetsIn", "balanceOf", "borrowBalanceStored"])
+@pytest.mark.parametrize("address", ADDRESSES[:3])
+def test_encode_address_call(fn_name, address):
+    expected = codec.SELECTORS[fn_name] + eth_abi.encode_abi(["address"], [address])
+    assert codec.encode_address_call(fn_name, address) == expected
+    assert codec.encode_address_calls(fn_name, [address, address]) == [expected] * 2
+
+
+@pytest.mark.parametrize("value", [0, 1, 2**128 + 7, 2**256 - 1])
+def test_decode_uint256(value):
+    assert codec.decode_uint256(eth_abi.encode_abi(["uint256"], [value])) == value
+
+
+@pytest.mark.parametrize("value", [False, True])
+def test_decode_bool_as_uint256(value):
+    assert codec.decode_uint256(eth_abi.encode_abi(["bool"], [value])) == int(value)
+
+
+@pytest.mark.parametrize("address", ADDRESSES[:3])
+def test_decode_address(address):
+    assert codec.decode_address(eth_abi.encode_abi(["address"], [address])) == address
+
+
+@pytest.mark.parametrize("length", [0, 1, len(ADDRESSES)])
+def test_decode_address_array(length):
+    data = eth_abi.encode_abi(["address[]"], [ADDRESSES[:length]])
+    assert codec.decode_address_array(data) == ADDRESSES[:length]
+
+
+@pytest.mark.parametrize("decode", [codec.decode_uint256, codec.decode_address])
+def test_decode_short_data_fails(decode):
+    with pytest.raises(ValueError):
+        decode(bytes(31))
+
+
+def test_decode_truncated_address_array_fails():
+    data = eth_abi.encode_abi(["address[]"], [ADDRESSES])
+    with pytest.raises(ValueError):
+        codec.decode_address_array(data[:-32])
+
+
+def _calls(n: int):
+    return [
+        (ADDRESSES[i % len(ADDRESSES)], CALL_DATA[i % len(CALL_DATA)]) for i in range(n)
+    ]
+
+
+@pytest.mark.parametrize("fn_name", ["tryAggregate", "tryBlockAndAggregate"])
+@pytest.mark.parametrize("require_success", [False, True])
+@pytest.mark.parametrize("n", [1, 7])
+def test_encode_try_aggregate(fn_name, require_success, n):
+    calls = [(target, data) for target, data in _calls(n + 1) if data][:n]
+    expected = codec.SELECTORS[fn_name] + eth_abi.encode_abi(
+        ["bool", "(address,bytes)[]"], [require_success, calls]
+    )
+    assert codec.encode_try_aggregate(calls, require_success, fn_name) == expected
+
+
+@pytest.mark.parametrize("n", [0, 1, 7])
+def test_encode_try_aggregate_round_trips(n):
+    # eth_abi pads empty dynamic values with a zero word, which the canonical
+    # encoding does not, so empty call lists and data are compared decoded
+    calls = _calls(n)
+    data = codec.encode_try_aggregate(calls, True)
+    assert eth_abi.decode_abi(["bool", "(address,bytes)[]"], data[4:]) == (
+        True,
+        tuple((target.lower(), call_data) for target, call_data in calls),
+    )
+
+
+@pytest.mark.parametrize("n", [0, 1, 20])
+def test_decode_try_aggregate(n):
+    results = _call_results(n, n)
+    data = eth_abi.encode_abi(["(bool,bytes)[]"], [results])
+    assert codec.decode_try_aggregate(data) == results
+
+
+@pytest.mark.parametrize("n", [0, 1, 20])
+def test_decode_try_block_and_aggregate(n):
+    results = _call_results(n, n)
+    block_hash = random.Random(n).randbytes(32)
+    data = eth_abi.encode_abi(
+        ["uint256", "bytes32", "(bool,bytes)[]"], [12_345_678, block_hash, results]
+    )
+    assert codec.decode_try_block_and_aggregate(data) == (
+        12_345_678,
+        block_hash,
+        results,
+    )
+
+
+def test_decode_uint256_results_maps_failures_to_none():
+    results = _call_results(50, 1)
+    expected = [
+        (
+            eth_abi.decode_abi(["uint256"], data[:32])[0]
+            if success and len(data) >= 32
+            else None
+        )
+        for success, data in results
+    ]
+    assert None in expected
+    assert codec.decode_uint256_results(results) == expected
+
+
+def _event_abis():
+    for abi in ABIS.comptroller + ABIS.cToken:
+        if abi.get("type") != "event":
+            continue
+        if abi["name"] in MEMBERSHIP_EVENTS:
+            yield abi, ("account",)
+        elif abi["name"] in MARKET_EVENT_ACCOUNTS:
+            yield abi, MARKET_EVENT_ACCOUNTS[abi["name"]]
+
+
+@pytest.mark.parametrize(
+    "abi, names", list(_event_abis()), ids=lambda v: v["name"] if "name" in v else ""
+)
+def test_decode_log_addresses(abi, names):
+    values = {
+        arg["name"]: ADDRESSES[i] if arg["type"] == "address" else 10**20 + i
+        for i, arg in enumerate(abi["inputs"])
+    }
+    indexed = [arg for arg in abi["inputs"] if arg["indexed"]]
+    data_args = [arg for arg in abi["inputs"] if not arg["indexed"]]
+    topics = [bytes(32)] + [
+        eth_abi.encode_abi([arg["type"]], [values[arg["name"]]]) for arg in indexed
+    ]
+    data = eth_abi.encode_abi(
+        [arg["type"] for arg in data_args], [values[arg["name"]] for arg in data_args]
+    )
+
+    locations = codec.get_log_locations(abi, names)
+    assert codec.decode_log_addresses(topics, data, locations) == [
+        bytes.fromhex(values[name][2:]) for name in names
+    ]
+    # Malformed logs lose the accounts they are too short for
+    assert codec.decode_log_addresses(topics[:1], data[:31], locations) == []
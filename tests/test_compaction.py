@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from etl.apply_model import COMPACTION_MAX_ERROR
+from src.curve_artifact import CURVE_COLUMNS
+from src.model.compaction import compact_curve, simplify_curve
+
+
+def make_curve(points: int, rng) -> dict:
+    # Shaped like apply_model's: cumulative debt, slippage and price falling
+    total_liquidation = np.cumsum(rng.lognormal(8, 2, points))
+    slippage = 1 / (1 + total_liquidation / 1e8)
+    curve = {
+        "price_change": np.linspace(0, 1, points) ** 2,
+        "total_liquidation": total_liquidation,
+        "liquidation_slippage": slippage,
+        "equilibrium_price": (1 - np.linspace(0, 1, points)) * slippage,
+    }
+    # Unsorted, so compact_curve has to sort it
+    order = rng.permutation(points)
+    return {name: values[order] for name, values in curve.items()}
+
+
+@pytest.mark.parametrize("max_error", [COMPACTION_MAX_ERROR, 0.01, 0.0])
+def test_compacted_curve_stays_within_max_error(max_error):
+    rng = np.random.default_rng(0)
+    curve = make_curve(5_000, rng)
+    compacted = compact_curve(curve, CURVE_COLUMNS[1:], max_error)
+
+    x = np.sort(curve["price_change"])
+    order = np.argsort(curve["price_change"])
+    assert compacted["price_change"][[0, -1]].tolist() == [x[0], x[-1]]
+    if max_error > 0:
+        assert len(compacted["price_change"]) < len(x) / 10
+    for column in CURVE_COLUMNS[1:]:
+        full = curve[column][order]
+        restored = np.interp(x, compacted["price_change"], compacted[column])
+        # The tiny slack is floating point rounding of the chords
+        assert np.max(np.abs(restored - full)) <= max_error * np.ptp(full) + 1e-9
+        assert compacted[column][[0, -1]].tolist() == full[[0, -1]].tolist()
+
+
+def test_short_and_straight_curves():
+    assert simplify_curve(np.array([]), [np.array([])], 0.1).tolist() == []
+    assert simplify_curve(np.array([0.5]), [np.array([1.0])], 0.1).tolist() == [0]
+
+    x = np.linspace(0, 1, 100)
+    # Only the endpoints of a straight line, and of a flat column, are needed
+    assert simplify_curve(x, [3 * x + 1, np.ones(100)], 0.0).tolist() == [0, 99]
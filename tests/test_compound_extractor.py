@@ -0,0 +1,95 @@
+import json
+
+from src.data_extraction.extraction_state import ExtractionState
+
+
+def get_rows(table) -> dict:
+    return {address: table[address].to_dict() for address in table}
+
+
+def test_concurrent_multicalls_match_sequential(chain, node, make_extractor):
+    users = chain.user_addresses
+    sequential = make_extractor()._get_users_data(chain.market_addresses, users, 4)
+
+    node.delay = 0.02
+    node.max_in_flight = 0
+    concurrent = make_extractor(multicall_concurrency=4)._get_users_data(
+        chain.market_addresses, users, 4
+    )
+
+    assert concurrent.users == sequential.users == users
+    assert get_rows(concurrent) == get_rows(sequential)
+    assert 1 < node.max_in_flight <= 4
+
+
+def test_balances_are_read_for_entered_markets(chain, make_extractor):
+    extractor = make_extractor()
+    table = extractor._get_users_data(chain.market_addresses, chain.user_addresses, 4)
+
+    for user in chain.user_addresses:
+        borrower = table[user]
+        assert set(borrower.markets_in) == set(chain.assets_in[user])
+        for market in chain.assets_in[user]:
+            balance = chain.balances[(user, market)]
+            assert borrower.colletaral_balance[market] == balance
+            assert borrower.borrow_balances[market] == balance // 3
+    # One getAssetsIn per user, then collateral and borrow per entered market
+    entered = sum(len(markets) for markets in chain.assets_in.values())
+    users, markets = len(chain.user_addresses), len(chain.market_addresses)
+    assert extractor.calls_made == sum(chain.multicall_sizes) == users + 2 * entered
+    assert extractor.calls_saved == 2 * (users * markets - entered)
+
+
+def test_failed_calls_leave_markets_unknown(chain, make_extractor):
+    failing = chain.user_addresses[3]
+    chain.reverting_accounts.add(failing)
+    table = make_extractor(multicall_concurrency=4)._get_users_data(
+        chain.market_addresses, chain.user_addresses, 4
+    )
+
+    assert table[failing].markets_in is None
+    assert (
+        table[chain.user_addresses[4]].markets_in
+        == chain.assets_in[chain.user_addresses[4]]
+    )
+
+
+def test_extract_data_writes_every_borrower(chain, make_extractor, tmp_path):
+    output = tmp_path / "users.ndjson"
+    written = make_extractor(multicall_concurrency=4).extract_data(
+        str(output), state=ExtractionState()
+    )
+
+    users = [json.loads(line) for line in output.read_text().splitlines()]
+    assert written == len(users) == len(chain.user_addresses)
+    assert {u["user"] for u in users} == set(chain.user_addresses)
+    for user in users:
+        expected = sum(
+            chain.balances[(user["user"], m)] * chain.price(m) / 1e36
+            for m in chain.assets_in[user["user"]]
+        )
+        assert abs(user["collateral"] - expected) <= 1e-9 * expected
+
+
+def test_balance_multicalls_keep_the_batch_budget(chain, make_extractor):
+    make_extractor()._get_users_data(chain.market_addresses, chain.user_addresses, 4)
+
+    # Assets-in multicalls come first, one per batch of 4 users
+    balance_multicalls = chain.multicall_sizes[len(chain.user_addresses) // 4 :]
+    assert max(balance_multicalls) == 4 * len(chain.market_addresses)
+
+
+def test_exported_chunks_are_flushed(chain, make_extractor, tmp_path):
+    output = tmp_path / "users.ndjson"
+    extractor = make_extractor()
+    flushed = []
+    verify_block_hash = extractor._verify_block_hash
+
+    def count_flushed_users():
+        partial = output.with_name(output.name + ".partial")
+        flushed.append(len(partial.read_text().splitlines()))
+        verify_block_hash()
+
+    extractor._verify_block_hash = count_flushed_users
+    extractor.extract_data(str(output), state=ExtractionState())
+    assert flushed == [len(chain.user_addresses)]
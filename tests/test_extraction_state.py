@@ -0,0 +1,122 @@
+import json
+
+from src.borrower import BorrowerTable
+from src.data_extraction.extraction_state import ExtractionState
+
+
+def run(make_extractor, path, output):
+    state = ExtractionState.load(path)
+    make_extractor().extract_data(str(output), state=state)
+    return state
+
+
+def rescan(chain, make_extractor, path) -> ExtractionState:
+    state = ExtractionState.load(path)
+    extractor = make_extractor()
+    extractor._pin_block()
+    extractor._scan_users(state, chain.market_addresses)
+    return state
+
+
+def test_membership_changes_of_known_borrowers_are_refreshed(
+    chain, make_extractor, tmp_path
+):
+    path = tmp_path / "state.json"
+    run(make_extractor, path, tmp_path / "first.ndjson")
+    entering, exiting, minting = chain.user_addresses[:3]
+    new_market = next(
+        m for m in chain.market_addresses if m not in chain.assets_in[entering]
+    )
+    chain.enter_market(entering, new_market, chain.head + 1)
+    chain.exit_market(exiting, chain.assets_in[exiting][0], chain.head + 2)
+    chain.mint(minting, chain.assets_in[minting][0], chain.head + 3, 10**18)
+    chain.head += 100
+
+    state = rescan(chain, make_extractor, path)
+    assert set(state.pending_refresh.to_checksum_list()) == {
+        entering,
+        exiting,
+        minting,
+    }
+
+    output = tmp_path / "second.ndjson"
+    run(make_extractor, path, output)
+    users = {u["user"]: u for u in map(json.loads, output.read_text().splitlines())}
+    metadata = json.loads(output.with_suffix(".meta.json").read_text())
+    first_block = metadata["block"] - 100
+    assert metadata["oldestBlock"] == first_block
+    assert {user for user, u in users.items() if u["block"] != first_block} == {
+        entering,
+        exiting,
+        minting,
+    }
+    for user in (entering, exiting):
+        assert {m["market"] for m in users[user]["markets"]} == set(
+            chain.assets_in[user]
+        )
+
+
+def test_save_appends_changes_to_a_journal(tmp_path):
+    path = tmp_path / "state.json"
+    state = ExtractionState.load(path)
+    state.borrowers.add("0x" + "11" * 20)
+    state.pending_refresh.add("0x" + "11" * 20)
+    balances = BorrowerTable()
+    balances.add("0x" + "11" * 20, [], {}, {}, 5)
+    state.update_balances(balances)
+    state.last_scanned_block = 10
+    state.save()
+    assert path.exists() and not state.journal_path.exists()
+    base = path.read_bytes()
+
+    # Unchanged states are not written again
+    state.save()
+    assert not state.journal_path.exists()
+
+    state.borrowers.add("0x" + "22" * 20)
+    state.pending_refresh.discard("0x" + "11" * 20)
+    state.pending_refresh.add("0x" + "22" * 20)
+    state.last_scanned_block = 20
+    state.save()
+    assert path.read_bytes() == base
+    (entry,) = map(json.loads, state.journal_path.read_text().splitlines())
+    assert entry["borrowers"] == ["0x" + "22" * 20]
+    assert entry["pendingRemoved"] == ["0x" + "11" * 20]
+    assert entry["balances"] == {}
+
+    loaded = ExtractionState.load(path)
+    assert loaded.to_dict() == state.to_dict()
+
+
+def test_journal_is_folded_once_larger_than_the_state(tmp_path):
+    path = tmp_path / "state.json"
+    state = ExtractionState.load(path)
+    rewrites = 0
+    for i in range(1, 200):
+        state.borrowers.add("0x" + f"{i:040x}")
+        state.last_scanned_block = i
+        state.save()
+        if not state.journal_path.exists():
+            rewrites += 1
+        else:
+            assert state.journal_path.stat().st_size <= 2 * path.stat().st_size
+    # The state grows geometrically between rewrites, so they are few
+    assert rewrites < 20
+    assert ExtractionState.load(path).to_dict() == state.to_dict()
+
+
+def test_interrupted_journal_entry_is_dropped(tmp_path):
+    path = tmp_path / "state.json"
+    state = ExtractionState.load(path)
+    state.last_scanned_block = 1
+    state.save()
+    state.last_scanned_block = 2
+    state.save()
+    with state.journal_path.open("a") as f:
+        f.write('{"sequence": 3, "lastScanned')
+
+    loaded = ExtractionState.load(path)
+    assert loaded.last_scanned_block == 2
+    loaded.last_scanned_block = 3
+    loaded.save()
+    assert ExtractionState.load(path).last_scanned_block == 3
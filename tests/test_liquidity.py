@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from src.model.liquidity import LiquidityBook
+
+
+@pytest.fixture
+def book() -> LiquidityBook:
+    # Up depths are irrelevant to sales, so they are set far apart on purpose
+    return LiquidityBook(
+        exchanges=np.array(["Shallow", "Deep"]),
+        pairs=np.array(["ETH/USDT", "ETH/USDC"]),
+        up_depth=np.array([50e6, 1.0]),
+        down_depth=np.array([1e6, 3e6]),
+    )
+
+
+def test_sales_fill_the_deepest_venue_first(book):
+    np.testing.assert_allclose(
+        book.get_venue_sales([0.0, 2e6, 4e6, 5e6]),
+        # Shallow, Deep
+        [[0, 0], [0, 2e6], [1e6, 3e6], [1e6 + 0, 3e6 + 1e6]],
+    )
+
+
+def test_two_venue_slippage_by_hand(book):
+    # Sale sizes: 1e6 * 102 = 102e6 for Shallow and 306e6 for Deep
+    # 2e6 all goes to Deep: 1 / (1 + 2 * 2e6 / 306e6)
+    only_deep = 1 / (1 + 4e6 / 306e6)
+    # 5e6 fills both depths (4e6), then 1e6 more on Deep: Deep sells 4e6 at
+    # 1 / (1 + 8e6 / 306e6) and Shallow 1e6 at 1 / (1 + 2e6 / 102e6)
+    both = (4e6 / (1 + 8e6 / 306e6) + 1e6 / (1 + 2e6 / 102e6)) / 5e6
+
+    np.testing.assert_allclose(
+        book.get_slippage(np.array([0.0, 2e6, 5e6])), [1.0, only_deep, both]
+    )
+    assert only_deep == pytest.approx(0.987097, abs=1e-6)
+    assert both == pytest.approx(0.975772, abs=1e-6)
+
+
+def test_concentrated_routing_slips_more_than_an_even_split(book):
+    sales = np.linspace(1e5, 5e7, 50)
+    even_split = 1 / (1 + 2 * sales / book.sale_sizes.sum())
+    assert np.all(book.get_slippage(sales) < even_split)
+    assert np.all(np.diff(book.get_slippage(sales)) < 0)
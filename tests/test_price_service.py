@@ -0,0 +1,230 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter, sleep
+from typing import List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from src.price_service import PriceService, parse_retry_after
+
+ADDRESSES = ["0x" + f"{i:038x}" + suffix for i, suffix in enumerate(["01", "02", "03"])]
+UNPRICED = "0x" + "de" * 20
+
+
+class PriceApiServer:
+    """Local stand-in for the Krystal, Coingecko and Cryptocompare APIs.
+
+    Krystal prices tokens ending in 01 and Coingecko every other token but
+    UNPRICED. `throttled` requests to Coingecko token prices are answered 429
+    with `retry_after`. Request paths and query parameters are recorded.
+    """
+
+    def __init__(self):
+        self.delay = 0.0
+        self.throttled = 0
+        self.retry_after: Optional[str] = "0"
+        self.native_down = False
+        self.requests: List[tuple] = []
+        server = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                status, headers, body = server.answer(url.path, query)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), RequestHandler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self._lock = threading.Lock()
+        threading.Thread(
+            target=self._server.serve_forever, args=(0.05,), daemon=True
+        ).start()
+
+    def answer(self, path: str, query: dict):
+        with self._lock:
+            self.requests.append((path, query))
+            throttled = path.startswith("/cg/simple/token_price") and self.throttled
+            if throttled:
+                self.throttled -= 1
+        if self.delay:
+            sleep(self.delay)
+        if throttled:
+            headers = (
+                {} if self.retry_after is None else {"Retry-After": self.retry_after}
+            )
+            return 429, headers, {}
+        if path == "/kr/market":
+            addresses = query["addresses"].split(",")
+            market_data = [
+                {"address": a, "price": 2.0} for a in addresses if a.endswith("01")
+            ]
+            return 200, {}, {"marketData": market_data}
+        if path.startswith("/cg/simple/token_price"):
+            addresses = query["contract_addresses"].split(",")
+            return 200, {}, {a: {"usd": 1.5} for a in addresses if a != UNPRICED}
+        if path == "/cg/simple/price":
+            if self.native_down:
+                return 503, {}, {}
+            return 200, {}, {"ethereum": {"usd": 1500.0}}
+        if path == "/cc/price":
+            return 200, {}, {"USD": 1400.0}
+        return 404, {}, {}
+
+    def paths(self, prefix: str) -> List[str]:
+        return [path for path, _ in self.requests if path.startswith(prefix)]
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def api():
+    server = PriceApiServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def make_service(api):
+    def make(**kwargs) -> PriceService:
+        kwargs.setdefault("backoff", 0.01)
+        return PriceService(
+            coingecko_url=f"{api.url}/cg",
+            krystal_url=f"{api.url}/kr",
+            cryptocompare_url=f"{api.url}/cc",
+            **kwargs,
+        )
+
+    return make
+
+
+def test_token_prices_fall_back_from_krystal_to_coingecko(api, make_service):
+    prices = make_service().get_token_prices("ETH", ADDRESSES + [UNPRICED])
+
+    assert prices == {
+        ADDRESSES[0]: 2.0,
+        ADDRESSES[1]: 1.5,
+        ADDRESSES[2]: 1.5,
+        UNPRICED: 0.0,
+    }
+    coingecko = [q for p, q in api.requests if p.startswith("/cg/")]
+    assert coingecko == [
+        {
+            "contract_addresses": ",".join(ADDRESSES[1:] + [UNPRICED]),
+            "vs_currencies": "usd",
+        }
+    ]
+
+
+def test_token_prices_are_batched(api, make_service):
+    addresses = ["0x" + f"{i:040x}" for i in range(7)]
+    make_service(batch_size=3).get_token_prices("ETH", addresses)
+
+    assert [
+        len(q["addresses"].split(",")) for p, q in api.requests if p == "/kr/market"
+    ] == [3, 3, 1]
+
+
+def test_prices_are_cached_until_ttl(api, make_service):
+    service = make_service(ttl=0.3)
+    service.get_token_prices("ETH", ADDRESSES)
+    assert service.get_token_prices("ETH", ADDRESSES[::-1])[ADDRESSES[0]] == 2.0
+    assert len(api.paths("/kr/")) == 1
+
+    sleep(0.35)
+    service.get_token_prices("ETH", ADDRESSES)
+    assert len(api.paths("/kr/")) == 2
+
+
+def test_unpriced_tokens_are_not_cached(api, make_service):
+    service = make_service()
+    service.get_token_price("ETH", UNPRICED)
+    service.get_token_price("ETH", UNPRICED)
+    assert len(api.paths("/cg/")) == 2
+
+
+def test_concurrent_lookups_share_one_request(api, make_service):
+    api.delay = 0.1
+    service = make_service()
+    with ThreadPoolExecutor(8) as executor:
+        results = list(
+            executor.map(lambda _: service.get_token_prices("ETH", ADDRESSES), range(8))
+        )
+
+    assert all(result == results[0] for result in results)
+    assert len(api.paths("/kr/")) == 1
+    assert len(api.paths("/cg/")) == 1
+
+
+def test_throttled_requests_honor_retry_after(api, make_service):
+    api.throttled, api.retry_after = 2, "0.2"
+    start = perf_counter()
+    prices = make_service().get_token_prices("ETH", ADDRESSES[1:])
+
+    assert prices == {ADDRESSES[1]: 1.5, ADDRESSES[2]: 1.5}
+    assert len(api.paths("/cg/")) == 3
+    assert perf_counter() - start >= 0.4
+
+
+def test_throttled_requests_back_off_exponentially(api, make_service):
+    api.throttled, api.retry_after = 10, None
+    start = perf_counter()
+    prices = make_service(retries=4, backoff=0.05).get_token_prices(
+        "ETH", ADDRESSES[1:]
+    )
+
+    # Gives up after 4 attempts, having waited 0.05 + 0.1 + 0.2
+    assert prices == {ADDRESSES[1]: 0.0, ADDRESSES[2]: 0.0}
+    assert len(api.paths("/cg/")) == 4
+    assert perf_counter() - start >= 0.35
+
+
+def test_native_price_falls_back_to_cryptocompare(api, make_service):
+    service = make_service(retries=1)
+    api.native_down = True
+    assert service.get_native_price("ETH") == 1400.0
+    assert api.paths("/cc/") == ["/cc/price"]
+
+
+def test_snapshot_is_reloaded(api, make_service, tmp_path):
+    snapshot_path = tmp_path / "prices.json"
+    make_service(snapshot_path=snapshot_path).get_token_prices("ETH", ADDRESSES)
+    requests = len(api.requests)
+
+    prices = make_service(snapshot_path=snapshot_path).get_token_prices(
+        "ETH", ADDRESSES
+    )
+    assert prices == {ADDRESSES[0]: 2.0, ADDRESSES[1]: 1.5, ADDRESSES[2]: 1.5}
+    assert len(api.requests) == requests
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (None, None),
+        ("2", 2.0),
+        ("-1", 0.0),
+        ("Thu, 01 Jan 1970 00:00:00 GMT", 0.0),
+        ("soon", None),
+    ],
+)
+def test_parse_retry_after(value, expected):
+    assert parse_retry_after(value) == expected
@@ -0,0 +1,263 @@
+import threading
+from time import sleep
+from typing import List
+
+import pytest
+import requests
+from web3 import Web3
+
+from src.data_extraction.log_scanner import LogScanError, LogScanner, is_range_too_large
+from src.rpc import Endpoint, LoadBalancedProvider, NoEndpointAvailable
+from tests.stub_rpc import JsonRpcServer
+
+
+@pytest.fixture
+def make_nodes(chain):
+    servers: List[JsonRpcServer] = []
+
+    def make_nodes(n: int) -> List[JsonRpcServer]:
+        servers.extend(JsonRpcServer(chain) for _ in range(n))
+        return servers[-n:]
+
+    yield make_nodes
+    for server in servers:
+        server.close()
+
+
+def block_numbers(provider: LoadBalancedProvider, n: int):
+    w3 = Web3(provider)
+    for _ in range(n):
+        w3.eth.block_number
+
+
+def test_requests_follow_endpoint_weights(make_nodes):
+    heavy, light = make_nodes(2)
+    provider = LoadBalancedProvider([Endpoint(heavy.url, 2), Endpoint(light.url, 1)])
+    block_numbers(provider, 30)
+    assert (heavy.requests, light.requests) == (20, 10)
+
+
+def test_unhealthy_endpoint_fails_over_and_opens_its_circuit(make_nodes):
+    healthy, unhealthy = make_nodes(2)
+    unhealthy.status_code = 503
+    provider = LoadBalancedProvider(
+        [Endpoint(healthy.url), Endpoint(unhealthy.url)],
+        failure_threshold=2,
+        reset_timeout=60.0,
+    )
+    block_numbers(provider, 20)
+
+    assert unhealthy.requests == 2
+    assert healthy.requests == 20
+    metrics = provider.get_metrics()[unhealthy.url]
+    assert (metrics["errors"], metrics["circuitOpened"]) == (2, 1)
+
+
+def test_trial_request_closes_or_reopens_the_circuit(make_nodes):
+    healthy, flaky = make_nodes(2)
+    flaky.status_code = 503
+    provider = LoadBalancedProvider(
+        [Endpoint(healthy.url), Endpoint(flaky.url)],
+        failure_threshold=1,
+        reset_timeout=0.1,
+    )
+    block_numbers(provider, 4)
+    assert flaky.requests == 1
+
+    # Still failing: the single trial reopens the circuit
+    sleep(0.15)
+    block_numbers(provider, 4)
+    assert flaky.requests == 2
+
+    # Recovered: the trial closes it and traffic is shared again
+    flaky.status_code = None
+    sleep(0.15)
+    block_numbers(provider, 10)
+    assert flaky.requests == 2 + 5
+    metrics = provider.get_metrics()[flaky.url]
+    assert metrics["circuitOpened"] == 2
+
+
+def test_endpoints_on_one_host_keep_their_own_metrics(make_nodes):
+    (node,) = make_nodes(1)
+    host = node.url[len("http://") :]
+    endpoints = [
+        Endpoint(f"{node.url}/v3/{'a' * 32}", 2),
+        Endpoint(f"{node.url}/v3/{'b' * 32}"),
+        Endpoint(f"http://user:secret@{host}/eth?apikey=secret"),
+    ]
+    provider = LoadBalancedProvider(endpoints)
+    block_numbers(provider, 8)
+
+    metrics = provider.get_metrics()
+    assert {name: m["requests"] for name, m in metrics.items()} == {
+        f"{node.url}/v3/***#0": 4,
+        f"{node.url}/v3/***#1": 2,
+        f"{node.url}/eth?***": 2,
+    }
+    assert "secret" not in str(provider)
+
+
+def test_no_endpoint_available(make_nodes):
+    (node,) = make_nodes(1)
+    provider = LoadBalancedProvider([Endpoint(node.url, budget=3)])
+    block_numbers(provider, 3)
+    with pytest.raises(NoEndpointAvailable):
+        block_numbers(provider, 1)
+
+    node.status_code = 503
+    provider = LoadBalancedProvider([Endpoint(node.url)])
+    with pytest.raises(NoEndpointAvailable) as e:
+        block_numbers(provider, 1)
+    assert isinstance(e.value.__cause__, requests.exceptions.HTTPError)
+
+
+def test_json_rpc_errors_are_not_endpoint_failures(make_nodes):
+    (node,) = make_nodes(1)
+    provider = LoadBalancedProvider([Endpoint(node.url)], failure_threshold=1)
+    for _ in range(3):
+        assert provider.make_request("eth_unknown", [])["error"]["code"] == -32601
+    assert provider.get_metrics()[node.url]["errors"] == 0
+
+
+def test_read_timeouts_are_raised_without_failing_the_endpoint(make_nodes):
+    slow, other = make_nodes(2)
+    slow.delay = other.delay = 0.3
+    provider = LoadBalancedProvider(
+        [Endpoint(slow.url), Endpoint(other.url)], timeout=0.1, failure_threshold=1
+    )
+    with pytest.raises(requests.exceptions.ReadTimeout) as e:
+        block_numbers(provider, 1)
+
+    assert is_range_too_large(e.value)
+    # Not retried elsewhere, and no circuit opened
+    assert slow.requests + other.requests == 1
+    slow.delay = other.delay = 0.0
+    block_numbers(provider, 4)
+    assert (slow.requests, other.requests) == (3, 2)
+    assert all(m["errors"] == 0 for m in provider.get_metrics().values())
+
+
+@pytest.mark.parametrize(
+    "error, too_large",
+    [
+        (requests.exceptions.ReadTimeout("read timed out"), True),
+        (requests.exceptions.ConnectTimeout("connect timed out"), False),
+        (
+            ValueError(
+                {"code": -32005, "message": "query returned more than 10000 results"}
+            ),
+            True,
+        ),
+        (ValueError({"code": 3, "message": "execution reverted"}), False),
+    ],
+)
+def test_is_range_too_large_follows_causes(error, too_large):
+    assert is_range_too_large(error) == too_large
+    try:
+        raise NoEndpointAvailable("No RPC endpoint available") from error
+    except NoEndpointAvailable as wrapped:
+        assert is_range_too_large(wrapped) == too_large
+
+
+def scan(scanner: LogScanner, from_block: int, to_block: int) -> List[tuple]:
+    ranges = [(start, end) for start, end, _ in scanner.scan(from_block, to_block)]
+    assert [start for start, _ in ranges] == [from_block] + [
+        end + 1 for _, end in ranges[:-1]
+    ]
+    assert ranges[-1][1] == to_block
+    return ranges
+
+
+def test_log_scanner_splits_ranges_that_are_too_large(chain, w3):
+    chain.max_logs = 10
+
+    def get_logs(from_block: int, to_block: int):
+        return w3.eth.get_logs(
+            {"address": chain.comptroller, "fromBlock": from_block, "toBlock": to_block}
+        )
+
+    scanner = LogScanner(get_logs, initial_step=chain.head, max_workers=2)
+    logs = [
+        log for _, _, range_logs in scanner.scan(0, chain.head) for log in range_logs
+    ]
+    entered = [log for log in chain.logs if log.event == "MarketEntered"]
+    assert len(logs) == len(entered)
+    assert scanner.step < chain.head
+
+
+def test_log_scanner_splits_ranges_that_time_out():
+    def get_logs(from_block: int, to_block: int):
+        if to_block - from_block + 1 > 100:
+            raise requests.exceptions.ReadTimeout("read timed out")
+        return []
+
+    scanner = LogScanner(get_logs, initial_step=1000, max_workers=2)
+    ranges = scan(scanner, 0, 999)
+    assert max(end - start + 1 for start, end in ranges) <= 100
+
+
+def test_log_scanner_retries_failed_ranges():
+    attempts = {}
+    lock = threading.Lock()
+
+    def get_logs(from_block: int, to_block: int):
+        with lock:
+            attempts[from_block] = attempts.get(from_block, 0) + 1
+            if from_block == 200 and attempts[from_block] <= 2:
+                raise ValueError({"code": -32000, "message": "header not found"})
+        return []
+
+    scanner = LogScanner(get_logs, initial_step=100, sparse_results=0, retry_wait=0.01)
+    scan(scanner, 0, 499)
+    assert attempts[200] == 3
+
+
+def test_log_scanner_reports_ranges_that_keep_failing():
+    def get_logs(from_block: int, to_block: int):
+        if from_block == 200:
+            raise ValueError({"code": -32000, "message": "header not found"})
+        return []
+
+    scanner = LogScanner(
+        get_logs, initial_step=100, sparse_results=0, max_retries=3, retry_wait=0.01
+    )
+    with pytest.raises(LogScanError) as e:
+        list(scanner.scan(0, 499))
+    assert e.value.failed_ranges == [(200, 299)]
+
+
+def test_log_scanner_stops_once_a_range_keeps_failing():
+    fetched = []
+
+    def get_logs(from_block: int, to_block: int):
+        fetched.append(from_block)
+        if from_block == 200:
+            raise ValueError({"code": -32000, "message": "header not found"})
+        return []
+
+    scanner = LogScanner(get_logs, initial_step=100, sparse_results=0, max_retries=1)
+    emitted = []
+    with pytest.raises(LogScanError):
+        for start, end, _ in scanner.scan(0, 99_999):
+            emitted.append((start, end))
+
+    # Ranges before the failure are still yielded; at most the ranges that
+    # were in flight are fetched past it, not the other thousand
+    assert emitted == [(0, 99), (100, 199)]
+    assert len(fetched) < 20
+
+
+def test_multicalls_fail_over_to_healthy_nodes(chain, make_nodes, make_extractor):
+    healthy, unhealthy = make_nodes(2)
+    unhealthy.status_code = 502
+    w3 = Web3(
+        LoadBalancedProvider(
+            [Endpoint(unhealthy.url), Endpoint(healthy.url)], reset_timeout=60.0
+        )
+    )
+    extractor = make_extractor()
+    extractor.w3 = w3
+    users = extractor._get_users_data(chain.market_addresses, chain.user_addresses, 4)
+    assert set(users) == set(chain.user_addresses)
+    assert unhealthy.requests == 3
@@ -0,0 +1,120 @@
+import os
+from time import sleep
+
+import pytest
+from web3 import HTTPProvider, Web3
+
+from src.data_extraction.codec import SELECTORS, encode_address_call
+from src.rpc_cache import (
+    CacheMissError,
+    ResponseCache,
+    construct_response_cache_middleware,
+)
+
+MAX_BYTES = 400_000
+
+
+def value(i: int) -> str:
+    # Incompressible, about 10 kB once stored
+    return os.urandom(10_000).hex() + str(i)
+
+
+def test_hits_misses_and_expiry(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite")
+    key = ResponseCache.key("eth", "eth_chainId", [])
+    assert cache.get(key) is None
+
+    cache.put(key, "0x1")
+    assert cache.get(key) == "0x1"
+    cache.put(key, "0x2", ttl=0.05)
+    sleep(0.1)
+    assert cache.get(key) is None
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 2)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite", max_bytes=MAX_BYTES)
+    keys = [ResponseCache.key("eth", "eth_call", [i]) for i in range(80)]
+    for i, key in enumerate(keys):
+        cache.put(key, value(i))
+        # The first entry keeps being read, so it is never the oldest
+        assert cache.get(keys[0]) is not None
+        assert cache.stats()["bytes"] <= MAX_BYTES
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[-1]) is not None
+
+
+def test_size_accounts_for_every_process(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    # Separate connections, like separate processes sharing the file
+    caches = [ResponseCache(path, max_bytes=MAX_BYTES) for _ in range(2)]
+    for i in range(80):
+        caches[i % 2].put(ResponseCache.key("eth", "eth_call", [i]), value(i))
+
+    assert caches[0].stats()["bytes"] <= MAX_BYTES
+    assert ResponseCache(path).stats()["bytes"] <= MAX_BYTES
+
+
+def make_w3(url: str, cache: ResponseCache, mode: str, **kwargs) -> Web3:
+    w3 = Web3(HTTPProvider(url))
+    w3.middleware_onion.inject(
+        construct_response_cache_middleware(cache, "eth", mode, **kwargs), layer=0
+    )
+    return w3
+
+
+def get_markets(w3: Web3, comptroller: str, block) -> bytes:
+    return bytes(
+        w3.eth.call({"to": comptroller, "data": SELECTORS["getAllMarkets"]}, block)
+    )
+
+
+def test_calls_at_a_fixed_block_are_cached(chain, node, tmp_path):
+    w3 = make_w3(node.url, ResponseCache(tmp_path / "cache.sqlite"), "cache")
+    for _ in range(3):
+        get_markets(w3, chain.comptroller, 1_000)
+    assert chain.eth_calls == 1
+
+    # Not pinned, but getAllMarkets is cached for latest_ttl
+    for _ in range(3):
+        get_markets(w3, chain.comptroller, "latest")
+    assert chain.eth_calls == 2
+
+
+def test_calls_near_the_head_are_not_cached(chain, node, tmp_path):
+    w3 = make_w3(node.url, ResponseCache(tmp_path / "cache.sqlite"), "cache")
+    call = {
+        "to": chain.comptroller,
+        "data": encode_address_call("getAssetsIn", chain.user_addresses[0]),
+    }
+    # Ten blocks behind, like a pinned extraction run: it could still be reorged
+    for _ in range(2):
+        w3.eth.call(call, chain.head - 10)
+    assert chain.eth_calls == 2
+
+    for _ in range(2):
+        w3.eth.call(call, chain.head - 64)
+    assert chain.eth_calls == 3
+
+
+def test_record_then_replay_offline(chain, node, tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite")
+    recorded = make_w3(node.url, cache, "record", latest_ttl=0.05)
+    expected = (
+        recorded.eth.block_number,
+        get_markets(recorded, chain.comptroller, 1),
+        get_markets(recorded, chain.comptroller, "latest"),
+    )
+    # Expired entries of the recorded run are still replayed
+    sleep(0.1)
+
+    # Nothing listens on the discard port: every answer must come from the cache
+    replayed = make_w3("http://127.0.0.1:9", cache, "replay")
+    assert (
+        replayed.eth.block_number,
+        get_markets(replayed, chain.comptroller, 1),
+        get_markets(replayed, chain.comptroller, "latest"),
+    ) == expected
+    with pytest.raises(CacheMissError):
+        get_markets(replayed, chain.comptroller, 2)
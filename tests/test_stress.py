@@ -0,0 +1,28 @@
+import numpy as np
+
+from src.model.cascade import CascadeIndex
+from src.model.stress import StressConfig, run_stress
+
+
+def test_bands_do_not_depend_on_workers():
+    rng = np.random.default_rng(0)
+    index = CascadeIndex.from_positions(
+        rng.uniform(0, 1, 2_000), rng.lognormal(8, 2, 2_000)
+    )
+    shocks = np.linspace(0, 1, 50)
+    depths = rng.lognormal(19, 1, 20)
+    # Not a multiple of the batch size, so the last batch is a short one
+    config = StressConfig(scenarios=150, seed=7, batch_size=32)
+
+    sequential = run_stress(index, shocks, depths, config, workers=1)
+    parallel = run_stress(index, shocks, depths, config, workers=3)
+    assert sequential.keys() == parallel.keys()
+    for name, band in sequential.items():
+        np.testing.assert_array_equal(band, parallel[name])
+
+    reseeded = run_stress(
+        index, shocks, depths, StressConfig(scenarios=150, seed=8, batch_size=32)
+    )
+    assert not np.array_equal(
+        reseeded["equilibrium_price_p50"], sequential["equilibrium_price_p50"]
+    )